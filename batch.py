@@ -0,0 +1,106 @@
+from os import getenv
+from sys import argv
+
+from dotenv import load_dotenv
+from google.genai import Client
+from openai import OpenAI
+
+from lib.analytics import LLMAnalytics
+from lib.batch import BatchRunner, load_batch_jobs
+from lib.cache import (
+    CachedLLMModel,
+    DiskCache,
+    MemoryCache,
+    TieredCache,
+    cached_crawler,
+)
+from lib.config import (
+    DeepResearchBatchParameters,
+    DeepResearchConcurrencyParameters,
+    DeepResearchTokenBudgetParameters,
+)
+from lib.constants import LLMIdentifier
+from lib.crawlers import GeminiSearchCrawler
+from lib.dedup import QueryRegistry
+from lib.llm import OpenAICompatibleLLMModel
+from lib.log import setup_logging
+from lib.metrics import MetricsServer, ResearchMetrics
+from lib.tracing import ResearchTracer
+from lib.types import ModelProvider
+
+
+def main():
+    # Debug records are written by a background thread, capped per record
+    # and rotated at 50 MB
+    setup_logging(
+        asynchronous=True,
+        max_message_chars=4_000,
+        max_bytes=50 * 2**20,
+        backup_count=5,
+    )
+    load_dotenv(".env.local")
+
+    # Clients and caches are created once and shared by every job
+    cache_analytics = LLMAnalytics()
+    metrics_instance = ResearchMetrics()
+    runner = BatchRunner(
+        crawler=cached_crawler(
+            GeminiSearchCrawler(
+                llm_identifier=LLMIdentifier.GEMINI_2_0_FLASH,
+                llm_instance=Client(api_key=getenv("GEMINI_API_KEY")),
+            ),
+            cache=TieredCache(
+                memory_cache=MemoryCache(),
+                disk_cache=DiskCache("./assets/cache/search.sqlite3"),
+            ),
+            analytics_instance=cache_analytics,
+        ),
+        llm_model=CachedLLMModel(
+            OpenAICompatibleLLMModel(
+                llm_identifier=LLMIdentifier.GPT_4O, llm_instance=OpenAI()
+            ),
+            cache=DiskCache("./assets/cache/llm.sqlite3"),
+            analytics_instance=cache_analytics,
+        ),
+        output_dir="./assets/batch",
+        concurrency_parameters=DeepResearchConcurrencyParameters(
+            max_workers=16,
+            max_in_flight_per_provider={
+                ModelProvider.OPENAI: 8,
+                ModelProvider.GOOGLE: 8,
+            },
+        ),
+        max_concurrent_jobs=4,
+        token_budget_parameters=DeepResearchTokenBudgetParameters(
+            context_window_fraction=0.5
+        ),
+        report_mode="hierarchical",
+        query_registry_factory=lambda: QueryRegistry(similarity_threshold=0.6),
+        # Provider batch APIs are slower but billed at a discount
+        batch_parameters=(
+            DeepResearchBatchParameters() if "--provider-batch" in argv else None
+        ),
+        metrics_instance=metrics_instance,
+        # Each job is its own trace
+        tracer=(
+            ResearchTracer("./assets/batch/trace.jsonl")
+            if "--trace" in argv
+            else None
+        ),
+    )
+
+    # Long batches can be scraped while they run
+    metrics_port = getenv("METRICS_PORT")
+    if metrics_port:
+        MetricsServer(metrics_instance, port=int(metrics_port)).start()
+
+    arguments = [
+        argument for argument in argv[1:] if not argument.startswith("--")
+    ]
+    jobs_path = arguments[0] if arguments else "./assets/queries.jsonl"
+    runner(load_batch_jobs(jobs_path))
+    metrics_instance.write_json("./assets/batch/metrics.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+from json import dumps, loads
+from os import cpu_count, makedirs, path
+from platform import platform, python_version
+from subprocess import CalledProcessError, check_output
+
+
+def git_revision() -> dict:
+    try:
+        commit = check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+        dirty = bool(
+            check_output(["git", "status", "--porcelain"], text=True).strip()
+        )
+    except (CalledProcessError, FileNotFoundError):
+        return {"commit": None, "dirty": None}
+
+    return {"commit": commit, "dirty": dirty}
+
+
+# Saved per commit, so that runs can be compared across commits
+def write_report(
+    output_dir: str, benchmark: str, results: list[dict], **details
+) -> str:
+    revision = git_revision()
+    report = {
+        "benchmark": benchmark,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "revision": revision,
+        "environment": {
+            "python": python_version(),
+            "platform": platform(),
+            "cpu_count": cpu_count(),
+        },
+        **details,
+        "results": results,
+    }
+
+    makedirs(output_dir, exist_ok=True)
+    output_path = path.join(
+        output_dir,
+        f"{benchmark}_{(revision['commit'] or 'unknown')[:12]}"
+        f"{'-dirty' if revision['dirty'] else ''}.json",
+    )
+    with open(output_path, "w", encoding="utf-8") as file_handle:
+        file_handle.write(dumps(report, indent=2))
+
+    return output_path
+
+
+def compare_reports(
+    baseline_path: str, candidate_path: str, metrics: tuple[str, ...]
+) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as file_handle:
+        baseline = loads(file_handle.read())
+    with open(candidate_path, "r", encoding="utf-8") as file_handle:
+        candidate = loads(file_handle.read())
+
+    baseline_results = {
+        result["case_id"]: result for result in baseline["results"]
+    }
+    print(f"{'Case':<28} " + " ".join(f"{metric:>22}" for metric in metrics))
+    for result in candidate["results"]:
+        baseline_result = baseline_results.get(result["case_id"])
+        if baseline_result is None:
+            continue
+
+        ratios = [
+            result[metric] / baseline_result[metric]
+            if baseline_result[metric]
+            else float("nan")
+            for metric in metrics
+        ]
+        print(
+            f"{result['case_id']:<28} "
+            + " ".join(f"{ratio:>21.2f}x" for ratio in ratios)
+        )
@@ -0,0 +1,311 @@
+from argparse import ArgumentParser
+from asyncio import run as asyncio_run
+from copy import copy
+from dataclasses import asdict, dataclass
+from statistics import median
+from time import perf_counter, process_time
+from tracemalloc import get_traced_memory, start, stop
+from typing import Literal, Optional
+
+from benchmarks.common import compare_reports, write_report
+from lib.analytics import LLMAnalytics
+from lib.config import (
+    DeepResearchConcurrencyParameters,
+    DeepResearchHyperParameters,
+    FakeProviderParameters,
+    LLMHedgingParameters,
+)
+from lib.fakes import FakeCrawler, FakeLLMModel
+from lib.hedging import HedgedLLMModel
+from lib.log import setup_logging
+from lib.researcher import DeepResearcher
+from lib.types import ModelProvider
+
+USER_QUERY = "Assess the commercial outlook for solid-state batteries."
+ExecutionMode = Literal["sequential", "concurrent", "async"]
+COMPARED_METRICS = (
+    "wall_time_s",
+    "calls_per_s",
+    "cpu_time_per_node_ms",
+    "peak_memory_bytes",
+)
+
+
+@dataclass
+class BenchmarkCase:
+    learning_width: int
+    learning_depth: int
+    execution_mode: ExecutionMode
+    # Worker threads (concurrent) or in-flight calls per provider (async)
+    concurrency: Optional[int] = None
+
+    @property
+    def case_id(self) -> str:
+        case_id = (
+            f"w{self.learning_width}-d{self.learning_depth}-"
+            f"{self.execution_mode}"
+        )
+        return f"{case_id}-{self.concurrency}" if self.concurrency else case_id
+
+
+@dataclass
+class BenchmarkResult:
+    case_id: str
+    case: dict
+    repeats: int
+    failed_runs: int
+    nodes: int
+    calls: int
+    wall_time_s: float
+    calls_per_s: float
+    cpu_time_per_node_ms: float
+    peak_memory_bytes: int
+    errors: list[str]
+
+
+def benchmark_grid(
+    widths: list[int], depths: list[int], concurrencies: list[int]
+) -> list[BenchmarkCase]:
+    cases = []
+    for width in widths:
+        for depth in depths:
+            # Deeper trees are capped by `DeepResearchHyperParameters`
+            max_allowed_depth = DeepResearchHyperParameters(
+                0, 0, width, 1
+            ).max_allowed_depth
+            if depth > max_allowed_depth:
+                continue
+
+            cases.append(BenchmarkCase(width, depth, "sequential"))
+            for concurrency in concurrencies:
+                cases.extend([
+                    BenchmarkCase(width, depth, "concurrent", concurrency),
+                    BenchmarkCase(width, depth, "async", concurrency),
+                ])
+
+    return cases
+
+
+def run_case(
+    case: BenchmarkCase,
+    provider_parameters: FakeProviderParameters,
+    hedging_parameters: Optional[LLMHedgingParameters] = None,
+) -> tuple[int, int]:
+    analytics_instance = LLMAnalytics()
+    llm_model = FakeLLMModel(provider_parameters)
+    crawler = FakeCrawler(provider_parameters)
+    if hedging_parameters:
+        # Fake latencies are seeded per prompt, so a backup to the same fake
+        # would be exactly as slow as the primary
+        backup_parameters = copy(provider_parameters)
+        backup_parameters.seed = provider_parameters.seed + 1
+        llm_model = HedgedLLMModel(
+            llm_model,
+            hedging_parameters=hedging_parameters,
+            backup_llm_model=FakeLLMModel(backup_parameters),
+            analytics_instance=analytics_instance,
+        )
+
+    concurrency_parameters = None
+    if case.execution_mode == "concurrent":
+        concurrency_parameters = DeepResearchConcurrencyParameters(
+            max_workers=case.concurrency
+        )
+    elif case.execution_mode == "async":
+        concurrency_parameters = DeepResearchConcurrencyParameters(
+            max_in_flight_per_provider={
+                ModelProvider.OPENAI: case.concurrency,
+                type(crawler).__name__: case.concurrency,
+            }
+        )
+
+    researcher = DeepResearcher(
+        crawler=crawler,
+        llm_model=llm_model,
+        research_parameters=DeepResearchHyperParameters(
+            num_refinement_questions=3,
+            num_learnings=3,
+            learning_width=case.learning_width,
+            learning_depth=case.learning_depth,
+        ),
+        analytics_instance=analytics_instance,
+        concurrency_parameters=concurrency_parameters,
+    )
+
+    if case.execution_mode == "async":
+        asyncio_run(
+            researcher.acall(user_query=USER_QUERY, auto_query_refinement=True)
+        )
+    else:
+        researcher(user_query=USER_QUERY, auto_query_refinement=True)
+
+    return analytics_instance.search_calls, analytics_instance.total_calls
+
+
+def benchmark_case(
+    case: BenchmarkCase,
+    provider_parameters: FakeProviderParameters,
+    repeats: int,
+    hedging_parameters: Optional[LLMHedgingParameters] = None,
+) -> BenchmarkResult:
+    wall_times_s, cpu_times_s, errors = [], [], []
+    nodes = calls = 0
+
+    for repeat in range(repeats):
+        start_time_s, start_cpu_time_s = perf_counter(), process_time()
+        try:
+            nodes, calls = run_case(
+                case,
+                _repeat_parameters(provider_parameters, repeat),
+                hedging_parameters,
+            )
+        except Exception as error:
+            errors.append(repr(error))
+            continue
+
+        wall_times_s.append(perf_counter() - start_time_s)
+        cpu_times_s.append(process_time() - start_cpu_time_s)
+
+    # Measured in a separate run, since tracing allocations slows the
+    # timed runs down
+    start()
+    try:
+        run_case(case, provider_parameters, hedging_parameters)
+    except Exception as error:
+        errors.append(repr(error))
+    finally:
+        _, peak_memory_bytes = get_traced_memory()
+        stop()
+
+    wall_time_s = median(wall_times_s) if wall_times_s else 0.0
+    return BenchmarkResult(
+        case_id=case.case_id,
+        case=asdict(case),
+        repeats=repeats,
+        failed_runs=repeats - len(wall_times_s),
+        nodes=nodes,
+        calls=calls,
+        wall_time_s=wall_time_s,
+        calls_per_s=calls / wall_time_s if wall_time_s else 0.0,
+        cpu_time_per_node_ms=(
+            median(cpu_times_s) / nodes * 1000
+            if cpu_times_s and nodes
+            else 0.0
+        ),
+        peak_memory_bytes=peak_memory_bytes,
+        errors=errors,
+    )
+
+
+def _repeat_parameters(
+    provider_parameters: FakeProviderParameters, repeat: int
+) -> FakeProviderParameters:
+    # Fake providers are deterministic per seed, so each repeat gets its own
+    # latencies and failures
+    repeat_parameters = copy(provider_parameters)
+    repeat_parameters.seed = provider_parameters.seed + repeat
+    return repeat_parameters
+
+
+def main():
+    parser = ArgumentParser(
+        description="Orchestration benchmark on in-process fake providers"
+    )
+    parser.add_argument("--widths", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--depths", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[4, 16]
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--latency-distribution",
+        choices=["constant", "uniform", "lognormal"],
+        default="lognormal",
+    )
+    parser.add_argument("--mean-latency-s", type=float, default=0.02)
+    parser.add_argument("--latency-spread", type=float, default=0.5)
+    parser.add_argument("--payload-chars", type=int, default=2_000)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        default=None,
+        help="Wrap the LLM in HedgedLLMModel at this latency percentile",
+    )
+    parser.add_argument("--output-dir", default="./assets/benchmarks")
+    parser.add_argument("--log-level", default="WARNING")
+    # Measures the cost of DEBUG file logging on the research loop
+    parser.add_argument("--log-dir", default=None)
+    parser.add_argument("--async-logging", action="store_true")
+    parser.add_argument("--max-message-chars", type=int, default=None)
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASELINE", "CANDIDATE"),
+        help="Print the ratios of two saved results and exit",
+    )
+    arguments = parser.parse_args()
+
+    if arguments.compare:
+        compare_reports(*arguments.compare, metrics=COMPARED_METRICS)
+        return
+
+    # Per-call INFO logs would dominate the orchestration being measured
+    setup_logging(
+        log_dir=arguments.log_dir,
+        console_level=arguments.log_level.upper(),
+        asynchronous=arguments.async_logging,
+        max_message_chars=arguments.max_message_chars,
+    )
+
+    provider_parameters = FakeProviderParameters(
+        latency_distribution=arguments.latency_distribution,
+        mean_latency_s=arguments.mean_latency_s,
+        latency_spread=arguments.latency_spread,
+        payload_chars=arguments.payload_chars,
+        completion_tokens=arguments.completion_tokens,
+        failure_rate=arguments.failure_rate,
+        seed=arguments.seed,
+    )
+
+    hedging_parameters = (
+        LLMHedgingParameters(
+            percentile=arguments.hedge_percentile, min_delay_s=0.0
+        )
+        if arguments.hedge_percentile
+        else None
+    )
+
+    results = []
+    for case in benchmark_grid(
+        arguments.widths, arguments.depths, arguments.concurrency
+    ):
+        result = benchmark_case(
+            case, provider_parameters, arguments.repeats, hedging_parameters
+        )
+        results.append(result)
+        print(
+            f"{result.case_id:<28} {result.wall_time_s:>8.3f} s "
+            f"{result.calls_per_s:>9.1f} calls/s "
+            f"{result.cpu_time_per_node_ms:>8.2f} ms CPU/node "
+            f"{result.peak_memory_bytes / 2**20:>8.2f} MiB "
+            f"({result.failed_runs} failed)"
+        )
+
+    output_path = write_report(
+        arguments.output_dir,
+        "orchestration",
+        [asdict(result) for result in results],
+        provider_parameters=vars(provider_parameters),
+        hedging_parameters=(
+            vars(hedging_parameters) if hedging_parameters else None
+        ),
+        repeats=arguments.repeats,
+    )
+    print(f"Saved: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass
+from json import loads
+from os import environ, listdir, path, pathsep
+from statistics import median
+from subprocess import run
+from sys import executable, exit
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Optional
+
+from benchmarks.common import compare_reports, write_report
+
+REPOSITORY_ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+DEFAULT_MODULES = (
+    "lib",
+    "lib.researcher",
+    "lib.batch",
+    "lib.cache",
+    "lib.llm",
+    "lib.crawlers",
+    "lib.analytics",
+    "lib.fakes",
+)
+# Loaded by the plugins that use them, never by importing `lib`
+SDK_MODULES = ("openai", "google.genai", "requests", "httpx")
+COMPARED_METRICS = ("import_ms", "process_ms")
+CHILD_SCRIPT = """
+from json import dumps
+from sys import modules
+from time import perf_counter
+
+start_time_s = perf_counter()
+import {module}
+import_s = perf_counter() - start_time_s
+
+print(dumps({{"import_s": import_s, "modules": sorted(modules)}}))
+"""
+
+
+@dataclass
+class StartupResult:
+    case_id: str
+    repeats: int
+    import_ms: float
+    process_ms: float
+    sdk_modules: list[str]
+    files_created: list[str]
+    error: Optional[str] = None
+
+
+def benchmark_module(module: str, repeats: int) -> StartupResult:
+    import_times_s, process_times_s = [], []
+    sdk_modules, error = set(), None
+
+    # A fresh working directory per module shows whether importing it
+    # writes anything (e.g. log files) relative to the current directory
+    with TemporaryDirectory() as working_dir:
+        for _ in range(repeats):
+            start_time_s = perf_counter()
+            completed_process = run(
+                [executable, "-c", CHILD_SCRIPT.format(module=module)],
+                cwd=working_dir,
+                env={
+                    **environ,
+                    "PYTHONPATH": pathsep.join(
+                        filter(
+                            None, (REPOSITORY_ROOT, environ.get("PYTHONPATH"))
+                        )
+                    ),
+                },
+                capture_output=True,
+                text=True,
+            )
+            if completed_process.returncode != 0:
+                error = completed_process.stderr.strip().splitlines()[-1]
+                break
+
+            process_times_s.append(perf_counter() - start_time_s)
+
+            child_result = loads(completed_process.stdout.splitlines()[-1])
+            import_times_s.append(child_result["import_s"])
+            sdk_modules.update(
+                sdk_module
+                for sdk_module in SDK_MODULES
+                if sdk_module in child_result["modules"]
+            )
+
+        files_created = sorted(listdir(working_dir))
+
+    return StartupResult(
+        case_id=module,
+        repeats=repeats,
+        import_ms=median(import_times_s) * 1000 if import_times_s else 0.0,
+        process_ms=median(process_times_s) * 1000 if process_times_s else 0.0,
+        sdk_modules=sorted(sdk_modules),
+        files_created=files_created,
+        error=error,
+    )
+
+
+def regressions(
+    result: StartupResult, max_import_ms: Optional[float]
+) -> list[str]:
+    messages = []
+    if result.error is not None:
+        messages.append(f"{result.case_id} fails to import: {result.error}")
+    if result.sdk_modules:
+        messages.append(
+            f"{result.case_id} imports {', '.join(result.sdk_modules)}"
+        )
+    if result.files_created:
+        messages.append(
+            f"{result.case_id} creates {', '.join(result.files_created)}"
+        )
+    if max_import_ms is not None and result.import_ms > max_import_ms:
+        messages.append(
+            f"{result.case_id} takes {result.import_ms:.1f} ms to import "
+            f"(limit: {max_import_ms:.1f} ms)"
+        )
+
+    return messages
+
+
+def main():
+    parser = ArgumentParser(
+        description="Import time and side effects of the `lib` modules"
+    )
+    parser.add_argument(
+        "--modules", nargs="+", default=list(DEFAULT_MODULES)
+    )
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        default=None,
+        help="Fail if the median import of any module takes longer",
+    )
+    parser.add_argument("--output-dir", default="./assets/benchmarks")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASELINE", "CANDIDATE"),
+        help="Print the ratios of two saved results and exit",
+    )
+    arguments = parser.parse_args()
+
+    if arguments.compare:
+        compare_reports(*arguments.compare, metrics=COMPARED_METRICS)
+        return
+
+    results, messages = [], []
+    for module in arguments.modules:
+        result = benchmark_module(module, arguments.repeats)
+        results.append(result)
+        messages.extend(regressions(result, arguments.max_import_ms))
+        print(
+            f"{result.case_id:<28} {result.import_ms:>8.1f} ms import "
+            f"{result.process_ms:>8.1f} ms process"
+        )
+
+    output_path = write_report(
+        arguments.output_dir,
+        "startup",
+        [asdict(result) for result in results],
+        repeats=arguments.repeats,
+    )
+    print(f"Saved: {output_path}")
+
+    for message in messages:
+        print(f"Regression: {message}")
+    if messages:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,108 @@
-from abc import ABC, abstractmethod
-from typing import Literal, Optional
+from __future__ import annotations
 
-from google.genai.types import GenerateContentResponseUsageMetadata
-from openai.types import CompletionUsage
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import TYPE_CHECKING, Literal, Optional
 
 from lib.constants import LLMIdentifier
 from lib.log import logger
-from lib.types import UsageDescription
+from lib.sdk import is_gemini_usage, is_openai_usage
+from lib.types import (
+    BatchUsage,
+    CacheHitUsage,
+    ResearchStage,
+    TokenUsage,
+    UsageDescription,
+)
+
+if TYPE_CHECKING:
+    from google.genai.types import GenerateContentResponseUsageMetadata
+    from openai.types import CompletionUsage
+
+
+def to_token_usage(
+    usage_stats: CompletionUsage
+    | GenerateContentResponseUsageMetadata
+    | CacheHitUsage
+    | BatchUsage
+    | TokenUsage
+    | None,
+) -> TokenUsage:
+    if isinstance(usage_stats, TokenUsage):
+        return usage_stats
+
+    if isinstance(usage_stats, BatchUsage):
+        return usage_stats.usage
+
+    if is_openai_usage(usage_stats):
+        return TokenUsage(
+            input_tokens=usage_stats.prompt_tokens,
+            cached_input_tokens=(
+                usage_stats.prompt_tokens_details.cached_tokens
+                if usage_stats.prompt_tokens_details
+                else 0
+            )
+            or 0,
+            completion_tokens=usage_stats.completion_tokens,
+        )
+
+    if is_gemini_usage(usage_stats):
+        return TokenUsage(
+            input_tokens=usage_stats.prompt_token_count or 0,
+            cached_input_tokens=usage_stats.cached_content_token_count or 0,
+            completion_tokens=usage_stats.candidates_token_count or 0,
+        )
+
+    # Cache hits and non-LLM crawlers are never billed
+    return TokenUsage(input_tokens=0, cached_input_tokens=0, completion_tokens=0)
+
+
+def sum_token_usage(usages: list[TokenUsage]) -> TokenUsage:
+    return TokenUsage(
+        input_tokens=sum(usage.input_tokens for usage in usages),
+        cached_input_tokens=sum(usage.cached_input_tokens for usage in usages),
+        completion_tokens=sum(usage.completion_tokens for usage in usages),
+    )
+
+
+def usage_cost(
+    llm_model: LLMIdentifier,
+    usage_stats: CompletionUsage
+    | GenerateContentResponseUsageMetadata
+    | CacheHitUsage
+    | BatchUsage
+    | TokenUsage
+    | None,
+) -> float:
+    token_usage = to_token_usage(usage_stats)
+    cost = (
+        (token_usage.input_tokens - token_usage.cached_input_tokens)
+        / 1_000_000
+        * llm_model.value.cpm_non_cached_input_tokens_dollars
+        + token_usage.cached_input_tokens
+        / 1_000_000
+        * llm_model.value.cpm_cached_input_tokens_dollars
+        + token_usage.completion_tokens
+        / 1_000_000
+        * llm_model.value.cpm_completion_tokens_dollars
+    )
+    if isinstance(usage_stats, BatchUsage):
+        cost *= llm_model.value.batch_cost_multiplier
+
+    return cost
+
+
+def search_call_cost(
+    llm_model: LLMIdentifier,
+    search_context_size: Optional[Literal["low", "medium", "high"]],
+) -> float:
+    if not search_context_size or llm_model.value.search_cost is None:
+        return 0.0
+
+    return (
+        getattr(llm_model.value.search_cost, f"cpt_{search_context_size}")
+        / 1_000
+    )
 
 
 # XXX: Only for LLM-based Crawlers
@@ -19,111 +115,436 @@ class Analytics(ABC):
         self.total_cached_input_tokens: int = 0
         self.total_completion_tokens: int = 0
 
+        # Included in the totals above; billed at the batch API discount
+        self.batch_calls: int = 0
+        self.total_batch_input_tokens: int = 0
+        self.total_batch_cached_input_tokens: int = 0
+        self.total_batch_completion_tokens: int = 0
+
+        self.cache_hit_calls: int = 0
+        self.total_cache_saved_input_tokens: int = 0
+        self.total_cache_saved_completion_tokens: int = 0
+        self.cache_hits: dict[str, int] = {}
+        self.cache_misses: dict[str, int] = {}
+
+        # Provider usage per research stage (keyed by `ResearchStage` value)
+        self.stage_calls: dict[str, int] = {}
+        self.stage_input_tokens: dict[str, int] = {}
+        self.stage_cached_input_tokens: dict[str, int] = {}
+        self.stage_completion_tokens: dict[str, int] = {}
+
+        # Provider usage per model (keyed by `LLMIdentifier` name) when the
+        # researcher routes stages to different models
+        self.model_calls: dict[str, int] = {}
+        self.model_input_tokens: dict[str, int] = {}
+        self.model_cached_input_tokens: dict[str, int] = {}
+        self.model_completion_tokens: dict[str, int] = {}
+
+        # Priced as it is recorded (batch discount included). Usage recorded
+        # without a model is priced by `total_cost` instead.
+        self.model_cost: dict[str, float] = {}
+        self.stage_cost: dict[str, float] = {}
+        self._unpriced_usage = TokenUsage(0, 0, 0)
+        self._unpriced_batch_usage = TokenUsage(0, 0, 0)
+
+        # Provider call latency (seconds, summed over the calls above)
+        self.stage_latency_s: dict[str, float] = {}
+        self.model_latency_s: dict[str, float] = {}
+
+        # Calls skipped by the researcher, keyed by reason (e.g. deduplication)
+        self.avoided_search_calls: dict[str, int] = {}
+        self.avoided_llm_calls: dict[str, int] = {}
+
+        # Backup requests sent by `HedgedLLMModel`. The losing request of a
+        # hedged call is extra spend, kept out of the totals above.
+        self.hedged_calls: int = 0
+        self.hedge_backup_wins: int = 0
+        self.total_hedge_input_tokens: int = 0
+        self.total_hedge_cached_input_tokens: int = 0
+        self.total_hedge_completion_tokens: int = 0
+        self.total_hedge_cost: float = 0.0
+
+        # Explicit context caches (see `GeminiContextCache`); storage is
+        # billed per token-hour on top of the cached input tokens above
+        self.context_cache_handles: int = 0
+        self.total_context_cache_storage_cost: float = 0.0
+
+        # Guards the counters when the researcher runs concurrently
+        self._lock = Lock()
+
     @abstractmethod
     def update_stats(
         self,
         usage_stats: CompletionUsage,
         usage_description: UsageDescription,
+        stage: Optional[ResearchStage] = None,
+        llm_model: Optional[LLMIdentifier] = None,
+        duration_s: Optional[float] = None,
     ) -> None: ...
 
+    # Optional hooks (caching, pruning, hedging, context caching); analytics
+    # that do not track them ignore the calls
+    def update_cache_stats(self, cache_name: str, hit: bool) -> None:
+        pass
+
+    def update_avoided_calls(
+        self, reason: str, search_calls: int, llm_calls: int
+    ) -> None:
+        pass
+
+    def update_hedge_stats(self, backup_won: bool) -> None:
+        pass
+
+    def update_hedge_spend(
+        self,
+        llm_model: LLMIdentifier,
+        usage_stats: CompletionUsage
+        | GenerateContentResponseUsageMetadata
+        | CacheHitUsage
+        | None,
+    ) -> None:
+        pass
+
+    def update_context_cache_stats(
+        self,
+        llm_model: LLMIdentifier,
+        num_tokens: int,
+        storage_s: float,
+        created: bool = False,
+    ) -> None:
+        pass
+
+    # Mean latency of the provider calls of each stage (or model)
+    def stage_mean_latencies_s(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                stage: latency_s / self.stage_calls[stage]
+                for stage, latency_s in self.stage_latency_s.items()
+            }
+
+    def model_mean_latencies_s(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                name: latency_s / self.model_calls[name]
+                for name, latency_s in self.model_latency_s.items()
+            }
+
+    # Share of input tokens served from the provider's prompt cache
+    def stage_cached_input_ratios(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                stage: (
+                    self.stage_cached_input_tokens[stage] / input_tokens
+                    if input_tokens
+                    else 0.0
+                )
+                for stage, input_tokens in self.stage_input_tokens.items()
+            }
+
+    # Price difference of the cached input tokens (explicit and implicit
+    # caching) against the non-cached rate, for the usage with a known model
+    def cached_input_savings(self) -> float:
+        with self._lock:
+            model_cached_input_tokens = dict(self.model_cached_input_tokens)
+
+        savings = 0.0
+        for name, cached_input_tokens in model_cached_input_tokens.items():
+            model_parameters = LLMIdentifier[name].value
+            savings += (
+                cached_input_tokens
+                / 1_000_000
+                * (
+                    model_parameters.cpm_non_cached_input_tokens_dollars
+                    - model_parameters.cpm_cached_input_tokens_dollars
+                )
+            )
+
+        return savings
+
     @abstractmethod
     def total_cost(
         self,
         llm_model: LLMIdentifier,
         search_context_size: Optional[Literal["low", "medium", "high"]] = None,
+        search_llm_model: Optional[LLMIdentifier] = None,
     ) -> float: ...
 
 
 class LLMAnalytics(Analytics):
     def update_stats(
         self,
-        usage_stats: CompletionUsage | GenerateContentResponseUsageMetadata,
+        usage_stats: CompletionUsage
+        | GenerateContentResponseUsageMetadata
+        | CacheHitUsage
+        | BatchUsage
+        | None,
         usage_description: UsageDescription,
+        stage: Optional[ResearchStage] = None,
+        llm_model: Optional[LLMIdentifier] = None,
+        duration_s: Optional[float] = None,
     ) -> None:
         logger.debug("Analytics: Usage Stats: %s", usage_description.value)
 
-        if isinstance(usage_stats, CompletionUsage):
-            logger.debug(
-                "Analytics: Prompt Tokens: %d\nCached Tokens: %d\nCompletion "
-                "Tokens: %d",
-                usage_stats.prompt_tokens,
-                usage_stats.prompt_tokens_details.cached_tokens,
-                usage_stats.completion_tokens,
+        with self._lock:
+            if (
+                is_openai_usage(usage_stats)
+                or is_gemini_usage(usage_stats)
+                or isinstance(usage_stats, BatchUsage)
+            ):
+                # Token details may be missing (e.g. streamed responses from
+                # OpenAI-compatible servers, or timeout fallbacks)
+                token_usage = to_token_usage(usage_stats)
+                logger.debug(
+                    "Analytics: Input Tokens: %d\nCached Input Tokens: %d\n"
+                    "Completion Tokens: %d",
+                    token_usage.input_tokens,
+                    token_usage.cached_input_tokens,
+                    token_usage.completion_tokens,
+                )
+
+                self.total_input_tokens += token_usage.input_tokens
+                self.total_cached_input_tokens += token_usage.cached_input_tokens
+                self.total_completion_tokens += token_usage.completion_tokens
+
+                cost = (
+                    usage_cost(llm_model, usage_stats) if llm_model else None
+                )
+                if stage is not None:
+                    self._update_stage_stats(
+                        stage=stage,
+                        usage=token_usage,
+                        cost=cost,
+                        duration_s=duration_s,
+                    )
+
+                if llm_model is not None:
+                    self._update_model_stats(
+                        llm_model=llm_model,
+                        usage=token_usage,
+                        cost=cost,
+                        duration_s=duration_s,
+                    )
+                else:
+                    self._add_unpriced_usage(
+                        usage=token_usage,
+                        batch=isinstance(usage_stats, BatchUsage),
+                    )
+
+                if isinstance(usage_stats, BatchUsage):
+                    self.batch_calls += 1
+                    self.total_batch_input_tokens += token_usage.input_tokens
+                    self.total_batch_cached_input_tokens += (
+                        token_usage.cached_input_tokens
+                    )
+                    self.total_batch_completion_tokens += (
+                        token_usage.completion_tokens
+                    )
+            elif isinstance(usage_stats, CacheHitUsage):
+                logger.debug(
+                    "Analytics: Cache Hit (Saved Input Tokens: %d, Saved "
+                    "Completion Tokens: %d)",
+                    usage_stats.saved_usage.input_tokens,
+                    usage_stats.saved_usage.completion_tokens,
+                )
+
+                self.cache_hit_calls += 1
+                self.total_cache_saved_input_tokens += (
+                    usage_stats.saved_usage.input_tokens
+                )
+                self.total_cache_saved_completion_tokens += (
+                    usage_stats.saved_usage.completion_tokens
+                )
+
+            # Cached searches are free, so they do not count towards search cost
+            self.search_calls += (
+                usage_description == UsageDescription.SEARCH
+                and not isinstance(usage_stats, CacheHitUsage)
             )
+            self.total_calls += 1
 
-            self.total_input_tokens += usage_stats.prompt_tokens
-            self.total_cached_input_tokens += (
-                usage_stats.prompt_tokens_details.cached_tokens
+    def _update_stage_stats(
+        self,
+        stage: ResearchStage,
+        usage: TokenUsage,
+        cost: Optional[float],
+        duration_s: Optional[float],
+    ) -> None:
+        self.stage_calls[stage.value] = self.stage_calls.get(stage.value, 0) + 1
+        self.stage_input_tokens[stage.value] = (
+            self.stage_input_tokens.get(stage.value, 0) + usage.input_tokens
+        )
+        self.stage_cached_input_tokens[stage.value] = (
+            self.stage_cached_input_tokens.get(stage.value, 0)
+            + usage.cached_input_tokens
+        )
+        self.stage_completion_tokens[stage.value] = (
+            self.stage_completion_tokens.get(stage.value, 0)
+            + usage.completion_tokens
+        )
+        if cost is not None:
+            self.stage_cost[stage.value] = (
+                self.stage_cost.get(stage.value, 0.0) + cost
             )
-            self.total_completion_tokens += usage_stats.completion_tokens
-        elif isinstance(usage_stats, GenerateContentResponseUsageMetadata):
-            cached_content_token_count = (
-                usage_stats.cached_content_token_count
-                if usage_stats.cached_content_token_count
-                else 0
+        if duration_s is not None:
+            self.stage_latency_s[stage.value] = (
+                self.stage_latency_s.get(stage.value, 0.0) + duration_s
+            )
+
+    def _update_model_stats(
+        self,
+        llm_model: LLMIdentifier,
+        usage: TokenUsage,
+        cost: float,
+        duration_s: Optional[float],
+    ) -> None:
+        name = llm_model.name
+        self.model_calls[name] = self.model_calls.get(name, 0) + 1
+        self.model_input_tokens[name] = (
+            self.model_input_tokens.get(name, 0) + usage.input_tokens
+        )
+        self.model_cached_input_tokens[name] = (
+            self.model_cached_input_tokens.get(name, 0)
+            + usage.cached_input_tokens
+        )
+        self.model_completion_tokens[name] = (
+            self.model_completion_tokens.get(name, 0) + usage.completion_tokens
+        )
+        self.model_cost[name] = self.model_cost.get(name, 0.0) + cost
+        if duration_s is not None:
+            self.model_latency_s[name] = (
+                self.model_latency_s.get(name, 0.0) + duration_s
             )
 
-            logger.debug(
-                "Analytics: Prompt Token Count: %d\nCached Content Token "
-                "Count: %d\nCandidates Token Count: %d",
-                usage_stats.prompt_token_count,
-                cached_content_token_count,
-                usage_stats.candidates_token_count,
+    def _add_unpriced_usage(self, usage: TokenUsage, batch: bool) -> None:
+        unpriced_usage = (
+            self._unpriced_batch_usage if batch else self._unpriced_usage
+        )
+        unpriced_usage.input_tokens += usage.input_tokens
+        unpriced_usage.cached_input_tokens += usage.cached_input_tokens
+        unpriced_usage.completion_tokens += usage.completion_tokens
+
+    def update_cache_stats(self, cache_name: str, hit: bool) -> None:
+        with self._lock:
+            counters = self.cache_hits if hit else self.cache_misses
+            counters[cache_name] = counters.get(cache_name, 0) + 1
+
+    def update_avoided_calls(
+        self, reason: str, search_calls: int, llm_calls: int
+    ) -> None:
+        with self._lock:
+            self.avoided_search_calls[reason] = (
+                self.avoided_search_calls.get(reason, 0) + search_calls
+            )
+            self.avoided_llm_calls[reason] = (
+                self.avoided_llm_calls.get(reason, 0) + llm_calls
+            )
+
+    def update_hedge_stats(self, backup_won: bool) -> None:
+        with self._lock:
+            self.hedged_calls += 1
+            self.hedge_backup_wins += backup_won
+
+    # Priced as it is recorded, since the backup may be a different model
+    def update_hedge_spend(
+        self,
+        llm_model: LLMIdentifier,
+        usage_stats: CompletionUsage
+        | GenerateContentResponseUsageMetadata
+        | CacheHitUsage
+        | None,
+    ) -> None:
+        token_usage = to_token_usage(usage_stats)
+        cost = usage_cost(llm_model, usage_stats)
+
+        with self._lock:
+            self.total_hedge_input_tokens += token_usage.input_tokens
+            self.total_hedge_cached_input_tokens += (
+                token_usage.cached_input_tokens
             )
+            self.total_hedge_completion_tokens += token_usage.completion_tokens
+            self.total_hedge_cost += cost
 
-            self.total_input_tokens += usage_stats.prompt_token_count
-            self.total_cached_input_tokens += cached_content_token_count
-            self.total_completion_tokens += usage_stats.candidates_token_count
+    # Negative storage time credits the unused TTL of a deleted handle
+    def update_context_cache_stats(
+        self,
+        llm_model: LLMIdentifier,
+        num_tokens: int,
+        storage_s: float,
+        created: bool = False,
+    ) -> None:
+        cost = (
+            num_tokens
+            / 1_000_000
+            * storage_s
+            / 3_600
+            * llm_model.value.cpm_cache_storage_dollars_per_hour
+        )
 
-        self.search_calls += usage_description == UsageDescription.SEARCH
-        self.total_calls += 1
+        with self._lock:
+            self.context_cache_handles += created
+            self.total_context_cache_storage_cost += cost
 
+    # Usage recorded with its model is priced per model; usage recorded
+    # without one (and searches, unless `search_llm_model` is given) is priced
+    # as `llm_model`
     def total_cost(
         self,
         llm_model: LLMIdentifier,
         search_context_size: Optional[Literal["low", "medium", "high"]] = None,
+        search_llm_model: Optional[LLMIdentifier] = None,
     ) -> float:
         logger.debug(
-            "Analytics: Total Calls: %d\nSearch Calls: %d",
+            "Analytics: Avoided Search Calls: %s\nAvoided LLM Calls: %s",
+            self.avoided_search_calls,
+            self.avoided_llm_calls,
+        )
+        logger.debug(
+            "Analytics: Total Calls: %d\nSearch Calls: %d\nCache Hit Calls: %d",
             self.total_calls,
             self.search_calls,
+            self.cache_hit_calls,
         )
-
-        non_cached_input_tokens_cost = (
-            (self.total_input_tokens - self.total_cached_input_tokens) / 10_00_000
-        ) * llm_model.value.cpm_non_cached_input_tokens_dollars
-        cached_input_tokens_cost = (
-            self.total_cached_input_tokens
-            / 10_00_000
-            * llm_model.value.cpm_cached_input_tokens_dollars
-        )
-        completion_tokens_cost = (
-            self.total_completion_tokens
-            / 10_00_000
-            * llm_model.value.cpm_completion_tokens_dollars
+        logger.debug(
+            "Analytics: Cache Hits: %s\nCache Misses: %s\nCache Saved Input "
+            "Tokens: %d\nCache Saved Completion Tokens: %d",
+            self.cache_hits,
+            self.cache_misses,
+            self.total_cache_saved_input_tokens,
+            self.total_cache_saved_completion_tokens,
         )
 
-        search_cost = 0
-        if search_context_size:
-            search_cost = getattr(
-                llm_model.value.search_cost,
-                f"cpt_{search_context_size}",
-            )
-            search_cost = self.search_calls / 1_000 * search_cost
+        with self._lock:
+            model_cost = dict(self.model_cost)
+            unpriced_cost = usage_cost(
+                llm_model, self._unpriced_usage
+            ) + usage_cost(llm_model, BatchUsage(self._unpriced_batch_usage))
+
+        search_cost = self.search_calls * search_call_cost(
+            search_llm_model or llm_model, search_context_size
+        )
 
         logger.debug(
-            "Analytics: Non-Cached Input Tokens Cost: $%f\nCached Input "
-            "Tokens Cost: $%f\nCompletion Tokens Cost: $%f\nSearch Cost: "
-            "$%f",
-            non_cached_input_tokens_cost,
-            cached_input_tokens_cost,
-            completion_tokens_cost,
+            "Analytics: Model Costs: %s\nStage Costs: %s\nUnattributed "
+            "Tokens Cost: $%f\nBatch Calls: %d\nSearch Cost: $%f\nHedge "
+            "Cost: $%f (Calls: %d, Backup Wins: %d)\nContext Cache Storage "
+            "Cost: $%f (Handles: %d)\nCached Input Savings: $%f",
+            model_cost,
+            self.stage_cost,
+            unpriced_cost,
+            self.batch_calls,
             search_cost,
+            self.total_hedge_cost,
+            self.hedged_calls,
+            self.hedge_backup_wins,
+            self.total_context_cache_storage_cost,
+            self.context_cache_handles,
+            self.cached_input_savings(),
         )
 
         return (
-            non_cached_input_tokens_cost
-            + cached_input_tokens_cost
-            + completion_tokens_cost
+            sum(model_cost.values())
+            + unpriced_cost
             + search_cost
+            + self.total_hedge_cost
+            + self.total_context_cache_storage_cost
         )
@@ -0,0 +1,298 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict
+from json import JSONDecodeError, dumps, loads
+from os import makedirs, path
+from re import fullmatch
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Literal, Optional
+
+from lib.analytics import LLMAnalytics
+from lib.concurrency import ProviderLimiter
+from lib.config import (
+    DeepResearchBatchParameters,
+    DeepResearchConcurrencyParameters,
+    DeepResearchHyperParameters,
+    DeepResearchTokenBudgetParameters,
+)
+from lib.crawlers import Crawler, LLMCrawler
+from lib.dedup import QueryRegistry
+from lib.llm import LLMModel
+from lib.log import logger
+from lib.metrics import ResearchMetrics
+from lib.models.batch import BatchJob, BatchJobResult, BatchSummary
+from lib.researcher import DeepResearcher
+from lib.tracing import ResearchTracer
+from lib.types import ResearchStage
+
+
+def load_batch_jobs(jobs_path: str) -> list[BatchJob]:
+    jobs = []
+    job_ids = set()
+
+    with open(jobs_path, "r", encoding="utf-8") as file_handle:
+        for line_number, line in enumerate(file_handle, start=1):
+            if not line.strip():
+                continue
+
+            try:
+                record = loads(line)
+            except JSONDecodeError as error:
+                raise ValueError(
+                    f"Invalid: Batch Job (line: {line_number})"
+                ) from error
+
+            # Job IDs name the output directories
+            job_id = str(record.get("job_id", line_number))
+            if not fullmatch(r"[\w.-]+", job_id):
+                raise ValueError(f"Invalid: job_id (line: {line_number})")
+            if job_id in job_ids:
+                raise ValueError(f"Invalid: job_id (duplicate: {job_id})")
+            job_ids.add(job_id)
+
+            research_parameters = record.get("research_parameters")
+            jobs.append(
+                BatchJob(
+                    job_id=job_id,
+                    user_query=record["user_query"],
+                    research_parameters=(
+                        DeepResearchHyperParameters(**research_parameters)
+                        if research_parameters
+                        else None
+                    ),
+                )
+            )
+
+    logger.info("Loaded: %d Batch Jobs", len(jobs))
+    return jobs
+
+
+# Runs many queries on one set of plugins (and therefore one set of warm
+# clients and caches). Research nodes of all jobs share a single worker pool
+# and provider limiter, so `max_concurrent_jobs` only bounds how many trees
+# are expanded at once.
+class BatchRunner:
+    def __init__(
+        self,
+        crawler: Crawler | LLMCrawler,
+        llm_model: LLMModel,
+        output_dir: str,
+        concurrency_parameters: Optional[
+            DeepResearchConcurrencyParameters
+        ] = None,
+        max_concurrent_jobs: int = 2,
+        token_budget_parameters: Optional[
+            DeepResearchTokenBudgetParameters
+        ] = None,
+        report_mode: Literal["single", "hierarchical"] = "single",
+        query_registry_factory: Optional[Callable[[], QueryRegistry]] = None,
+        batch_parameters: Optional[DeepResearchBatchParameters] = None,
+        metrics_instance: Optional[ResearchMetrics] = None,
+        tracer: Optional[ResearchTracer] = None,
+        stage_llm_models: Optional[dict[ResearchStage, LLMModel]] = None,
+    ):
+        if max_concurrent_jobs < 1:
+            raise ValueError("Invalid: max_concurrent_jobs (must be >= 1)")
+
+        self.crawler = crawler
+        self.llm_model = llm_model
+        self.output_dir = output_dir
+        self.concurrency_parameters = (
+            concurrency_parameters or DeepResearchConcurrencyParameters()
+        )
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.token_budget_parameters = token_budget_parameters
+        self.report_mode = report_mode
+        # Deduplication is per job; queries of unrelated jobs may overlap
+        self.query_registry_factory = query_registry_factory
+        self.batch_parameters = batch_parameters
+        # Shared by every job, unlike the per-job analytics
+        self.metrics_instance = metrics_instance
+        self.tracer = tracer
+        self.stage_llm_models = stage_llm_models
+
+        self.results_path = path.join(output_dir, "results.jsonl")
+        self._results_lock = Lock()
+
+    def __repr__(self):
+        return (
+            f"BatchRunner(output_dir={self.output_dir}, "
+            f"max_concurrent_jobs={self.max_concurrent_jobs}, "
+            f"concurrency_parameters={self.concurrency_parameters})"
+        )
+
+    def __call__(self, jobs: list[BatchJob]) -> BatchSummary:
+        start_time_s = perf_counter()
+        makedirs(self.output_dir, exist_ok=True)
+
+        completed_job_ids = self._completed_job_ids()
+        pending_jobs = [
+            job for job in jobs if job.job_id not in completed_job_ids
+        ]
+        logger.info(
+            "Running Batch: %d Jobs (Skipped: %d Completed)",
+            len(pending_jobs),
+            len(jobs) - len(pending_jobs),
+        )
+
+        limiter = ProviderLimiter(
+            self.concurrency_parameters.max_in_flight_per_provider
+        )
+        results = []
+        with (
+            ThreadPoolExecutor(
+                max_workers=self.concurrency_parameters.max_workers,
+                thread_name_prefix="deep-researcher",
+            ) as node_executor,
+            ThreadPoolExecutor(
+                max_workers=self.max_concurrent_jobs,
+                thread_name_prefix="deep-researcher-batch",
+            ) as job_executor,
+        ):
+            futures = [
+                job_executor.submit(self._run_job, job, node_executor, limiter)
+                for job in pending_jobs
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                self._write_result(result)
+                results.append(result)
+
+        summary = BatchSummary(
+            completed_jobs=sum(
+                result.status == "completed" for result in results
+            ),
+            failed_jobs=sum(result.status == "failed" for result in results),
+            skipped_jobs=len(jobs) - len(pending_jobs),
+            duration_s=perf_counter() - start_time_s,
+            input_tokens=sum(result.input_tokens for result in results),
+            completion_tokens=sum(
+                result.completion_tokens for result in results
+            ),
+            cost=sum(result.cost for result in results),
+        )
+        self._log_summary(summary)
+        return summary
+
+    def _run_job(
+        self,
+        job: BatchJob,
+        node_executor: ThreadPoolExecutor,
+        limiter: ProviderLimiter,
+    ) -> BatchJobResult:
+        logger.info("Batch Job Started: %s", job.job_id)
+        start_time_s = perf_counter()
+
+        job_dir = path.join(self.output_dir, job.job_id)
+        makedirs(job_dir, exist_ok=True)
+
+        analytics_instance = LLMAnalytics()
+        researcher = DeepResearcher(
+            crawler=self.crawler,
+            llm_model=self.llm_model,
+            research_parameters=job.research_parameters,
+            analytics_instance=analytics_instance,
+            concurrency_parameters=self.concurrency_parameters,
+            token_budget_parameters=self.token_budget_parameters,
+            report_mode=self.report_mode,
+            query_registry=(
+                self.query_registry_factory()
+                if self.query_registry_factory
+                else None
+            ),
+            executor=node_executor,
+            limiter=limiter,
+            batch_parameters=self.batch_parameters,
+            metrics_instance=self.metrics_instance,
+            tracer=self.tracer,
+            stage_llm_models=self.stage_llm_models,
+        )
+
+        try:
+            with open(
+                path.join(job_dir, "report.md"), "w", encoding="utf-8"
+            ) as report_file:
+
+                def write_report_chunk(chunk: str) -> None:
+                    report_file.write(chunk)
+                    report_file.flush()
+
+                # Batch jobs are unattended, so the query is refined
+                # automatically
+                learnings, _ = researcher(
+                    user_query=job.user_query,
+                    auto_query_refinement=True,
+                    on_report_chunk=write_report_chunk,
+                )
+        except Exception as error:
+            logger.exception("Batch Job Failed: %s", job.job_id)
+            return BatchJobResult(
+                job_id=job.job_id,
+                status="failed",
+                duration_s=perf_counter() - start_time_s,
+                error=repr(error),
+            )
+
+        with open(
+            path.join(job_dir, "learnings.md"), "w", encoding="utf-8"
+        ) as file_handle:
+            file_handle.write("\n\n".join(learnings))
+
+        result = BatchJobResult(
+            job_id=job.job_id,
+            status="completed",
+            duration_s=perf_counter() - start_time_s,
+            num_learnings=len(learnings),
+            input_tokens=analytics_instance.total_input_tokens,
+            cached_input_tokens=analytics_instance.total_cached_input_tokens,
+            completion_tokens=analytics_instance.total_completion_tokens,
+            total_calls=analytics_instance.total_calls,
+            search_calls=analytics_instance.search_calls,
+            cost=analytics_instance.total_cost(
+                llm_model=self.llm_model.llm_identifier,
+                search_context_size=getattr(
+                    self.crawler, "search_context_size", None
+                ),
+                search_llm_model=getattr(self.crawler, "llm_identifier", None),
+            ),
+        )
+        logger.info(
+            "Batch Job Completed: %s (%.2f seconds)",
+            job.job_id,
+            result.duration_s,
+        )
+        return result
+
+    def _completed_job_ids(self) -> set[str]:
+        if not path.exists(self.results_path):
+            return set()
+
+        completed_job_ids = set()
+        with open(self.results_path, "r", encoding="utf-8") as file_handle:
+            for line in file_handle:
+                try:
+                    record = loads(line)
+                except JSONDecodeError:
+                    continue
+
+                if record["status"] == "completed":
+                    completed_job_ids.add(record["job_id"])
+
+        return completed_job_ids
+
+    def _write_result(self, result: BatchJobResult) -> None:
+        with self._results_lock:
+            with open(self.results_path, "a", encoding="utf-8") as file_handle:
+                file_handle.write(dumps(asdict(result)) + "\n")
+
+    def _log_summary(self, summary: BatchSummary) -> None:
+        logger.info(
+            "Batch Completed: %d Jobs (Failed: %d, Skipped: %d)",
+            summary.completed_jobs,
+            summary.failed_jobs,
+            summary.skipped_jobs,
+        )
+        logger.info("Throughput: %.2f Jobs/Hour", summary.jobs_per_hour)
+        logger.info("Throughput: %.2f Tokens/Second", summary.tokens_per_s)
+        logger.info("Total Cost: $%f", summary.cost)
+        logger.info("Execution Time: %.2f seconds", summary.duration_s)
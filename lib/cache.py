@@ -0,0 +1,743 @@
+from __future__ import annotations
+
+import sqlite3
+from asyncio import to_thread
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict
+from hashlib import sha256
+from json import dumps, loads
+from os import getpid, makedirs, path
+from re import sub as re_sub
+from threading import Lock, local
+from time import time
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
+from unicodedata import normalize
+
+from pydantic import BaseModel
+
+from lib.analytics import Analytics, to_token_usage
+from lib.config import DeepResearchBatchParameters
+from lib.crawlers import Crawler, LLMCrawler
+from lib.llm import LLMModel
+from lib.log import logger
+from lib.models.crawler import SERPQuerySearchResult, SERPQuerySearchResults
+from lib.types import BatchUsage, CacheHitUsage, TokenUsage
+
+if TYPE_CHECKING:
+    from google.genai.types import GenerateContentResponseUsageMetadata
+    from openai.types import CompletionUsage
+
+
+# SQLite in WAL mode gives us concurrent readers alongside a single writer
+# across processes; `BEGIN IMMEDIATE` serialises writers on the file lock.
+class DiskCache:
+    def __init__(
+        self,
+        cache_path: str,
+        ttl_s: Optional[float] = None,
+        max_size_bytes: Optional[int] = None,
+        busy_timeout_s: float = 30.0,
+    ):
+        self.cache_path = cache_path
+        self.ttl_s = ttl_s
+        self.max_size_bytes = max_size_bytes
+        self.busy_timeout_s = busy_timeout_s
+
+        self._local = local()
+
+        cache_directory = path.dirname(path.abspath(cache_path))
+        makedirs(cache_directory, exist_ok=True)
+
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, "
+                "value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "expires_at REAL, "
+                "accessed_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed_at "
+                "ON entries (accessed_at)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are neither shareable across threads nor safe to
+        # inherit through fork, so keep one per thread and per process.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != getpid():
+            logger.debug("Opening Disk Cache: %s", self.cache_path)
+            connection = sqlite3.connect(
+                self.cache_path,
+                timeout=self.busy_timeout_s,
+                isolation_level=None,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+
+            self._local.connection = connection
+            self._local.pid = getpid()
+
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        else:
+            connection.execute("COMMIT")
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key: str) -> Optional[tuple[bytes, Optional[float]]]:
+        now = time()
+        connection = self._connection()
+
+        # Plain reads run outside an explicit transaction, so readers never
+        # queue behind each other; only the LRU touch takes the write lock.
+        row = connection.execute(
+            "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        value, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            logger.debug("Disk Cache: Expired Key: %s", key)
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+
+        connection.execute(
+            "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+        )
+        return value, expires_at
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        now = time()
+        ttl_s = self.ttl_s if ttl_s is None else ttl_s
+
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, value, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    value,
+                    len(value),
+                    now + ttl_s if ttl_s is not None else None,
+                    now,
+                ),
+            )
+            self._evict(connection, now)
+
+    def clear(self) -> None:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM entries")
+
+    def _evict(self, connection: sqlite3.Connection, now: float) -> None:
+        connection.execute(
+            "DELETE FROM entries WHERE expires_at IS NOT NULL "
+            "AND expires_at <= ?",
+            (now,),
+        )
+
+        if self.max_size_bytes is None:
+            return
+
+        (total_size_bytes,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        excess_bytes = total_size_bytes - self.max_size_bytes
+        if excess_bytes <= 0:
+            return
+
+        evicted_keys = []
+        for key, size in connection.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+        ):
+            if excess_bytes <= 0:
+                break
+
+            evicted_keys.append((key,))
+            excess_bytes -= size
+
+        connection.executemany("DELETE FROM entries WHERE key = ?", evicted_keys)
+        logger.debug("Disk Cache: Evicted %d Entries (LRU)", len(evicted_keys))
+
+
+class MemoryCache:
+    def __init__(self, ttl_s: Optional[float] = None, max_entries: int = 1024):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+
+        self._entries: OrderedDict[str, tuple[bytes, Optional[float]]] = (
+            OrderedDict()
+        )
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key: str) -> Optional[tuple[bytes, Optional[float]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            if entry[1] is not None and entry[1] <= time():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        ttl_s = self.ttl_s if ttl_s is None else ttl_s
+        self.set_entry(key, value, time() + ttl_s if ttl_s is not None else None)
+
+    def set_entry(
+        self, key: str, value: bytes, expires_at: Optional[float]
+    ) -> None:
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class TieredCache:
+    def __init__(self, memory_cache: MemoryCache, disk_cache: DiskCache):
+        self.memory_cache = memory_cache
+        self.disk_cache = disk_cache
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.memory_cache.get(key)
+        if value is not None:
+            return value
+
+        entry = self.disk_cache.get_entry(key)
+        if entry is None:
+            return None
+
+        # Promoted entries keep the disk tier's expiry, so a memory hit is
+        # never staler than the disk tier would have allowed.
+        logger.debug("Tiered Cache: Promoting Key: %s", key)
+        self.memory_cache.set_entry(key, *entry)
+        return entry[0]
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        self.memory_cache.set(key, value, ttl_s=ttl_s)
+        self.disk_cache.set(key, value, ttl_s=ttl_s)
+
+    def clear(self) -> None:
+        self.memory_cache.clear()
+        self.disk_cache.clear()
+
+
+class CachedLLMModel(LLMModel):
+    def __init__(
+        self,
+        llm_model: LLMModel,
+        cache: DiskCache,
+        analytics_instance: Optional[Analytics] = None,
+    ):
+        super().__init__(
+            llm_identifier=llm_model.llm_identifier,
+            llm_instance=llm_model.llm_instance,
+        )
+
+        self.llm_model = llm_model
+        self.cache = cache
+        self.analytics_instance = analytics_instance
+
+    def __repr__(self):
+        return f"CachedLLMModel(llm_model={self.llm_model})"
+
+    def generate_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+    ) -> tuple[
+        BaseModel | str,
+        CompletionUsage | GenerateContentResponseUsageMetadata | CacheHitUsage,
+    ]:
+        key = self._cache_key(system_prompt, user_prompt, response_format)
+
+        cached_entry = self.cache.get(key)
+        if cached_entry is not None:
+            return self._cache_hit(cached_entry, response_format)
+
+        self._record_cache_lookup(hit=False)
+        result, usage = self.llm_model.generate_llm_response(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            response_format=response_format,
+        )
+
+        cache_entry = self._cache_entry(result, usage)
+        if cache_entry is not None:
+            self.cache.set(key, cache_entry)
+
+        return result, usage
+
+    async def agenerate_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+    ) -> tuple[
+        BaseModel | str,
+        CompletionUsage | GenerateContentResponseUsageMetadata | CacheHitUsage,
+    ]:
+        key = self._cache_key(system_prompt, user_prompt, response_format)
+
+        cached_entry = await to_thread(self.cache.get, key)
+        if cached_entry is not None:
+            return self._cache_hit(cached_entry, response_format)
+
+        self._record_cache_lookup(hit=False)
+        result, usage = await self.llm_model.agenerate_llm_response(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            response_format=response_format,
+        )
+
+        cache_entry = self._cache_entry(result, usage)
+        if cache_entry is not None:
+            await to_thread(self.cache.set, key, cache_entry)
+
+        return result, usage
+
+    # Only the misses are submitted to the batch API
+    def batch_generate_llm_responses(
+        self,
+        system_prompt: str,
+        user_prompts: list[str],
+        response_format: BaseModel,
+        batch_parameters: DeepResearchBatchParameters,
+    ) -> list[
+        tuple[
+            BaseModel,
+            CompletionUsage
+            | GenerateContentResponseUsageMetadata
+            | BatchUsage
+            | CacheHitUsage,
+        ]
+    ]:
+        keys = [
+            self._cache_key(system_prompt, user_prompt, response_format)
+            for user_prompt in user_prompts
+        ]
+
+        results = {}
+        for index, key in enumerate(keys):
+            cached_entry = self.cache.get(key)
+            if cached_entry is not None:
+                results[index] = self._cache_hit(cached_entry, response_format)
+
+        missed_indices = [
+            index for index in range(len(user_prompts)) if index not in results
+        ]
+        for _ in missed_indices:
+            self._record_cache_lookup(hit=False)
+
+        if missed_indices:
+            missed_results = self.llm_model.batch_generate_llm_responses(
+                system_prompt=system_prompt,
+                user_prompts=[user_prompts[index] for index in missed_indices],
+                response_format=response_format,
+                batch_parameters=batch_parameters,
+            )
+            for index, (result, usage) in zip(
+                missed_indices, missed_results, strict=True
+            ):
+                results[index] = result, usage
+
+                cache_entry = self._cache_entry(result, usage)
+                if cache_entry is not None:
+                    self.cache.set(keys[index], cache_entry)
+
+        return [results[index] for index in range(len(user_prompts))]
+
+    # Streamed and non-streamed completions share cache entries; a hit is
+    # replayed as a single chunk.
+    def stream_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+    ) -> tuple[
+        str,
+        CompletionUsage | GenerateContentResponseUsageMetadata | CacheHitUsage,
+    ]:
+        key = self._cache_key(system_prompt, user_prompt)
+
+        cached_entry = self.cache.get(key)
+        if cached_entry is not None:
+            result, usage = self._cache_hit(cached_entry)
+            on_chunk(result)
+            return result, usage
+
+        self._record_cache_lookup(hit=False)
+        result, usage = self.llm_model.stream_llm_response(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            on_chunk=on_chunk,
+        )
+
+        cache_entry = self._cache_entry(result, usage)
+        if cache_entry is not None:
+            self.cache.set(key, cache_entry)
+
+        return result, usage
+
+    async def astream_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+    ) -> tuple[
+        str,
+        CompletionUsage | GenerateContentResponseUsageMetadata | CacheHitUsage,
+    ]:
+        key = self._cache_key(system_prompt, user_prompt)
+
+        cached_entry = await to_thread(self.cache.get, key)
+        if cached_entry is not None:
+            result, usage = self._cache_hit(cached_entry)
+            on_chunk(result)
+            return result, usage
+
+        self._record_cache_lookup(hit=False)
+        result, usage = await self.llm_model.astream_llm_response(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            on_chunk=on_chunk,
+        )
+
+        cache_entry = self._cache_entry(result, usage)
+        if cache_entry is not None:
+            await to_thread(self.cache.set, key, cache_entry)
+
+        return result, usage
+
+    def _cache_key(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+    ) -> str:
+        return sha256(
+            dumps(
+                [
+                    self.llm_identifier.value.model_identifier,
+                    system_prompt,
+                    user_prompt,
+                    (
+                        response_format.model_json_schema()
+                        if response_format
+                        else None
+                    ),
+                ],
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def _cache_entry(
+        self,
+        result: BaseModel | str,
+        usage: CompletionUsage | GenerateContentResponseUsageMetadata,
+    ) -> Optional[bytes]:
+        # Empty results are the timeout fallbacks of the underlying models
+        if not result:
+            logger.debug("LLM Cache: Skipping Empty Result")
+            return None
+
+        token_usage = to_token_usage(usage)
+        return dumps({
+            "result": (
+                result.model_dump(mode="json")
+                if isinstance(result, BaseModel)
+                else result
+            ),
+            "usage": {
+                "input_tokens": token_usage.input_tokens,
+                "cached_input_tokens": token_usage.cached_input_tokens,
+                "completion_tokens": token_usage.completion_tokens,
+            },
+        }).encode("utf-8")
+
+    def _cache_hit(
+        self, cached_entry: bytes, response_format: Optional[BaseModel] = None
+    ) -> tuple[BaseModel | str, CacheHitUsage]:
+        logger.info("LLM Cache: Hit")
+        self._record_cache_lookup(hit=True)
+
+        cached_entry = loads(cached_entry)
+        result = cached_entry["result"]
+        if response_format:
+            result = response_format.model_validate(result)
+
+        return result, CacheHitUsage(
+            saved_usage=TokenUsage(**cached_entry["usage"])
+        )
+
+    def _record_cache_lookup(self, hit: bool) -> None:
+        if self.analytics_instance:
+            self.analytics_instance.update_cache_stats(
+                cache_name="llm", hit=hit
+            )
+
+
+# Grounded LLM searches go stale faster than scraped pages
+DEFAULT_SEARCH_CACHE_TTL_S = {
+    "FirecrawlCrawler": 6 * 60 * 60,
+    "OpenAISearchCrawler": 60 * 60,
+    "GeminiSearchCrawler": 60 * 60,
+}
+FALLBACK_SEARCH_CACHE_TTL_S = 60 * 60
+
+
+def normalize_query(query: str) -> str:
+    query = normalize("NFKC", query).casefold()
+    # Punctuation -> Whitespace, then Continuous Whitespaces -> Single Whitespace
+    query = re_sub(r"[^\w\s]+", " ", query)
+    return re_sub(r"\s+", " ", query).strip()
+
+
+def cached_crawler(
+    crawler: Crawler | LLMCrawler,
+    cache: DiskCache | MemoryCache | TieredCache,
+    ttl_s: Optional[float] = None,
+    analytics_instance: Optional[Analytics] = None,
+) -> "CachedCrawler | CachedLLMCrawler":
+    if isinstance(crawler, LLMCrawler):
+        return CachedLLMCrawler(crawler, cache, ttl_s, analytics_instance)
+
+    return CachedCrawler(crawler, cache, ttl_s, analytics_instance)
+
+
+class _SearchCache:
+    def __init__(
+        self,
+        crawler: Crawler | LLMCrawler,
+        cache: DiskCache | MemoryCache | TieredCache,
+        ttl_s: Optional[float] = None,
+        analytics_instance: Optional[Analytics] = None,
+    ):
+        self.crawler = crawler
+        self.cache = cache
+        self.ttl_s = (
+            ttl_s
+            if ttl_s is not None
+            else DEFAULT_SEARCH_CACHE_TTL_S.get(
+                type(crawler).__name__, FALLBACK_SEARCH_CACHE_TTL_S
+            )
+        )
+        self.analytics_instance = analytics_instance
+
+    def cache_key(self, query: str) -> str:
+        llm_identifier = getattr(self.crawler, "llm_identifier", None)
+        return sha256(
+            dumps([
+                type(self.crawler).__name__,
+                llm_identifier.value.model_identifier if llm_identifier else None,
+                getattr(self.crawler, "search_context_size", None),
+                normalize_query(query),
+            ]).encode("utf-8")
+        ).hexdigest()
+
+    def lookup(
+        self, key: str
+    ) -> Optional[tuple[SERPQuerySearchResults | str, CacheHitUsage]]:
+        cached_entry = self.cache.get(key)
+        self._record_cache_lookup(hit=cached_entry is not None)
+        if cached_entry is None:
+            return None
+
+        logger.info("Search Cache: Hit")
+        cached_entry = loads(cached_entry)
+
+        result = cached_entry["result"]
+        if cached_entry["result_type"] == "search_results":
+            result = SERPQuerySearchResults(
+                search_results=[
+                    SERPQuerySearchResult(**search_result)
+                    for search_result in result
+                ]
+            )
+
+        return result, CacheHitUsage(
+            saved_usage=TokenUsage(**cached_entry["usage"])
+        )
+
+    def store(
+        self,
+        key: str,
+        result: Optional[SERPQuerySearchResults | str],
+        usage: Optional[
+            CompletionUsage | GenerateContentResponseUsageMetadata
+        ] = None,
+    ) -> None:
+        # Empty results are the timeout fallbacks of the underlying crawlers
+        if not result:
+            logger.debug("Search Cache: Skipping Empty Result")
+            return
+
+        token_usage = to_token_usage(usage)
+        self.cache.set(
+            key,
+            dumps({
+                "result_type": (
+                    "search_results"
+                    if isinstance(result, SERPQuerySearchResults)
+                    else "text"
+                ),
+                "result": (
+                    [
+                        asdict(search_result)
+                        for search_result in result.search_results
+                    ]
+                    if isinstance(result, SERPQuerySearchResults)
+                    else result
+                ),
+                "usage": {
+                    "input_tokens": token_usage.input_tokens,
+                    "cached_input_tokens": token_usage.cached_input_tokens,
+                    "completion_tokens": token_usage.completion_tokens,
+                },
+            }).encode("utf-8"),
+            ttl_s=self.ttl_s,
+        )
+
+    def _record_cache_lookup(self, hit: bool) -> None:
+        if self.analytics_instance:
+            self.analytics_instance.update_cache_stats(
+                cache_name="search", hit=hit
+            )
+
+
+class CachedCrawler(Crawler):
+    def __init__(
+        self,
+        crawler: Crawler,
+        cache: DiskCache | MemoryCache | TieredCache,
+        ttl_s: Optional[float] = None,
+        analytics_instance: Optional[Analytics] = None,
+    ):
+        self.crawler = crawler
+        self._search_cache = _SearchCache(
+            crawler, cache, ttl_s, analytics_instance
+        )
+
+    def __repr__(self):
+        return f"CachedCrawler(crawler={self.crawler})"
+
+    def search(self, query: str) -> SERPQuerySearchResults:
+        key = self._search_cache.cache_key(query)
+
+        cached_response = self._search_cache.lookup(key)
+        if cached_response is not None:
+            return cached_response[0]
+
+        result = self.crawler.search(query)
+        self._search_cache.store(key, result)
+        return result
+
+    async def asearch(self, query: str) -> SERPQuerySearchResults:
+        key = self._search_cache.cache_key(query)
+
+        cached_response = await to_thread(self._search_cache.lookup, key)
+        if cached_response is not None:
+            return cached_response[0]
+
+        result = await self.crawler.asearch(query)
+        await to_thread(self._search_cache.store, key, result)
+        return result
+
+    def crawl(self, link: str) -> str:
+        return self.crawler.crawl(link)
+
+    async def acrawl(self, link: str) -> str:
+        return await self.crawler.acrawl(link)
+
+    def crawl_many(self, links: list[str]) -> dict[str, str]:
+        return self.crawler.crawl_many(links)
+
+    async def acrawl_many(self, links: list[str]) -> dict[str, str]:
+        return await self.crawler.acrawl_many(links)
+
+    def close(self) -> None:
+        self.crawler.close()
+
+    async def aclose(self) -> None:
+        await self.crawler.aclose()
+
+
+class CachedLLMCrawler(LLMCrawler):
+    def __init__(
+        self,
+        crawler: LLMCrawler,
+        cache: DiskCache | MemoryCache | TieredCache,
+        ttl_s: Optional[float] = None,
+        analytics_instance: Optional[Analytics] = None,
+    ):
+        super().__init__(
+            llm_identifier=crawler.llm_identifier,
+            llm_instance=crawler.llm_instance,
+            search_context_size=crawler.search_context_size,
+        )
+
+        self.crawler = crawler
+        self._search_cache = _SearchCache(
+            crawler, cache, ttl_s, analytics_instance
+        )
+
+    def __repr__(self):
+        return f"CachedLLMCrawler(crawler={self.crawler})"
+
+    def search(self, query: str) -> tuple[
+        SERPQuerySearchResults | str,
+        CompletionUsage | GenerateContentResponseUsageMetadata | CacheHitUsage,
+    ]:
+        key = self._search_cache.cache_key(query)
+
+        cached_response = self._search_cache.lookup(key)
+        if cached_response is not None:
+            return cached_response
+
+        result, usage = self.crawler.search(query)
+        self._search_cache.store(key, result, usage)
+        return result, usage
+
+    async def asearch(self, query: str) -> tuple[
+        SERPQuerySearchResults | str,
+        CompletionUsage | GenerateContentResponseUsageMetadata | CacheHitUsage,
+    ]:
+        key = self._search_cache.cache_key(query)
+
+        cached_response = await to_thread(self._search_cache.lookup, key)
+        if cached_response is not None:
+            return cached_response
+
+        result, usage = await self.crawler.asearch(query)
+        await to_thread(self._search_cache.store, key, result, usage)
+        return result, usage
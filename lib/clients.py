@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from lib.concurrency import LoopLocalClients
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+
+def async_openai_client(llm_instance: OpenAI) -> AsyncOpenAI:
+    from openai import AsyncOpenAI
+
+    # Mirrors the synchronous client's configuration so that plugins built
+    # around an `OpenAI` instance get an equivalent async client for free.
+    return AsyncOpenAI(
+        api_key=llm_instance.api_key,
+        organization=llm_instance.organization,
+        project=llm_instance.project,
+        base_url=llm_instance.base_url,
+        timeout=llm_instance.timeout,
+        max_retries=llm_instance.max_retries,
+    )
+
+
+# The SDK raises its own timeout error rather than a `TimeoutError`; called
+# in the `except` clause, so that `openai` is only imported on failure
+def openai_timeout_errors() -> tuple[type[Exception], ...]:
+    from openai import APITimeoutError
+
+    return TimeoutError, APITimeoutError
+
+
+# Plugins that create their own async client get one per event loop
+def loop_local_async_openai_clients(
+    llm_instance: OpenAI,
+) -> LoopLocalClients[AsyncOpenAI]:
+    return LoopLocalClients(
+        name="AsyncOpenAI Client",
+        create=lambda: async_openai_client(llm_instance),
+        close=lambda async_llm_instance: async_llm_instance.close(),
+    )
@@ -0,0 +1,224 @@
+from asyncio import AbstractEventLoop, Semaphore, get_running_loop
+from contextlib import asynccontextmanager, contextmanager
+from threading import BoundedSemaphore, Lock
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Generic,
+    Iterator,
+    Optional,
+    TypeVar,
+)
+
+from lib.log import logger
+from lib.types import ModelProvider
+
+T = TypeVar("T")
+
+
+def provider_key(plugin: object) -> str:
+    # LLM-backed plugins share the provider's rate limits; everything else
+    # (e.g. FirecrawlCrawler) is limited per plugin class.
+    llm_identifier = getattr(plugin, "llm_identifier", None)
+    if llm_identifier is not None:
+        return llm_identifier.value.model_provider.value
+
+    return type(plugin).__name__
+
+
+class ProviderLimiter:
+    def __init__(
+        self,
+        max_in_flight_per_provider: Optional[
+            dict[ModelProvider | str, int]
+        ] = None,
+        default_max_in_flight: Optional[int] = None,
+    ):
+        if default_max_in_flight is not None and default_max_in_flight < 1:
+            raise ValueError("Invalid: default_max_in_flight (must be >= 1)")
+
+        self._max_in_flight = {
+            (
+                provider.value
+                if isinstance(provider, ModelProvider)
+                else provider
+            ): max_in_flight
+            for provider, max_in_flight in (
+                max_in_flight_per_provider or {}
+            ).items()
+        }
+        self._semaphores = {
+            provider: BoundedSemaphore(max_in_flight)
+            for provider, max_in_flight in self._max_in_flight.items()
+        }
+        # Keys not listed (e.g. hosts, which are only known once seen) are
+        # unlimited unless a default is set
+        self.default_max_in_flight = default_max_in_flight
+        # asyncio semaphores bind to the event loop they are first used on,
+        # so each loop (e.g. each `asyncio.run`) gets semaphores of its own
+        self._async_semaphores: dict[
+            AbstractEventLoop, dict[str, Semaphore]
+        ] = {}
+        self._lock = Lock()
+
+    @contextmanager
+    def limit(self, provider: str) -> Iterator[None]:
+        semaphore = self._semaphore(provider)
+        if semaphore is None:
+            yield
+            return
+
+        if not semaphore.acquire(blocking=False):
+            logger.debug("Provider Limit Reached: %s (waiting)", provider)
+            semaphore.acquire()
+
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    @asynccontextmanager
+    async def alimit(self, provider: str) -> AsyncIterator[None]:
+        max_in_flight = self._max_in_flight.get(
+            provider, self.default_max_in_flight
+        )
+        if max_in_flight is None:
+            yield
+            return
+
+        semaphore = self._async_semaphore(provider, max_in_flight)
+        if semaphore.locked():
+            logger.debug("Provider Limit Reached: %s (waiting)", provider)
+
+        async with semaphore:
+            yield
+
+    # Takes a slot without waiting and returns its release, or None if the
+    # provider is at its limit (e.g. for optional requests such as hedges)
+    def try_acquire(self, provider: str) -> Optional[Callable[[], None]]:
+        semaphore = self._semaphore(provider)
+        if semaphore is None:
+            return lambda: None
+
+        if not semaphore.acquire(blocking=False):
+            return None
+
+        return semaphore.release
+
+    async def atry_acquire(
+        self, provider: str
+    ) -> Optional[Callable[[], None]]:
+        max_in_flight = self._max_in_flight.get(
+            provider, self.default_max_in_flight
+        )
+        if max_in_flight is None:
+            return lambda: None
+
+        semaphore = self._async_semaphore(provider, max_in_flight)
+        if semaphore.locked():
+            return None
+
+        # An unlocked semaphore is acquired without suspending
+        await semaphore.acquire()
+        return semaphore.release
+
+    def _semaphore(self, provider: str) -> Optional[BoundedSemaphore]:
+        semaphore = self._semaphores.get(provider)
+        if semaphore is not None or self.default_max_in_flight is None:
+            return semaphore
+
+        with self._lock:
+            return self._semaphores.setdefault(
+                provider, BoundedSemaphore(self.default_max_in_flight)
+            )
+
+    def _async_semaphore(self, provider: str, max_in_flight: int) -> Semaphore:
+        loop = get_running_loop()
+        with self._lock:
+            # Semaphores of finished loops can no longer be waited on
+            for closed_loop in [
+                semaphores_loop
+                for semaphores_loop in self._async_semaphores
+                if semaphores_loop.is_closed()
+            ]:
+                del self._async_semaphores[closed_loop]
+
+            return self._async_semaphores.setdefault(loop, {}).setdefault(
+                provider, Semaphore(max_in_flight)
+            )
+
+
+# Async clients (httpx, AsyncOpenAI) pool connections that are bound to the
+# event loop they were first used on, so each loop (e.g. each `asyncio.run`)
+# gets a client of its own. The closer is an async generator that the loop's
+# shutdown (at the end of `asyncio.run`) finalizes, closing the client on its
+# own loop.
+class LoopLocalClients(Generic[T]):
+    def __init__(
+        self,
+        name: str,
+        create: Callable[[], T],
+        close: Callable[[T], Awaitable[None]],
+    ):
+        self.name = name
+        self._create = create
+        self._close = close
+
+        self._clients: dict[
+            AbstractEventLoop, tuple[T, AsyncIterator[None]]
+        ] = {}
+        self._lock = Lock()
+
+    def __repr__(self):
+        return f"LoopLocalClients(name={self.name!r})"
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+    async def get(self) -> T:
+        loop = get_running_loop()
+        with self._lock:
+            self._drop_closed_loop_clients()
+            if loop in self._clients:
+                return self._clients[loop][0]
+
+            logger.debug("Creating: %s", self.name)
+            client = self._create()
+            # The loop only keeps a weak reference to its async generators
+            closer = self._closer(loop, client)
+            self._clients[loop] = client, closer
+
+        # Registers the closer with the loop; it runs up to its `yield`
+        await anext(closer)
+        return client
+
+    # Closes the client of the running event loop
+    async def aclose(self) -> None:
+        with self._lock:
+            _, closer = self._clients.get(get_running_loop(), (None, None))
+        if closer is not None:
+            await closer.aclose()
+
+    async def _closer(
+        self, loop: AbstractEventLoop, client: T
+    ) -> AsyncIterator[None]:
+        try:
+            yield
+        finally:
+            with self._lock:
+                if self._clients.get(loop, (None,))[0] is client:
+                    del self._clients[loop]
+
+            logger.debug("Closing: %s", self.name)
+            await self._close(client)
+
+    def _drop_closed_loop_clients(self) -> None:
+        # Loops closed without shutting down their async generators (i.e. not
+        # through `asyncio.run`) leave a client that can no longer be closed
+        for loop in [loop for loop in self._clients if loop.is_closed()]:
+            logger.warning(
+                "Dropping: %s of a Closed Event Loop", self.name
+            )
+            del self._clients[loop]
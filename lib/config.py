@@ -1,6 +1,8 @@
 from math import ceil
+from typing import Literal, Optional
 
 from lib.log import logger
+from lib.types import ModelProvider
 
 
 class DeepResearchHyperParameters:
@@ -20,7 +22,7 @@ class DeepResearchHyperParameters:
     def max_allowed_depth(self) -> int:
         return ceil(self.learning_width / 2)
 
-    def _cap_learning_depth(self, depth: int) -> None:
+    def _cap_learning_depth(self, depth: int) -> int:
         max_allowed_depth = self.max_allowed_depth
 
         if depth > max_allowed_depth:
@@ -30,9 +32,9 @@ class DeepResearchHyperParameters:
                 self.learning_width,
                 max_allowed_depth,
             )
-            self._learning_depth = max_allowed_depth
-        else:
-            self._learning_depth = depth
+            return max_allowed_depth
+
+        return depth
 
     def calculate_width_for_depth(self, depth: int) -> int:
         return ceil(self.learning_width / 2**depth)
@@ -45,3 +47,339 @@ class DeepResearchHyperParameters:
             f"learning_width={self.learning_width}, "
             f"learning_depth={self.learning_depth})"
         )
+
+
+class DeepResearchConcurrencyParameters:
+    def __init__(
+        self,
+        max_workers: int = 8,
+        max_in_flight_per_provider: Optional[
+            dict[ModelProvider | str, int]
+        ] = None,
+    ):
+        if max_workers < 1:
+            raise ValueError("Invalid: max_workers (must be >= 1)")
+
+        self.max_workers = max_workers
+        self.max_in_flight_per_provider = max_in_flight_per_provider or {}
+
+    def __repr__(self):
+        return (
+            "DeepResearchConcurrencyParameters("
+            f"max_workers={self.max_workers}, "
+            f"max_in_flight_per_provider={self.max_in_flight_per_provider})"
+        )
+
+
+class DeepResearchTokenBudgetParameters:
+    def __init__(
+        self,
+        context_window_fraction: float = 0.5,
+        reserved_completion_tokens: int = 8_192,
+        min_item_tokens: int = 256,
+    ):
+        if not 0 < context_window_fraction <= 1:
+            raise ValueError(
+                "Invalid: context_window_fraction (must be in (0, 1])"
+            )
+
+        self.context_window_fraction = context_window_fraction
+        self.reserved_completion_tokens = reserved_completion_tokens
+        self.min_item_tokens = min_item_tokens
+
+    def __repr__(self):
+        return (
+            "DeepResearchTokenBudgetParameters("
+            f"context_window_fraction={self.context_window_fraction}, "
+            f"reserved_completion_tokens={self.reserved_completion_tokens}, "
+            f"min_item_tokens={self.min_item_tokens})"
+        )
+
+
+class DeepResearchBatchParameters:
+    def __init__(
+        self,
+        poll_interval_s: float = 30.0,
+        max_wait_s: float = 24 * 60 * 60,
+        completion_window: str = "24h",
+    ):
+        if poll_interval_s <= 0:
+            raise ValueError("Invalid: poll_interval_s (must be > 0)")
+
+        self.poll_interval_s = poll_interval_s
+        self.max_wait_s = max_wait_s
+        self.completion_window = completion_window
+
+    def __repr__(self):
+        return (
+            "DeepResearchBatchParameters("
+            f"poll_interval_s={self.poll_interval_s}, "
+            f"max_wait_s={self.max_wait_s}, "
+            f"completion_window={self.completion_window})"
+        )
+
+
+class DeepResearchSchedulerParameters:
+    def __init__(
+        self,
+        max_cost_dollars: Optional[float] = None,
+        deadline_s: Optional[float] = None,
+        report_reserve_fraction: float = 0.1,
+        depth_weight: float = 1.0,
+        novelty_weight: float = 1.0,
+        cost_weight: float = 0.5,
+    ):
+        if max_cost_dollars is None and deadline_s is None:
+            raise ValueError("Required: max_cost_dollars or deadline_s")
+        if max_cost_dollars is not None and max_cost_dollars <= 0:
+            raise ValueError("Invalid: max_cost_dollars (must be > 0)")
+        if deadline_s is not None and deadline_s <= 0:
+            raise ValueError("Invalid: deadline_s (must be > 0)")
+        if not 0 <= report_reserve_fraction < 1:
+            raise ValueError(
+                "Invalid: report_reserve_fraction (must be in [0, 1))"
+            )
+
+        self.max_cost_dollars = max_cost_dollars
+        self.deadline_s = deadline_s
+        # Held back from both limits so that the report can still be written
+        self.report_reserve_fraction = report_reserve_fraction
+        self.depth_weight = depth_weight
+        self.novelty_weight = novelty_weight
+        self.cost_weight = cost_weight
+
+    def __repr__(self):
+        return (
+            "DeepResearchSchedulerParameters("
+            f"max_cost_dollars={self.max_cost_dollars}, "
+            f"deadline_s={self.deadline_s}, "
+            f"report_reserve_fraction={self.report_reserve_fraction}, "
+            f"depth_weight={self.depth_weight}, "
+            f"novelty_weight={self.novelty_weight}, "
+            f"cost_weight={self.cost_weight})"
+        )
+
+
+class DeepResearchLearningParameters:
+    def __init__(
+        self,
+        report_top_k: Optional[int] = None,
+        follow_up_top_k: Optional[int] = None,
+        min_branch_novelty: Optional[float] = None,
+        bm25_k1: float = 1.5,
+        bm25_b: float = 0.75,
+    ):
+        if report_top_k is not None and report_top_k < 1:
+            raise ValueError("Invalid: report_top_k (must be >= 1)")
+        if follow_up_top_k is not None and follow_up_top_k < 1:
+            raise ValueError("Invalid: follow_up_top_k (must be >= 1)")
+        if min_branch_novelty is not None and not 0 < min_branch_novelty <= 1:
+            raise ValueError("Invalid: min_branch_novelty (must be in (0, 1])")
+        if not 0 <= bm25_b <= 1:
+            raise ValueError("Invalid: bm25_b (must be in [0, 1])")
+
+        # Learnings most relevant to the user query (None: all that fit)
+        self.report_top_k = report_top_k
+        # Ancestor learnings most relevant to a branch (None: all that fit)
+        self.follow_up_top_k = follow_up_top_k
+        # Branches whose learning is less novel than this are not expanded
+        self.min_branch_novelty = min_branch_novelty
+        self.bm25_k1 = bm25_k1
+        self.bm25_b = bm25_b
+
+    def __repr__(self):
+        return (
+            "DeepResearchLearningParameters("
+            f"report_top_k={self.report_top_k}, "
+            f"follow_up_top_k={self.follow_up_top_k}, "
+            f"min_branch_novelty={self.min_branch_novelty}, "
+            f"bm25_k1={self.bm25_k1}, "
+            f"bm25_b={self.bm25_b})"
+        )
+
+
+class LLMHedgingParameters:
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        window_size: int = 200,
+        min_samples: int = 20,
+        min_delay_s: float = 1.0,
+        max_in_flight_hedges: int = 8,
+        max_workers: int = 64,
+    ):
+        if not 0 < percentile < 1:
+            raise ValueError("Invalid: percentile (must be in (0, 1))")
+        if min_samples < 1 or window_size < min_samples:
+            raise ValueError(
+                "Invalid: min_samples (must be in [1, window_size])"
+            )
+        if max_in_flight_hedges < 1:
+            raise ValueError("Invalid: max_in_flight_hedges (must be >= 1)")
+        if max_workers < 2:
+            raise ValueError("Invalid: max_workers (must be >= 2)")
+
+        # A backup is sent once a call outlives this percentile of the
+        # recent latencies of its stage (and at least `min_delay_s`)
+        self.percentile = percentile
+        self.window_size = window_size
+        self.min_samples = min_samples
+        self.min_delay_s = min_delay_s
+        # Bounds the extra load (and spend) hedging can add at once
+        self.max_in_flight_hedges = max_in_flight_hedges
+        self.max_workers = max_workers
+
+    def __repr__(self):
+        return (
+            "LLMHedgingParameters("
+            f"percentile={self.percentile}, "
+            f"window_size={self.window_size}, "
+            f"min_samples={self.min_samples}, "
+            f"min_delay_s={self.min_delay_s}, "
+            f"max_in_flight_hedges={self.max_in_flight_hedges}, "
+            f"max_workers={self.max_workers})"
+        )
+
+
+class GeminiContextCacheParameters:
+    def __init__(
+        self,
+        ttl_s: float = 600.0,
+        refresh_before_s: float = 120.0,
+        min_cached_tokens: int = 4_096,
+        min_context_hits: int = 2,
+        max_handles: int = 32,
+    ):
+        if ttl_s <= 0:
+            raise ValueError("Invalid: ttl_s (must be > 0)")
+        if not 0 <= refresh_before_s < ttl_s:
+            raise ValueError(
+                "Invalid: refresh_before_s (must be in [0, ttl_s))"
+            )
+        if min_cached_tokens < 1:
+            raise ValueError("Invalid: min_cached_tokens (must be >= 1)")
+        if min_context_hits < 1:
+            raise ValueError("Invalid: min_context_hits (must be >= 1)")
+        if max_handles < 1:
+            raise ValueError("Invalid: max_handles (must be >= 1)")
+
+        # Handles expire on the provider after `ttl_s` unless used within
+        # `refresh_before_s` of expiring, so a crashed run leaves no storage
+        # bill behind for long
+        self.ttl_s = ttl_s
+        self.refresh_before_s = refresh_before_s
+        # Below the provider's minimum, caching is refused (and storage would
+        # outweigh the savings anyway)
+        self.min_cached_tokens = min_cached_tokens
+        # Times a shared context must recur before it is cached
+        self.min_context_hits = min_context_hits
+        self.max_handles = max_handles
+
+    def __repr__(self):
+        return (
+            "GeminiContextCacheParameters("
+            f"ttl_s={self.ttl_s}, "
+            f"refresh_before_s={self.refresh_before_s}, "
+            f"min_cached_tokens={self.min_cached_tokens}, "
+            f"min_context_hits={self.min_context_hits}, "
+            f"max_handles={self.max_handles})"
+        )
+
+
+class PageFetchParameters:
+    def __init__(
+        self,
+        max_workers: int = 16,
+        max_per_host: int = 4,
+        max_page_bytes: int = 2 * 2**20,
+        max_text_chars: int = 100_000,
+        chunk_bytes: int = 16_384,
+        user_agent: str = "deep-researcher/0.1",
+    ):
+        if max_workers < 1:
+            raise ValueError("Invalid: max_workers (must be >= 1)")
+        if not 1 <= max_per_host <= max_workers:
+            raise ValueError(
+                "Invalid: max_per_host (must be in [1, max_workers])"
+            )
+        if max_page_bytes < 1:
+            raise ValueError("Invalid: max_page_bytes (must be >= 1)")
+        if max_text_chars < 1:
+            raise ValueError("Invalid: max_text_chars (must be >= 1)")
+        if chunk_bytes < 1:
+            raise ValueError("Invalid: chunk_bytes (must be >= 1)")
+
+        self.max_workers = max_workers
+        # Keeps a batch of links to one site from hammering it (or tripping
+        # its rate limits)
+        self.max_per_host = max_per_host
+        # Bodies are read until either cap is reached; the rest of the page
+        # is never downloaded
+        self.max_page_bytes = max_page_bytes
+        self.max_text_chars = max_text_chars
+        self.chunk_bytes = chunk_bytes
+        self.user_agent = user_agent
+
+    def __repr__(self):
+        return (
+            "PageFetchParameters("
+            f"max_workers={self.max_workers}, "
+            f"max_per_host={self.max_per_host}, "
+            f"max_page_bytes={self.max_page_bytes}, "
+            f"max_text_chars={self.max_text_chars}, "
+            f"chunk_bytes={self.chunk_bytes}, "
+            f"user_agent={self.user_agent})"
+        )
+
+
+class FakeProviderParameters:
+    def __init__(
+        self,
+        latency_distribution: Literal[
+            "constant", "uniform", "lognormal"
+        ] = "lognormal",
+        mean_latency_s: float = 0.05,
+        latency_spread: float = 0.5,
+        payload_chars: int = 2_000,
+        input_tokens: Optional[int] = None,
+        cached_input_tokens: int = 0,
+        completion_tokens: int = 200,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        if mean_latency_s < 0:
+            raise ValueError("Invalid: mean_latency_s (must be >= 0)")
+        if latency_spread < 0:
+            raise ValueError("Invalid: latency_spread (must be >= 0)")
+        if latency_distribution == "uniform" and latency_spread > 1:
+            raise ValueError(
+                "Invalid: latency_spread (must be <= 1 for uniform latency)"
+            )
+        if not 0 <= failure_rate <= 1:
+            raise ValueError("Invalid: failure_rate (must be in [0, 1])")
+
+        self.latency_distribution = latency_distribution
+        self.mean_latency_s = mean_latency_s
+        # Uniform: +/- fraction of the mean; lognormal: sigma of the log
+        self.latency_spread = latency_spread
+        self.payload_chars = payload_chars
+        # Estimated from the prompt length when not set
+        self.input_tokens = input_tokens
+        self.cached_input_tokens = cached_input_tokens
+        self.completion_tokens = completion_tokens
+        self.failure_rate = failure_rate
+        self.seed = seed
+
+    def __repr__(self):
+        return (
+            "FakeProviderParameters("
+            f"latency_distribution={self.latency_distribution}, "
+            f"mean_latency_s={self.mean_latency_s}, "
+            f"latency_spread={self.latency_spread}, "
+            f"payload_chars={self.payload_chars}, "
+            f"input_tokens={self.input_tokens}, "
+            f"cached_input_tokens={self.cached_input_tokens}, "
+            f"completion_tokens={self.completion_tokens}, "
+            f"failure_rate={self.failure_rate}, "
+            f"seed={self.seed})"
+        )
@@ -57,6 +57,7 @@ class LLMIdentifier(Enum):
         cpm_non_cached_input_tokens_dollars=0.10,
         cpm_cached_input_tokens_dollars=0.025,
         cpm_completion_tokens_dollars=0.40,
+        cpm_cache_storage_dollars_per_hour=1.00,
     )
     GEMINI_2_0_FLASH_LITE = ModelParameters(
         model_identifier="gemini-2.0-flash-lite",
@@ -65,4 +66,5 @@ class LLMIdentifier(Enum):
         cpm_non_cached_input_tokens_dollars=0.075,
         cpm_cached_input_tokens_dollars=0.30,
         cpm_completion_tokens_dollars=0.40,
+        cpm_cache_storage_dollars_per_hour=1.00,
     )
@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+from hashlib import blake2b
+from os.path import commonprefix
+from threading import Lock
+from time import time
+from typing import TYPE_CHECKING, Optional
+
+from lib.analytics import Analytics
+from lib.config import GeminiContextCacheParameters
+from lib.constants import LLMIdentifier
+from lib.log import logger
+from lib.models.context_cache import CachedContextHandle
+from lib.tokens import TokenCounter
+
+if TYPE_CHECKING:
+    from google.genai import Client
+    from google.genai.types import CachedContent, Tool
+
+# Cached contexts end at a paragraph break, never mid-sentence
+CONTEXT_SEPARATOR = "\n\n"
+
+
+def shared_context(prompt: str, previous_prompt: str) -> str:
+    prefix = commonprefix([prompt, previous_prompt])
+    return prefix[: prefix.rfind(CONTEXT_SEPARATOR) + len(CONTEXT_SEPARATOR)]
+
+
+# Explicit context caching for Gemini. The stable prefix of a request (system
+# instruction, tools and the leading context its prompt shares with earlier
+# prompts of the same scope) is stored once as a cached-content handle and
+# referenced by name; its tokens are then billed at the cached input rate
+# plus storage. Handles are refreshed while in use and deleted on `close`.
+class GeminiContextCache:
+    def __init__(
+        self,
+        llm_instance: Client,
+        parameters: Optional[GeminiContextCacheParameters] = None,
+        analytics_instance: Optional[Analytics] = None,
+    ):
+        self.llm_instance = llm_instance
+        self.parameters = parameters or GeminiContextCacheParameters()
+        self.analytics_instance = analytics_instance
+
+        # Handles per (model, system instruction, tools)
+        self._handles: dict[str, list[CachedContextHandle]] = {}
+        self._context_hits: dict[str, int] = {}
+        # Contexts the provider refused to cache (e.g. below its minimum)
+        self._uncacheable: set[str] = set()
+        self._previous_prompts: dict[str, str] = {}
+        self._creation_locks: dict[str, Lock] = {}
+        self._lock = Lock()
+
+        self.handles_created: int = 0
+        self.handles_refreshed: int = 0
+        self.handles_deleted: int = 0
+        self.cached_requests: int = 0
+
+    def __repr__(self):
+        return (
+            f"GeminiContextCache(handles={self.num_handles}, "
+            f"parameters={self.parameters})"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def num_handles(self) -> int:
+        with self._lock:
+            return sum(len(handles) for handles in self._handles.values())
+
+    # Returns the handle to reference (if any) and the rest of the prompt to
+    # send. Prompts are only split within a `scope` (e.g. one response type);
+    # without one, only the system instruction and tools are cached.
+    def cached_request(
+        self,
+        llm_identifier: LLMIdentifier,
+        prompt: str,
+        system_instruction: Optional[str] = None,
+        tools: Optional[list[Tool]] = None,
+        scope: Optional[str] = None,
+    ) -> tuple[Optional[str], str]:
+        base_key = _hash(
+            llm_identifier.name, system_instruction or "", repr(tools or [])
+        )
+
+        context = self._shared_context(scope, prompt) if scope else ""
+        handle = self._find_handle(base_key, prompt)
+        # A longer shared context replaces a shorter handle once cached
+        if handle is None or len(handle.context) < len(context):
+            handle = (
+                self._create_handle(
+                    base_key=base_key,
+                    llm_identifier=llm_identifier,
+                    system_instruction=system_instruction,
+                    context=context,
+                    tools=tools,
+                )
+                or handle
+            )
+
+        if handle is None:
+            return None, prompt
+
+        with self._lock:
+            self.cached_requests += 1
+        return handle.name, prompt[len(handle.context) :]
+
+    # Whether a request failed because its handle is gone (e.g. expired
+    # early); such handles are dropped and the request is resent uncached
+    def is_stale(self, name: Optional[str], error: Exception) -> bool:
+        if name is None or getattr(error, "code", None) not in (403, 404):
+            return False
+
+        self.invalidate(name)
+        return True
+
+    def invalidate(self, name: str) -> None:
+        with self._lock:
+            for base_key, handles in self._handles.items():
+                self._handles[base_key] = [
+                    handle for handle in handles if handle.name != name
+                ]
+
+        logger.warning("Context Cache: Invalidated %s", name)
+
+    def close(self) -> None:
+        with self._lock:
+            handles = [
+                handle
+                for base_handles in self._handles.values()
+                for handle in base_handles
+            ]
+            self._handles.clear()
+
+        for handle in handles:
+            self._delete_handle(handle)
+
+        if handles:
+            logger.info(
+                "Context Cache: Closed (Deleted: %d Handles, Cached "
+                "Requests: %d)",
+                len(handles),
+                self.cached_requests,
+            )
+
+    def _find_handle(
+        self, base_key: str, prompt: str
+    ) -> Optional[CachedContextHandle]:
+        now_s = time()
+        with self._lock:
+            # Handles the provider has already expired are dropped
+            handles = self._handles[base_key] = [
+                handle
+                for handle in self._handles.get(base_key, [])
+                if handle.expire_time_s > now_s
+            ]
+            matches = [
+                handle
+                for handle in handles
+                # The request must still carry some contents
+                if prompt.startswith(handle.context)
+                and prompt[len(handle.context) :].strip()
+            ]
+            if not matches:
+                return None
+
+            handle = max(matches, key=lambda handle: len(handle.context))
+            handle.last_used_time_s = now_s
+            refresh = (
+                handle.expire_time_s - now_s < self.parameters.refresh_before_s
+            )
+
+        if refresh:
+            self._refresh_handle(handle)
+
+        return handle
+
+    def _shared_context(self, scope: str, prompt: str) -> str:
+        with self._lock:
+            previous_prompt = self._previous_prompts.get(scope)
+            self._previous_prompts[scope] = prompt
+
+        if previous_prompt is None:
+            return ""
+
+        context = shared_context(prompt, previous_prompt)
+        return context if prompt[len(context) :].strip() else ""
+
+    def _create_handle(
+        self,
+        base_key: str,
+        llm_identifier: LLMIdentifier,
+        system_instruction: Optional[str],
+        context: str,
+        tools: Optional[list[Tool]],
+    ) -> Optional[CachedContextHandle]:
+        num_tokens = TokenCounter(llm_identifier).count(
+            (system_instruction or "") + context
+        )
+        if num_tokens < self.parameters.min_cached_tokens:
+            return None
+
+        key = _hash(base_key, context)
+        with self._lock:
+            if key in self._uncacheable:
+                return None
+
+            self._context_hits[key] = self._context_hits.get(key, 0) + 1
+            if self._context_hits[key] < self.parameters.min_context_hits:
+                return None
+
+            creation_lock = self._creation_locks.setdefault(key, Lock())
+
+        with creation_lock:
+            # Created by another thread in the meantime
+            with self._lock:
+                for handle in self._handles.get(base_key, []):
+                    if handle.context == context:
+                        return handle
+
+            self._evict_handles()
+            try:
+                cached_content = self.llm_instance.caches.create(
+                    model=llm_identifier.value.model_identifier,
+                    config={
+                        "system_instruction": system_instruction,
+                        "contents": [context] if context else None,
+                        "tools": tools,
+                        "ttl": f"{self.parameters.ttl_s:.0f}s",
+                    },
+                )
+            except Exception as error:
+                logger.warning("Context Cache: Create Failed: %r", error)
+                with self._lock:
+                    self._uncacheable.add(key)
+                return None
+
+            handle = CachedContextHandle(
+                name=cached_content.name,
+                llm_identifier=llm_identifier,
+                context=context,
+                num_tokens=(
+                    cached_content.usage_metadata.total_token_count
+                    if cached_content.usage_metadata
+                    and cached_content.usage_metadata.total_token_count
+                    else num_tokens
+                ),
+                expire_time_s=self._expire_time_s(cached_content),
+                last_used_time_s=time(),
+            )
+            with self._lock:
+                self._handles.setdefault(base_key, []).append(handle)
+                self.handles_created += 1
+
+        logger.info(
+            "Context Cache: Created %s (%d Tokens)",
+            handle.name,
+            handle.num_tokens,
+        )
+        self._record_storage(
+            handle, storage_s=handle.expire_time_s - time(), created=True
+        )
+        return handle
+
+    def _refresh_handle(self, handle: CachedContextHandle) -> None:
+        try:
+            cached_content = self.llm_instance.caches.update(
+                name=handle.name,
+                config={"ttl": f"{self.parameters.ttl_s:.0f}s"},
+            )
+        except Exception as error:
+            logger.warning(
+                "Context Cache: Refresh Failed (%s): %r", handle.name, error
+            )
+            return
+
+        expire_time_s = self._expire_time_s(cached_content)
+        with self._lock:
+            storage_s = expire_time_s - handle.expire_time_s
+            handle.expire_time_s = expire_time_s
+            self.handles_refreshed += 1
+
+        logger.debug("Context Cache: Refreshed %s", handle.name)
+        self._record_storage(handle, storage_s=storage_s)
+
+    def _evict_handles(self) -> None:
+        with self._lock:
+            handles = [
+                handle
+                for base_handles in self._handles.values()
+                for handle in base_handles
+            ]
+            if len(handles) < self.parameters.max_handles:
+                return
+
+            evicted = min(handles, key=lambda handle: handle.last_used_time_s)
+            for base_handles in self._handles.values():
+                if evicted in base_handles:
+                    base_handles.remove(evicted)
+
+        logger.debug("Context Cache: Evicting %s", evicted.name)
+        self._delete_handle(evicted)
+
+    def _delete_handle(self, handle: CachedContextHandle) -> None:
+        try:
+            self.llm_instance.caches.delete(name=handle.name)
+        except Exception as error:
+            # Expires on its own after the TTL
+            logger.warning(
+                "Context Cache: Delete Failed (%s): %r", handle.name, error
+            )
+            return
+
+        with self._lock:
+            self.handles_deleted += 1
+
+        # The unused part of the TTL is not billed
+        self._record_storage(
+            handle, storage_s=-max(handle.expire_time_s - time(), 0.0)
+        )
+
+    def _record_storage(
+        self,
+        handle: CachedContextHandle,
+        storage_s: float,
+        created: bool = False,
+    ) -> None:
+        if self.analytics_instance:
+            self.analytics_instance.update_context_cache_stats(
+                llm_model=handle.llm_identifier,
+                num_tokens=handle.num_tokens,
+                storage_s=storage_s,
+                created=created,
+            )
+
+    def _expire_time_s(self, cached_content: CachedContent) -> float:
+        if cached_content.expire_time is None:
+            return time() + self.parameters.ttl_s
+
+        return cached_content.expire_time.timestamp()
+
+
+def _hash(*parts: str) -> str:
+    digest = blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+
+    return digest.hexdigest()
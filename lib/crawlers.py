@@ -1,32 +1,92 @@
+from __future__ import annotations
+
 from abc import ABC, abstractmethod
+from asyncio import to_thread
 from os import getenv
 from re import sub as re_sub
-from typing import Literal, Optional
-
-from google.genai import Client
-from google.genai.types import (
-    GenerateContentConfig,
-    GenerateContentResponseUsageMetadata,
-    GoogleSearch,
-    Tool,
-)
-from openai import OpenAI
-from openai.types import CompletionUsage
-from requests import post as rpost
+from threading import Lock
+from typing import TYPE_CHECKING, Callable, Literal, Optional
 
+from lib.clients import (
+    loop_local_async_openai_clients,
+    openai_timeout_errors,
+)
 from lib.constants import LLMIdentifier
 from lib.log import logger
-from lib.models.crawler import SERPQuerySearchResult, SERPQuerySearchResults
+from lib.models.crawler import (
+    FetchedPage,
+    SERPQuerySearchResult,
+    SERPQuerySearchResults,
+)
+from lib.sdk import is_gemini_client, is_openai_client
 from lib.types import ModelProvider
 
+# Provider SDKs (and the HTTP stack) are imported by the plugins that use them
+if TYPE_CHECKING:
+    from google.genai import Client
+    from google.genai.types import GenerateContentResponseUsageMetadata, Tool
+    from openai import AsyncOpenAI, OpenAI
+    from openai.types import CompletionUsage
+
+    from lib.context_cache import GeminiContextCache
+    from lib.fetcher import PageFetcher
+    from lib.transport import HTTPTransport
+
+
+# Guards the lazy creation of page fetchers
+_PAGE_FETCHER_LOCK = Lock()
+
 
 class Crawler(ABC):
+    # Created on the first crawl unless a plugin sets one (e.g. to share a
+    # fetcher, and its page cache, between crawlers)
+    _page_fetcher: Optional[PageFetcher] = None
+
     @abstractmethod
     def search(self, query: str) -> SERPQuerySearchResults: ...
 
-    @abstractmethod
+    # Plugins without a native async client fall back to a worker thread.
+    async def asearch(self, query: str) -> SERPQuerySearchResults:
+        return await to_thread(self.search, query)
+
+    # Links (e.g. of promising search results) are fetched directly rather
+    # than through a search API, which may bill per scraped page
+    @property
+    def page_fetcher(self) -> PageFetcher:
+        if self._page_fetcher is None:
+            from lib.fetcher import PageFetcher
+
+            with _PAGE_FETCHER_LOCK:
+                if self._page_fetcher is None:
+                    logger.debug("Creating: Page Fetcher")
+                    self._page_fetcher = PageFetcher()
+
+        return self._page_fetcher
+
     def crawl(self, link: str) -> str:
-        raise NotImplementedError("Unsupported Operation")
+        logger.info("Crawling Link: %s", link)
+        return _page_content(self.page_fetcher.fetch(link))
+
+    async def acrawl(self, link: str) -> str:
+        logger.info("Crawling Link (Async): %s", link)
+        return _page_content(await self.page_fetcher.afetch(link))
+
+    # Links that could not be fetched are left out
+    def crawl_many(self, links: list[str]) -> dict[str, str]:
+        logger.info("Crawling Links: %d", len(links))
+        return _page_contents(self.page_fetcher.fetch_many(links))
+
+    async def acrawl_many(self, links: list[str]) -> dict[str, str]:
+        logger.info("Crawling Links (Async): %d", len(links))
+        return _page_contents(await self.page_fetcher.afetch_many(links))
+
+    def close(self) -> None:
+        if self._page_fetcher is not None:
+            self._page_fetcher.close()
+
+    async def aclose(self) -> None:
+        if self._page_fetcher is not None:
+            await self._page_fetcher.aclose()
 
 
 class LLMCrawler(ABC):
@@ -36,16 +96,16 @@ class LLMCrawler(ABC):
         llm_instance: OpenAI | Client,
         search_context_size: Optional[Literal["low", "medium", "high"]] = None,
     ):
-        if isinstance(llm_instance, OpenAI) and not search_context_size:
+        if is_openai_client(llm_instance) and not search_context_size:
             raise ValueError(
                 "Required: search_context_size (OpenAI-based web search)"
             )
 
         if (
-            isinstance(llm_instance, OpenAI)
+            is_openai_client(llm_instance)
             and llm_identifier.value.model_provider != ModelProvider.OPENAI
         ) or (
-            isinstance(llm_instance, Client)
+            is_gemini_client(llm_instance)
             and llm_identifier.value.model_provider != ModelProvider.GOOGLE
         ):
             raise ValueError("Mismatch: LLM Model Provider and LLM Instance")
@@ -60,17 +120,59 @@ class LLMCrawler(ABC):
         CompletionUsage | GenerateContentResponseUsageMetadata,
     ]: ...
 
+    # Plugins without a native async client fall back to a worker thread.
+    async def asearch(self, query: str) -> tuple[
+        SERPQuerySearchResults | str,
+        CompletionUsage | GenerateContentResponseUsageMetadata,
+    ]:
+        return await to_thread(self.search, query)
+
 
 class FirecrawlCrawler(Crawler):
-    def __init__(self, crawl_limit: int = 3):
+    def __init__(
+        self,
+        crawl_limit: int = 3,
+        transport: Optional[HTTPTransport] = None,
+        search_url: str = "https://api.firecrawl.dev/v1/search",
+        page_fetcher: Optional[PageFetcher] = None,
+    ):
+        from lib.transport import HTTPTransport
+
         self.crawl_limit = crawl_limit
+        # Pass one transport to several crawlers to share its connection pool
+        self.transport = transport or HTTPTransport()
+        self._page_fetcher = page_fetcher
 
-        self.SEARCH_URL = "https://api.firecrawl.dev/v1/search"
+        self.SEARCH_URL = search_url
         self._APIK_KEY = getenv("FIRECRAWL_API_KEY")
 
     def search(self, query: str) -> SERPQuerySearchResults:
         logger.info("Searching Query: %s", query)
 
+        headers, data = self._build_request(query)
+        response = self.transport.post(self.SEARCH_URL, headers=headers, json=data)
+
+        return self._parse_response(response.status_code, response.json)
+
+    async def asearch(self, query: str) -> SERPQuerySearchResults:
+        logger.info("Searching Query (Async): %s", query)
+
+        headers, data = self._build_request(query)
+        response = await self.transport.apost(
+            self.SEARCH_URL, headers=headers, json=data
+        )
+
+        return self._parse_response(response.status_code, response.json)
+
+    def close(self) -> None:
+        self.transport.close()
+        super().close()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+        await super().aclose()
+
+    def _build_request(self, query: str) -> tuple[dict, dict]:
         headers = {
             "Authorization": f"Bearer {self._APIK_KEY}",
             "Content-Type": "application/json",
@@ -82,13 +184,14 @@ class FirecrawlCrawler(Crawler):
             "scrapeOptions": {"formats": ["markdown"]},
         }
 
-        response = rpost(
-            self.SEARCH_URL, headers=headers, json=data, timeout=60000
-        )
+        return headers, data
 
-        logger.info("Response Code: %d", response.status_code)
+    def _parse_response(
+        self, status_code: int, json: Callable[[], dict]
+    ) -> SERPQuerySearchResults:
+        logger.info("Response Code: %d", status_code)
 
-        if response.status_code == 200:
+        if status_code == 200:
             return SERPQuerySearchResults(
                 search_results=[
                     SERPQuerySearchResult(
@@ -97,18 +200,21 @@ class FirecrawlCrawler(Crawler):
                         content=self._clean_text(result["markdown"]),
                         url=result["url"],
                     )
-                    for result in response.json()["data"]
+                    for result in json()["data"]
                 ]
             )
 
-        if response.status_code == 408:
+        if status_code == 408:
             logger.error("Firecrawl: Request Timeout")
             raise RuntimeError("Rate Limit Exceeded")
 
-        if response.status_code == 500:
+        if status_code == 500:
             logger.error("Firecrawl: Internal Server Error")
             raise RuntimeError("Internal Server Error")
 
+        logger.error("Firecrawl: Unexpected Response Code %d", status_code)
+        raise RuntimeError(f"Unexpected Response Code: {status_code}")
+
     def _clean_text(self, text: str) -> str:
         # Non-ASCII
         text = re_sub(r"[^\x00-\x7F]+", "", text)
@@ -125,9 +231,25 @@ class OpenAISearchCrawler(LLMCrawler):
         llm_identifier: LLMIdentifier,
         llm_instance: OpenAI,
         search_context_size: Literal["low", "medium", "high"],
+        async_llm_instance: Optional[AsyncOpenAI] = None,
+        request_timeout_s: Optional[float] = None,
     ):
         super().__init__(llm_identifier, llm_instance, search_context_size)
 
+        # Per-request timeout; defaults to the client's own (its `timeout`)
+        self.request_timeout_s = request_timeout_s
+        # A client passed in is used as is, on the caller's event loop
+        self.async_llm_instance = async_llm_instance
+        self._async_llm_instances = loop_local_async_openai_clients(
+            llm_instance
+        )
+
+    async def _async_llm_instance(self) -> AsyncOpenAI:
+        if self.async_llm_instance is not None:
+            return self.async_llm_instance
+
+        return await self._async_llm_instances.get()
+
     def search(
         self, query: str
     ) -> tuple[SERPQuerySearchResults | str, CompletionUsage]:
@@ -135,25 +257,53 @@ class OpenAISearchCrawler(LLMCrawler):
 
         try:
             response = self.llm_instance.responses.create(
-                model=self.llm_identifier.value.model_identifier,
-                tools=[
-                    {
-                        "type": "web_search_preview",
-                        "search_context_size": self.search_context_size,
-                    }
-                ],
-                input=query,
-                timeout=120000,
+                **self._build_request(query)
             )
-        except TimeoutError:
-            logger.error("OpenAI: Request Timeout for Query: %s", query)
-            logger.warning("Returning Empty Response")
-            return "", CompletionUsage(
-                completion_tokens=0, prompt_tokens=0, total_tokens=0
+        except openai_timeout_errors():
+            return self._timeout_response(query)
+
+        return response.output_text, response.usage
+
+    async def asearch(
+        self, query: str
+    ) -> tuple[SERPQuerySearchResults | str, CompletionUsage]:
+        logger.info("Searching Query (Async): %s", query)
+
+        async_llm_instance = await self._async_llm_instance()
+        try:
+            response = await async_llm_instance.responses.create(
+                **self._build_request(query)
             )
+        except openai_timeout_errors():
+            return self._timeout_response(query)
 
         return response.output_text, response.usage
 
+    def _build_request(self, query: str) -> dict:
+        request = {
+            "model": self.llm_identifier.value.model_identifier,
+            "tools": [
+                {
+                    "type": "web_search_preview",
+                    "search_context_size": self.search_context_size,
+                }
+            ],
+            "input": query,
+        }
+        if self.request_timeout_s is not None:
+            request["timeout"] = self.request_timeout_s
+
+        return request
+
+    def _timeout_response(self, query: str) -> tuple[str, CompletionUsage]:
+        from openai.types import CompletionUsage
+
+        logger.error("OpenAI: Request Timeout for Query: %s", query)
+        logger.warning("Returning Empty Response")
+        return "", CompletionUsage(
+            completion_tokens=0, prompt_tokens=0, total_tokens=0
+        )
+
 
 class GeminiSearchCrawler(LLMCrawler):
     def __init__(
@@ -161,9 +311,16 @@ class GeminiSearchCrawler(LLMCrawler):
         llm_identifier: LLMIdentifier,
         llm_instance: Client,
         search_context_size: Optional[Literal["low", "medium", "high"]] = None,
+        context_cache: Optional[GeminiContextCache] = None,
+        search_instruction: Optional[str] = None,
     ):
         super().__init__(llm_identifier, llm_instance, search_context_size)
 
+        # Searches only share the search tool and instruction, which are
+        # cached once they reach the cache's minimum size
+        self.context_cache = context_cache
+        self.search_instruction = search_instruction
+
     def search(
         self, query: str
     ) -> tuple[
@@ -171,13 +328,100 @@ class GeminiSearchCrawler(LLMCrawler):
     ]:
         logger.info("Searching Query: %s", query)
 
-        response = self.llm_instance.models.generate_content(
-            model=self.llm_identifier.value.model_identifier,
-            contents=query,
-            config=GenerateContentConfig(
-                tools=[Tool(google_search=GoogleSearch())],
-                response_modalities=["TEXT"],
-            ),
+        cached_content = self._cached_content(query)
+        try:
+            response = self.llm_instance.models.generate_content(
+                **self._build_request(query, cached_content)
+            )
+        except Exception as error:
+            if not self.context_cache or not self.context_cache.is_stale(
+                cached_content, error
+            ):
+                raise
+
+            response = self.llm_instance.models.generate_content(
+                **self._build_request(query)
+            )
+
+        return response.text, response.usage_metadata
+
+    async def asearch(
+        self, query: str
+    ) -> tuple[
+        SERPQuerySearchResults | str, GenerateContentResponseUsageMetadata
+    ]:
+        logger.info("Searching Query (Async): %s", query)
+
+        cached_content = (
+            await to_thread(self._cached_content, query)
+            if self.context_cache
+            else None
         )
+        try:
+            response = await self.llm_instance.aio.models.generate_content(
+                **self._build_request(query, cached_content)
+            )
+        except Exception as error:
+            if not self.context_cache or not self.context_cache.is_stale(
+                cached_content, error
+            ):
+                raise
+
+            response = await self.llm_instance.aio.models.generate_content(
+                **self._build_request(query)
+            )
 
         return response.text, response.usage_metadata
+
+    def _cached_content(self, query: str) -> Optional[str]:
+        if self.context_cache is None:
+            return None
+
+        cached_content, _ = self.context_cache.cached_request(
+            self.llm_identifier,
+            query,
+            system_instruction=self.search_instruction,
+            tools=self._tools(),
+        )
+        return cached_content
+
+    def _tools(self) -> list[Tool]:
+        from google.genai.types import GoogleSearch, Tool
+
+        return [Tool(google_search=GoogleSearch())]
+
+    # The tools and instruction of a cached-content handle must not be sent
+    # again with the request
+    def _build_request(
+        self, query: str, cached_content: Optional[str] = None
+    ) -> dict:
+        from google.genai.types import GenerateContentConfig
+
+        if cached_content:
+            config = GenerateContentConfig(
+                cached_content=cached_content, response_modalities=["TEXT"]
+            )
+        else:
+            config = GenerateContentConfig(
+                system_instruction=self.search_instruction,
+                tools=self._tools(),
+                response_modalities=["TEXT"],
+            )
+
+        return {
+            "model": self.llm_identifier.value.model_identifier,
+            "contents": query,
+            "config": config,
+        }
+
+
+def _page_content(page: FetchedPage) -> str:
+    if page.error is not None:
+        logger.error("Crawler: %s (%s)", page.error, page.url)
+        raise RuntimeError(page.error)
+
+    return page.content
+
+
+def _page_contents(pages: list[FetchedPage]) -> dict[str, str]:
+    return {page.url: page.content for page in pages if page.error is None}
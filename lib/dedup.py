@@ -0,0 +1,144 @@
+from hashlib import blake2b
+from random import Random
+from threading import Lock
+from typing import Optional
+
+from lib.cache import normalize_query
+from lib.log import logger
+
+# Words that carry no topical signal in search queries
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this "
+    "to vs was what when where which who why with".split()
+)
+# Mersenne prime used for the universal hash family of the permutations
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def query_terms(query: str) -> list[str]:
+    terms = []
+    for word in normalize_query(query).split():
+        if word in STOP_WORDS:
+            continue
+
+        # Light stemming so that "trend", "trends" and "trending" collide
+        for suffix in ("ing", "es", "ed", "s"):
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                word = word[: -len(suffix)]
+                break
+
+        terms.append(word)
+
+    return terms
+
+
+def query_shingles(query: str) -> frozenset[str]:
+    return frozenset(query_terms(query))
+
+
+def jaccard_similarity(a: frozenset[str], b: frozenset[str]) -> float:
+    if not a and not b:
+        return 1.0
+
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    def __init__(self, num_permutations: int = 64, seed: int = 0):
+        random = Random(seed)
+        self.num_permutations = num_permutations
+        self._permutations = [
+            (
+                random.randrange(1, _MERSENNE_PRIME),
+                random.randrange(0, _MERSENNE_PRIME),
+            )
+            for _ in range(num_permutations)
+        ]
+
+    def signature(self, shingles: frozenset[str]) -> tuple[int, ...]:
+        if not shingles:
+            return (_MERSENNE_PRIME,) * self.num_permutations
+
+        hashes = [
+            int.from_bytes(
+                blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big"
+            )
+            for shingle in shingles
+        ]
+        return tuple(
+            min((a * value + b) % _MERSENNE_PRIME for value in hashes)
+            for a, b in self._permutations
+        )
+
+
+class QueryRegistry:
+    def __init__(
+        self,
+        similarity_threshold: float = 0.6,
+        num_permutations: int = 64,
+        num_bands: int = 16,
+    ):
+        if num_permutations % num_bands:
+            raise ValueError(
+                "Invalid: num_bands (must divide num_permutations)"
+            )
+
+        self.similarity_threshold = similarity_threshold
+        self.num_bands = num_bands
+        self._rows_per_band = num_permutations // num_bands
+        self._min_hasher = MinHasher(num_permutations=num_permutations)
+
+        self._queries: list[str] = []
+        self._shingles: list[frozenset[str]] = []
+        self._buckets: list[dict[tuple[int, ...], list[int]]] = [
+            {} for _ in range(num_bands)
+        ]
+        self._lock = Lock()
+
+        self.duplicates_found: int = 0
+        self.searches_avoided: int = 0
+        self.llm_calls_avoided: int = 0
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def register(self, query: str) -> Optional[str]:
+        shingles = query_shingles(query)
+        signature = self._min_hasher.signature(shingles)
+        bands = [
+            signature[band * self._rows_per_band : (band + 1) * self._rows_per_band]
+            for band in range(self.num_bands)
+        ]
+
+        with self._lock:
+            # LSH only proposes candidates; they are confirmed against the
+            # exact Jaccard similarity of the shingle sets.
+            candidates = {
+                index
+                for band, band_hash in enumerate(bands)
+                for index in self._buckets[band].get(band_hash, ())
+            }
+            for index in sorted(candidates):
+                similarity = jaccard_similarity(shingles, self._shingles[index])
+                if similarity >= self.similarity_threshold:
+                    self.duplicates_found += 1
+                    logger.debug(
+                        "Query Registry: Duplicate (%.2f): %s ~ %s",
+                        similarity,
+                        query,
+                        self._queries[index],
+                    )
+                    return self._queries[index]
+
+            index = len(self._queries)
+            self._queries.append(query)
+            self._shingles.append(shingles)
+            for band, band_hash in enumerate(bands):
+                self._buckets[band].setdefault(band_hash, []).append(index)
+
+        return None
+
+    def record_avoided_calls(self, searches: int, llm_calls: int) -> None:
+        with self._lock:
+            self.searches_avoided += searches
+            self.llm_calls_avoided += llm_calls
@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+from asyncio import sleep as asleep
+from hashlib import sha256
+from importlib import import_module
+from math import ceil, log
+from random import Random
+from re import search as re_search
+from time import sleep
+from typing import TYPE_CHECKING, Optional
+
+from pydantic import BaseModel
+
+from lib.config import FakeProviderParameters
+from lib.constants import LLMIdentifier
+from lib.crawlers import Crawler
+from lib.llm import LLMModel
+from lib.log import logger
+from lib.models.crawler import SERPQuerySearchResult, SERPQuerySearchResults
+from lib.models.llm import (
+    Learning,
+    SERPQueries,
+    SERPQuery,
+    UserQueryRefinementQuestions,
+)
+from lib.types import ModelProvider
+
+if TYPE_CHECKING:
+    from google.genai.types import GenerateContentResponseUsageMetadata
+    from openai.types import CompletionUsage
+
+# Enough distinct words that generated queries do not collide in
+# `QueryRegistry` by chance
+FAKE_WORDS = (
+    "battery", "cathode", "anode", "electrolyte", "lithium", "sodium",
+    "silicon", "graphite", "cobalt", "nickel", "manganese", "supply",
+    "demand", "pricing", "capacity", "factory", "patent", "startup",
+    "funding", "regulation", "subsidy", "tariff", "export", "import",
+    "recycling", "mining", "refinery", "warranty", "safety", "thermal",
+    "density", "cycle", "charging", "grid", "storage", "vehicle", "fleet",
+    "retail", "insurance", "forecast", "survey", "benchmark", "emissions",
+    "carbon", "policy", "europe", "china", "india", "japan", "korea",
+    "brazil", "canada", "mexico", "africa", "quarterly", "annual",
+    "margin", "revenue", "valuation", "merger", "partnership", "licensing",
+    "pilot", "rollout",
+)
+# Roughly four characters per token
+CHARS_PER_TOKEN = 4
+
+
+def _fake_text(random: Random, num_chars: int) -> str:
+    words, length = [], 0
+    while length < num_chars:
+        word = random.choice(FAKE_WORDS)
+        words.append(word)
+        length += len(word) + 1
+
+    return " ".join(words)[:num_chars]
+
+
+def _requested_count(user_prompt: str, default: int = 3) -> int:
+    # Every list prompt asks for "a maximum of N" items
+    match = re_search(r"maximum of (\d+)", user_prompt)
+    return int(match.group(1)) if match else default
+
+
+# Latency, failures and payloads of in-process fake providers. Each call is
+# seeded from its inputs rather than from a shared generator, so a run is
+# reproducible regardless of how threads or tasks are scheduled.
+class FakeProvider:
+    def __init__(self, parameters: Optional[FakeProviderParameters] = None):
+        self.parameters = parameters or FakeProviderParameters()
+        # Payloads are slices of one corpus, so generating them is cheap
+        # next to the orchestration being measured.
+        self._corpus = _fake_text(
+            Random(self.parameters.seed), 2 * self.parameters.payload_chars
+        )
+
+    def __repr__(self):
+        return f"{type(self).__name__}(parameters={self.parameters})"
+
+    def _call_random(self, *keys: str) -> Random:
+        return Random(":".join((str(self.parameters.seed), *keys)))
+
+    def _sample_latency_s(self, random: Random) -> float:
+        mean_latency_s = self.parameters.mean_latency_s
+        spread = self.parameters.latency_spread
+
+        if mean_latency_s == 0 or self.parameters.latency_distribution == (
+            "constant"
+        ):
+            return mean_latency_s
+
+        if self.parameters.latency_distribution == "uniform":
+            return random.uniform(
+                mean_latency_s * (1 - spread), mean_latency_s * (1 + spread)
+            )
+
+        # Parameterized so that the mean (not the median) is `mean_latency_s`
+        return random.lognormvariate(
+            log(mean_latency_s) - spread**2 / 2, spread
+        )
+
+    def _sample_call(self, *keys: str) -> tuple[Random, float, bool]:
+        random = self._call_random(*keys)
+        latency_s = self._sample_latency_s(random)
+        failed = random.random() < self.parameters.failure_rate
+
+        return random, latency_s, failed
+
+    def _raise_failure(self, key: str) -> None:
+        logger.warning("%s: Injected Failure (%s)", type(self).__name__, key)
+        raise RuntimeError(f"Fake Provider Failure: {type(self).__name__}")
+
+    def _payload(self, random: Random) -> str:
+        offset = random.randrange(self.parameters.payload_chars + 1)
+        return self._corpus[offset : offset + self.parameters.payload_chars]
+
+
+class FakeLLMModel(FakeProvider, LLMModel):
+    def __init__(
+        self,
+        parameters: Optional[FakeProviderParameters] = None,
+        llm_identifier: LLMIdentifier = LLMIdentifier.GPT_4O_MINI,
+    ):
+        FakeProvider.__init__(self, parameters)
+        LLMModel.__init__(
+            self, llm_identifier=llm_identifier, llm_instance=None
+        )
+
+        # Loads the provider's SDK with the plugin, as the real plugins do,
+        # rather than on the first (timed) call
+        import_module(
+            "google.genai.types"
+            if llm_identifier.value.model_provider == ModelProvider.GOOGLE
+            else "openai.types"
+        )
+
+    def generate_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+    ) -> tuple[
+        BaseModel | str, CompletionUsage | GenerateContentResponseUsageMetadata
+    ]:
+        random, latency_s, failed = self._sample_call(
+            system_prompt, user_prompt
+        )
+        sleep(latency_s)
+        if failed:
+            self._raise_failure(user_prompt[:64])
+
+        return self._response(
+            random, system_prompt, user_prompt, response_format
+        )
+
+    async def agenerate_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+    ) -> tuple[
+        BaseModel | str, CompletionUsage | GenerateContentResponseUsageMetadata
+    ]:
+        random, latency_s, failed = self._sample_call(
+            system_prompt, user_prompt
+        )
+        await asleep(latency_s)
+        if failed:
+            self._raise_failure(user_prompt[:64])
+
+        return self._response(
+            random, system_prompt, user_prompt, response_format
+        )
+
+    def _response(
+        self,
+        random: Random,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel],
+    ) -> tuple[
+        BaseModel | str, CompletionUsage | GenerateContentResponseUsageMetadata
+    ]:
+        completion_chars = self.parameters.completion_tokens * CHARS_PER_TOKEN
+
+        if response_format is SERPQueries:
+            result = SERPQueries(
+                queries=[
+                    SERPQuery(
+                        query=" ".join(random.sample(FAKE_WORDS, 6)),
+                        research_goal=_fake_text(random, 200),
+                    )
+                    for _ in range(_requested_count(user_prompt))
+                ]
+            )
+        elif response_format is Learning:
+            result = Learning(
+                learning=_fake_text(random, completion_chars),
+                follow_up_queries=[
+                    " ".join(random.sample(FAKE_WORDS, 6)) for _ in range(2)
+                ],
+            )
+        elif response_format is UserQueryRefinementQuestions:
+            result = UserQueryRefinementQuestions(
+                questions=[
+                    _fake_text(random, 80)
+                    for _ in range(_requested_count(user_prompt))
+                ]
+            )
+        else:
+            result = _fake_text(random, completion_chars)
+
+        return result, self._usage(len(system_prompt) + len(user_prompt))
+
+    def _usage(
+        self, prompt_chars: int
+    ) -> CompletionUsage | GenerateContentResponseUsageMetadata:
+        input_tokens = self.parameters.input_tokens or ceil(
+            prompt_chars / CHARS_PER_TOKEN
+        )
+        cached_input_tokens = min(
+            self.parameters.cached_input_tokens, input_tokens
+        )
+        completion_tokens = self.parameters.completion_tokens
+
+        # Shaped like the provider's own usage, so analytics see no difference
+        if self.llm_identifier.value.model_provider == ModelProvider.GOOGLE:
+            from google.genai.types import GenerateContentResponseUsageMetadata
+
+            return GenerateContentResponseUsageMetadata(
+                prompt_token_count=input_tokens,
+                cached_content_token_count=cached_input_tokens,
+                candidates_token_count=completion_tokens,
+                total_token_count=input_tokens + completion_tokens,
+            )
+
+        from openai.types import CompletionUsage
+        from openai.types.completion_usage import PromptTokensDetails
+
+        return CompletionUsage(
+            prompt_tokens=input_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=input_tokens + completion_tokens,
+            prompt_tokens_details=PromptTokensDetails(
+                cached_tokens=cached_input_tokens
+            ),
+        )
+
+
+class FakeCrawler(FakeProvider, Crawler):
+    def __init__(
+        self,
+        parameters: Optional[FakeProviderParameters] = None,
+        results_per_search: int = 3,
+    ):
+        super().__init__(parameters)
+
+        self.results_per_search = results_per_search
+
+    def search(self, query: str) -> SERPQuerySearchResults:
+        random, latency_s, failed = self._sample_call("search", query)
+        sleep(latency_s)
+        if failed:
+            self._raise_failure(query)
+
+        return self._search_results(random, query)
+
+    async def asearch(self, query: str) -> SERPQuerySearchResults:
+        random, latency_s, failed = self._sample_call("search", query)
+        await asleep(latency_s)
+        if failed:
+            self._raise_failure(query)
+
+        return self._search_results(random, query)
+
+    def crawl(self, link: str) -> str:
+        random, latency_s, failed = self._sample_call("crawl", link)
+        sleep(latency_s)
+        if failed:
+            self._raise_failure(link)
+
+        return self._payload(random)
+
+    async def acrawl(self, link: str) -> str:
+        random, latency_s, failed = self._sample_call("crawl", link)
+        await asleep(latency_s)
+        if failed:
+            self._raise_failure(link)
+
+        return self._payload(random)
+
+    def _search_results(
+        self, random: Random, query: str
+    ) -> SERPQuerySearchResults:
+        digest = sha256(query.encode("utf-8")).hexdigest()[:12]
+
+        return SERPQuerySearchResults(
+            search_results=[
+                SERPQuerySearchResult(
+                    title=f"{query} ({index})",
+                    description=_fake_text(random, 160),
+                    content=self._payload(random),
+                    url=f"https://fake.invalid/{digest}/{index}",
+                )
+                for index in range(self.results_per_search)
+            ]
+        )
@@ -0,0 +1,461 @@
+from __future__ import annotations
+
+from asyncio import Semaphore, gather, to_thread
+from codecs import getincrementaldecoder
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, replace
+from hashlib import sha256
+from html.parser import HTMLParser
+from itertools import chain, zip_longest
+from json import dumps, loads
+from re import search as re_search
+from threading import Lock
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlsplit
+
+from lib.concurrency import ProviderLimiter
+from lib.config import PageFetchParameters
+from lib.log import logger
+from lib.models.crawler import FetchedPage
+
+# The HTTP stack (and the cache's dependencies) are imported on first use
+if TYPE_CHECKING:
+    from lib.cache import DiskCache, MemoryCache, TieredCache
+    from lib.transport import HTTPTransport
+
+HTML_CONTENT_TYPES = frozenset({"text/html", "application/xhtml+xml"})
+TEXT_CONTENT_TYPES = HTML_CONTENT_TYPES | {"text/plain"}
+
+
+def _normalize_text(parts: list[str], max_chars: Optional[int]) -> str:
+    lines = (" ".join(line.split()) for line in "".join(parts).splitlines())
+    text = "\n".join(line for line in lines if line)
+    return text[:max_chars] if max_chars is not None else text
+
+
+# Fed the body as it is downloaded, so a page is never held in full and
+# reading can stop once `max_chars` of text are in
+class HTMLTextExtractor(HTMLParser):
+    SKIPPED_TAGS = frozenset(
+        {"script", "style", "noscript", "template", "svg", "iframe", "canvas"}
+    )
+    BLOCK_TAGS = frozenset({
+        "address", "article", "aside", "blockquote", "br", "dd", "div",
+        "dl", "dt", "figcaption", "footer", "form", "h1", "h2", "h3", "h4",
+        "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre",
+        "section", "table", "title", "tr", "ul",
+    })
+    CELL_TAGS = frozenset({"td", "th"})
+
+    def __init__(self, max_chars: Optional[int] = None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+
+        self._parts: list[str] = []
+        self._num_chars = 0
+        self._skip_depth = 0
+
+    @property
+    def full(self) -> bool:
+        return self.max_chars is not None and self._num_chars >= self.max_chars
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+        else:
+            self._separate(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        else:
+            self._separate(tag)
+
+    def handle_data(self, data: str) -> None:
+        if self._skip_depth or self.full:
+            return
+
+        self._parts.append(data)
+        self._num_chars += len(data.strip())
+
+    def text(self) -> str:
+        return _normalize_text(self._parts, self.max_chars)
+
+    def _separate(self, tag: str) -> None:
+        if tag in self.BLOCK_TAGS:
+            self._parts.append("\n")
+        elif tag in self.CELL_TAGS:
+            self._parts.append(" ")
+
+
+class PlainTextExtractor:
+    def __init__(self, max_chars: Optional[int] = None):
+        self.max_chars = max_chars
+
+        self._parts: list[str] = []
+        self._num_chars = 0
+
+    @property
+    def full(self) -> bool:
+        return self.max_chars is not None and self._num_chars >= self.max_chars
+
+    def feed(self, data: str) -> None:
+        if not self.full:
+            self._parts.append(data)
+            self._num_chars += len(data)
+
+    def close(self) -> None:
+        pass
+
+    def text(self) -> str:
+        return _normalize_text(self._parts, self.max_chars)
+
+
+class _PageReader:
+    def __init__(
+        self,
+        page: FetchedPage,
+        charset: str,
+        parameters: PageFetchParameters,
+    ):
+        self.page = page
+        self.max_page_bytes = parameters.max_page_bytes
+        self.num_bytes = 0
+
+        try:
+            self._decoder = getincrementaldecoder(charset)(errors="replace")
+        except LookupError:
+            logger.debug("Page Fetcher: Unknown Charset %s", charset)
+            self._decoder = getincrementaldecoder("utf-8")(errors="replace")
+
+        self._extractor = (
+            PlainTextExtractor(parameters.max_text_chars)
+            if page.content_type == "text/plain"
+            else HTMLTextExtractor(parameters.max_text_chars)
+        )
+
+    # Whether to keep reading the body
+    def feed(self, chunk: bytes) -> bool:
+        chunk = chunk[: self.max_page_bytes - self.num_bytes]
+        self.num_bytes += len(chunk)
+        self._extractor.feed(self._decoder.decode(chunk))
+
+        if self.num_bytes >= self.max_page_bytes or self._extractor.full:
+            self.page.truncated = True
+            return False
+
+        return True
+
+    def finish(self) -> FetchedPage:
+        self._extractor.feed(self._decoder.decode(b"", final=True))
+        self._extractor.close()
+        self.page.content = self._extractor.text()
+        return self.page
+
+
+# Fetches pages as text over a pooled transport. Concurrency is bounded in
+# total (`max_workers`) and per host (`max_per_host`); pages seen before are
+# revalidated with a conditional GET, and a 304 is served from the cache.
+# Bodies are streamed through the text extractor and abandoned at the caps.
+class PageFetcher:
+    def __init__(
+        self,
+        parameters: Optional[PageFetchParameters] = None,
+        transport: Optional[HTTPTransport] = None,
+        cache: Optional[DiskCache | MemoryCache | TieredCache] = None,
+    ):
+        from lib.cache import MemoryCache
+        from lib.transport import CircuitBreaker, HTTPTransport
+
+        self.parameters = parameters or PageFetchParameters()
+        # A transport of its own: a few broken sites must not open the
+        # circuit of a search API, so this one only trips when fetching
+        # fails across the board
+        self.transport = transport or HTTPTransport(
+            read_timeout_s=30.0,
+            max_retries=1,
+            pool_connections=self.parameters.max_workers,
+            pool_maxsize=self.parameters.max_workers,
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=2 * self.parameters.max_workers
+            ),
+        )
+        # Holds the extracted text and validators, not the raw pages
+        self.cache = cache or MemoryCache(max_entries=256)
+
+        self._host_limiter = ProviderLimiter(
+            default_max_in_flight=self.parameters.max_per_host
+        )
+        self._lock = Lock()
+
+        self.pages_fetched: int = 0
+        self.pages_revalidated: int = 0
+        self.pages_truncated: int = 0
+        self.pages_failed: int = 0
+        self.bytes_read: int = 0
+
+    def __repr__(self):
+        return f"PageFetcher(parameters={self.parameters})"
+
+    def fetch(self, url: str) -> FetchedPage:
+        host = _host(url)
+        cached_page = self._cached_page(url)
+
+        with self._host_limiter.limit(host):
+            response = self.transport.request(
+                "GET",
+                url,
+                headers=self._request_headers(cached_page),
+                stream=True,
+            )
+            try:
+                page, reader = self._start_page(
+                    url, response.status_code, response.headers, cached_page
+                )
+                if reader is not None:
+                    for chunk in response.iter_content(
+                        self.parameters.chunk_bytes
+                    ):
+                        if not reader.feed(chunk):
+                            break
+
+                    page = reader.finish()
+            finally:
+                response.close()
+
+        self._finish_page(page, reader)
+        return page
+
+    async def afetch(self, url: str) -> FetchedPage:
+        host = _host(url)
+        cached_page = await to_thread(self._cached_page, url)
+
+        async with self._host_limiter.alimit(host):
+            response = await self.transport.arequest(
+                "GET",
+                url,
+                headers=self._request_headers(cached_page),
+                stream=True,
+                follow_redirects=True,
+            )
+            try:
+                page, reader = self._start_page(
+                    url, response.status_code, response.headers, cached_page
+                )
+                if reader is not None:
+                    async for chunk in response.aiter_bytes(
+                        self.parameters.chunk_bytes
+                    ):
+                        if not reader.feed(chunk):
+                            break
+
+                    page = reader.finish()
+            finally:
+                await response.aclose()
+
+        await to_thread(self._finish_page, page, reader)
+        return page
+
+    # Pages are returned in the order of `urls`; a failed fetch is a page
+    # with its `error` set rather than an exception
+    def fetch_many(self, urls: list[str]) -> list[FetchedPage]:
+        if not urls:
+            return []
+
+        ordered_urls = _interleave_hosts(list(dict.fromkeys(urls)))
+        with ThreadPoolExecutor(
+            max_workers=min(self.parameters.max_workers, len(ordered_urls)),
+            thread_name_prefix="page-fetcher",
+        ) as executor:
+            pages = dict(
+                zip(
+                    ordered_urls,
+                    executor.map(self._fetch_or_error, ordered_urls),
+                    strict=True,
+                )
+            )
+
+        self._log_summary(list(pages.values()))
+        return [pages[url] for url in urls]
+
+    async def afetch_many(self, urls: list[str]) -> list[FetchedPage]:
+        if not urls:
+            return []
+
+        ordered_urls = _interleave_hosts(list(dict.fromkeys(urls)))
+        slots = Semaphore(self.parameters.max_workers)
+
+        async def fetch(url: str) -> FetchedPage:
+            async with slots:
+                return await self._afetch_or_error(url)
+
+        pages = dict(
+            zip(
+                ordered_urls,
+                await gather(*map(fetch, ordered_urls)),
+                strict=True,
+            )
+        )
+
+        self._log_summary(list(pages.values()))
+        return [pages[url] for url in urls]
+
+    def close(self) -> None:
+        self.transport.close()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    def _fetch_or_error(self, url: str) -> FetchedPage:
+        try:
+            return self.fetch(url)
+        except Exception as error:
+            return self._failed_page(url, error)
+
+    async def _afetch_or_error(self, url: str) -> FetchedPage:
+        try:
+            return await self.afetch(url)
+        except Exception as error:
+            return self._failed_page(url, error)
+
+    def _failed_page(self, url: str, error: Exception) -> FetchedPage:
+        logger.warning("Page Fetcher: Failed %s: %r", url, error)
+        with self._lock:
+            self.pages_failed += 1
+
+        return FetchedPage(url=url, status_code=None, error=repr(error))
+
+    def _request_headers(self, cached_page: Optional[FetchedPage]) -> dict:
+        headers = {
+            "User-Agent": self.parameters.user_agent,
+            "Accept": "text/html,application/xhtml+xml,text/plain;q=0.9",
+        }
+        if cached_page and cached_page.etag:
+            headers["If-None-Match"] = cached_page.etag
+        if cached_page and cached_page.last_modified:
+            headers["If-Modified-Since"] = cached_page.last_modified
+
+        return headers
+
+    # Either a finished page (nothing more to read) or a reader for the body
+    def _start_page(
+        self,
+        url: str,
+        status_code: int,
+        headers: dict,
+        cached_page: Optional[FetchedPage],
+    ) -> tuple[Optional[FetchedPage], Optional[_PageReader]]:
+        if status_code == 304 and cached_page is not None:
+            return replace(cached_page, revalidated=True), None
+
+        if status_code != 200:
+            return (
+                FetchedPage(
+                    url=url,
+                    status_code=status_code,
+                    error=f"Unexpected Response Code: {status_code}",
+                ),
+                None,
+            )
+
+        media_type, _, media_parameters = (
+            headers.get("Content-Type") or "text/html"
+        ).partition(";")
+        content_type = media_type.strip().lower()
+        if content_type not in TEXT_CONTENT_TYPES:
+            return (
+                FetchedPage(
+                    url=url,
+                    status_code=status_code,
+                    content_type=content_type,
+                    error=f"Unsupported Content Type: {content_type}",
+                ),
+                None,
+            )
+
+        # The charset of a <meta> tag is not sniffed
+        charset = re_search(r"charset=\"?([\w.:-]+)", media_parameters)
+        page = FetchedPage(
+            url=url,
+            status_code=status_code,
+            content_type=content_type,
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+        )
+        return page, _PageReader(
+            page,
+            charset=charset.group(1) if charset else "utf-8",
+            parameters=self.parameters,
+        )
+
+    def _finish_page(
+        self, page: FetchedPage, reader: Optional[_PageReader]
+    ) -> None:
+        with self._lock:
+            self.pages_fetched += reader is not None
+            self.pages_revalidated += page.revalidated
+            self.pages_truncated += reader is not None and page.truncated
+            self.bytes_read += reader.num_bytes if reader else 0
+
+        logger.debug(
+            "Page Fetcher: %s (status: %s, revalidated: %s, chars: %d)",
+            page.url,
+            page.status_code,
+            page.revalidated,
+            len(page.content),
+        )
+
+        # Without validators a page could never be revalidated
+        if reader is not None and (page.etag or page.last_modified):
+            self.cache.set(
+                _cache_key(page.url), dumps(asdict(page)).encode("utf-8")
+            )
+
+    def _cached_page(self, url: str) -> Optional[FetchedPage]:
+        cached_entry = self.cache.get(_cache_key(url))
+        if cached_entry is None:
+            return None
+
+        return FetchedPage(**loads(cached_entry))
+
+    def _log_summary(self, pages: list[FetchedPage]) -> None:
+        logger.info(
+            "Page Fetcher: Fetched %d Pages (Revalidated: %d, Truncated: %d, "
+            "Failed: %d)",
+            len(pages),
+            sum(page.revalidated for page in pages),
+            sum(page.truncated for page in pages),
+            sum(page.error is not None for page in pages),
+        )
+
+
+def _host(url: str) -> str:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        raise ValueError(f"Invalid: url (must be an http(s) URL): {url}")
+
+    return parts.netloc.lower()
+
+
+def _cache_key(url: str) -> str:
+    return "page:" + sha256(url.encode("utf-8")).hexdigest()
+
+
+# Round-robin over hosts, so that workers are not all queued on the limit of
+# one host while others sit idle
+def _interleave_hosts(urls: list[str]) -> list[str]:
+    urls_per_host: dict[str, list[str]] = {}
+    for url in urls:
+        try:
+            host = _host(url)
+        except ValueError:
+            # Fails (and is reported) when fetched
+            host = ""
+
+        urls_per_host.setdefault(host, []).append(url)
+
+    return [
+        url
+        for url in chain.from_iterable(zip_longest(*urls_per_host.values()))
+        if url is not None
+    ]
@@ -0,0 +1,438 @@
+from __future__ import annotations
+
+from asyncio import Task, create_task
+from asyncio import wait as async_wait
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextvars import ContextVar, copy_context
+from math import ceil
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
+from typing import TYPE_CHECKING, Callable, Optional
+
+from pydantic import BaseModel
+
+from lib.analytics import Analytics
+from lib.concurrency import ProviderLimiter, provider_key
+from lib.config import DeepResearchBatchParameters, LLMHedgingParameters
+from lib.llm import LLMModel
+from lib.log import logger
+from lib.types import ResearchStage
+
+if TYPE_CHECKING:
+    from google.genai.types import GenerateContentResponseUsageMetadata
+    from openai.types import CompletionUsage
+
+    from lib.constants import LLMIdentifier
+
+# Stage of the LLM call being made (set by the researcher); latencies are
+# tracked per stage, since a report takes far longer than a SERP query
+call_stage: ContextVar[Optional[ResearchStage]] = ContextVar(
+    "call_stage", default=None
+)
+# Provider limiter of the researcher making the call; a backup request to
+# another provider needs a slot of that provider
+call_limiter: ContextVar[Optional[ProviderLimiter]] = ContextVar(
+    "call_limiter", default=None
+)
+# Set when a backup model answered the call, so that the researcher prices
+# (and budgets) the usage under the model that produced it
+call_llm_identifier: ContextVar[Optional[LLMIdentifier]] = ContextVar(
+    "call_llm_identifier", default=None
+)
+
+
+class LatencyTracker:
+    def __init__(self, window_size: int, min_samples: int):
+        self.window_size = window_size
+        self.min_samples = min_samples
+
+        self._latencies: dict[str, deque[float]] = {}
+        self._lock = Lock()
+
+    def record(self, key: str, latency_s: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(
+                key, deque(maxlen=self.window_size)
+            ).append(latency_s)
+
+    # Nearest-rank percentile; None until enough calls have been seen
+    def percentile(self, key: str, percentile: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies.get(key, ()))
+
+        if len(latencies) < self.min_samples:
+            return None
+
+        return latencies[max(ceil(percentile * len(latencies)) - 1, 0)]
+
+
+# Sends a backup request when a call runs past the recent latency percentile
+# of its stage and returns whichever valid response arrives first. Threads
+# cannot be interrupted, so a losing synchronous call is abandoned (and its
+# spend recorded when it completes); a losing async call is cancelled.
+# Streams and batches are passed through.
+class HedgedLLMModel(LLMModel):
+    def __init__(
+        self,
+        llm_model: LLMModel,
+        hedging_parameters: Optional[LLMHedgingParameters] = None,
+        backup_llm_model: Optional[LLMModel] = None,
+        analytics_instance: Optional[Analytics] = None,
+    ):
+        super().__init__(
+            llm_identifier=llm_model.llm_identifier,
+            llm_instance=llm_model.llm_instance,
+        )
+
+        self.llm_model = llm_model
+        self.hedging_parameters = hedging_parameters or LLMHedgingParameters()
+        # Defaults to a second request to the same model
+        self.backup_llm_model = backup_llm_model or llm_model
+        self.analytics_instance = analytics_instance
+
+        self.latency_tracker = LatencyTracker(
+            window_size=self.hedging_parameters.window_size,
+            min_samples=self.hedging_parameters.min_samples,
+        )
+        self._hedge_slots = BoundedSemaphore(
+            self.hedging_parameters.max_in_flight_hedges
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = Lock()
+
+    def __repr__(self):
+        return (
+            f"HedgedLLMModel(llm_model={self.llm_model}, "
+            f"backup_llm_model={self.backup_llm_model}, "
+            f"hedging_parameters={self.hedging_parameters})"
+        )
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.hedging_parameters.max_workers,
+                    thread_name_prefix="hedged-llm",
+                )
+
+            return self._executor
+
+    def generate_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+    ) -> tuple[
+        BaseModel | str, CompletionUsage | GenerateContentResponseUsageMetadata
+    ]:
+        key = self._latency_key(response_format)
+        delay_s = self._hedge_delay_s(key)
+        request = {
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "response_format": response_format,
+        }
+
+        # Until the stage has enough samples, calls run on the caller thread
+        if delay_s is None:
+            return self._timed_call(self.llm_model, key, request)
+
+        primary = self._submit(self.llm_model, key, request)
+        done, _ = wait([primary], timeout=delay_s)
+        if done or not self._hedge_slots.acquire(blocking=False):
+            return primary.result()
+
+        release_backup_slot = self._acquire_backup_slot()
+        if release_backup_slot is None:
+            self._hedge_slots.release()
+            return primary.result()
+
+        try:
+            logger.info(
+                "Hedging LLM Request: %s Exceeded %.2f seconds", key, delay_s
+            )
+            backup = self._submit(self.backup_llm_model, None, request)
+            # Held until the backup completes, even once abandoned
+            backup.add_done_callback(lambda _: release_backup_slot())
+            futures = [primary, backup]
+
+            pending, winner, fallback = set(futures), None, None
+            while pending and winner is None:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                # Ties go to the primary
+                for future in (future for future in futures if future in done):
+                    if future.exception() is None and self._is_valid(
+                        future.result()[0], response_format
+                    ):
+                        winner = future
+                        break
+
+                    fallback = fallback or future
+        finally:
+            self._hedge_slots.release()
+
+        winner = winner or fallback
+        self._record_hedge(
+            backup_won=winner is backup, response_format=response_format
+        )
+        for future in futures:
+            if future is winner:
+                continue
+
+            loser_llm_model = (
+                self.llm_model if future is primary else self.backup_llm_model
+            )
+            if not future.cancel():
+                future.add_done_callback(
+                    lambda future, llm_model=loser_llm_model: (
+                        self._record_hedge_spend(llm_model, future)
+                    )
+                )
+
+        return winner.result()
+
+    async def agenerate_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+    ) -> tuple[
+        BaseModel | str, CompletionUsage | GenerateContentResponseUsageMetadata
+    ]:
+        key = self._latency_key(response_format)
+        delay_s = self._hedge_delay_s(key)
+        request = {
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "response_format": response_format,
+        }
+
+        if delay_s is None:
+            return await self._atimed_call(self.llm_model, key, request)
+
+        primary = create_task(self._atimed_call(self.llm_model, key, request))
+        done, _ = await async_wait({primary}, timeout=delay_s)
+        if done or not self._hedge_slots.acquire(blocking=False):
+            return await primary
+
+        release_backup_slot = await self._aacquire_backup_slot()
+        if release_backup_slot is None:
+            self._hedge_slots.release()
+            return await primary
+
+        try:
+            logger.info(
+                "Hedging LLM Request (Async): %s Exceeded %.2f seconds",
+                key,
+                delay_s,
+            )
+            backup = create_task(
+                self._atimed_call(self.backup_llm_model, None, request)
+            )
+            backup.add_done_callback(lambda _: release_backup_slot())
+            tasks: list[Task] = [primary, backup]
+
+            pending, winner, fallback = set(tasks), None, None
+            try:
+                while pending and winner is None:
+                    done, pending = await async_wait(
+                        pending, return_when=FIRST_COMPLETED
+                    )
+                    for task in (task for task in tasks if task in done):
+                        if task.exception() is None and self._is_valid(
+                            task.result()[0], response_format
+                        ):
+                            winner = task
+                            break
+
+                        fallback = fallback or task
+            finally:
+                # The losing request is aborted; its spend (if any) is not
+                # reported by the provider
+                for task in pending:
+                    task.cancel()
+        finally:
+            self._hedge_slots.release()
+
+        winner = winner or fallback
+        self._record_hedge(
+            backup_won=winner is backup, response_format=response_format
+        )
+        for task in tasks:
+            if task is not winner and task.done():
+                self._record_hedge_spend(
+                    (
+                        self.llm_model
+                        if task is primary
+                        else self.backup_llm_model
+                    ),
+                    task,
+                )
+
+        return winner.result()
+
+    def stream_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+    ) -> tuple[str, CompletionUsage | GenerateContentResponseUsageMetadata]:
+        return self.llm_model.stream_llm_response(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            on_chunk=on_chunk,
+        )
+
+    async def astream_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+    ) -> tuple[str, CompletionUsage | GenerateContentResponseUsageMetadata]:
+        return await self.llm_model.astream_llm_response(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            on_chunk=on_chunk,
+        )
+
+    def batch_generate_llm_responses(
+        self,
+        system_prompt: str,
+        user_prompts: list[str],
+        response_format: BaseModel,
+        batch_parameters: DeepResearchBatchParameters,
+    ) -> list[tuple]:
+        return self.llm_model.batch_generate_llm_responses(
+            system_prompt=system_prompt,
+            user_prompts=user_prompts,
+            response_format=response_format,
+            batch_parameters=batch_parameters,
+        )
+
+    def close(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _latency_key(self, response_format: Optional[BaseModel]) -> str:
+        stage = call_stage.get()
+        if stage is not None:
+            return stage.value
+
+        # Outside the researcher, calls are grouped by response type
+        return response_format.__name__ if response_format else "completion"
+
+    def _hedge_delay_s(self, key: str) -> Optional[float]:
+        latency_s = self.latency_tracker.percentile(
+            key, self.hedging_parameters.percentile
+        )
+        if latency_s is None:
+            return None
+
+        return max(latency_s, self.hedging_parameters.min_delay_s)
+
+    # Only the primary's latencies are tracked; the backup of a hedged call
+    # would bias the percentile towards the fast responses
+    def _timed_call(
+        self, llm_model: LLMModel, key: Optional[str], request: dict
+    ) -> tuple:
+        start_time_s = perf_counter()
+        try:
+            return llm_model.generate_llm_response(**request)
+        finally:
+            if key is not None:
+                self.latency_tracker.record(key, perf_counter() - start_time_s)
+
+    # A cancelled primary records the time it ran for, so that slow calls
+    # still count towards the percentile
+    async def _atimed_call(
+        self, llm_model: LLMModel, key: Optional[str], request: dict
+    ) -> tuple:
+        start_time_s = perf_counter()
+        try:
+            return await llm_model.agenerate_llm_response(**request)
+        finally:
+            if key is not None:
+                self.latency_tracker.record(key, perf_counter() - start_time_s)
+
+    def _submit(
+        self, llm_model: LLMModel, key: Optional[str], request: dict
+    ) -> Future:
+        return self.executor.submit(
+            copy_context().run, self._timed_call, llm_model, key, request
+        )
+
+    # Hedges are optional: without a free slot of the backup's provider the
+    # call is not hedged. A backup to the primary's provider shares the
+    # caller's slot.
+    def _acquire_backup_slot(self) -> Optional[Callable[[], None]]:
+        limiter = call_limiter.get()
+        backup_provider = provider_key(self.backup_llm_model)
+        if limiter is None or backup_provider == provider_key(self.llm_model):
+            return lambda: None
+
+        release = limiter.try_acquire(backup_provider)
+        if release is None:
+            logger.debug(
+                "Hedge Skipped: Provider Limit Reached (%s)", backup_provider
+            )
+
+        return release
+
+    async def _aacquire_backup_slot(self) -> Optional[Callable[[], None]]:
+        limiter = call_limiter.get()
+        backup_provider = provider_key(self.backup_llm_model)
+        if limiter is None or backup_provider == provider_key(self.llm_model):
+            return lambda: None
+
+        release = await limiter.atry_acquire(backup_provider)
+        if release is None:
+            logger.debug(
+                "Hedge Skipped: Provider Limit Reached (%s)", backup_provider
+            )
+
+        return release
+
+    def _is_valid(
+        self, result: BaseModel | str, response_format: Optional[BaseModel]
+    ) -> bool:
+        # Timeout fallbacks return an empty string
+        if response_format:
+            return isinstance(result, response_format)
+
+        return bool(result)
+
+    def _record_hedge(
+        self, backup_won: bool, response_format: Optional[BaseModel]
+    ) -> None:
+        logger.info(
+            "Hedged LLM Request: %s Won (%s)",
+            "Backup" if backup_won else "Primary",
+            self._latency_key(response_format),
+        )
+        if self.analytics_instance:
+            self.analytics_instance.update_hedge_stats(backup_won=backup_won)
+
+        # Runs in the caller's context (the researcher reads it back)
+        if backup_won:
+            call_llm_identifier.set(self.backup_llm_model.llm_identifier)
+
+    def _record_hedge_spend(
+        self, llm_model: LLMModel, future: Future | Task
+    ) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        _, usage = future.result()
+        if self.analytics_instance:
+            self.analytics_instance.update_hedge_spend(
+                llm_model=llm_model.llm_identifier, usage_stats=usage
+            )
@@ -0,0 +1,166 @@
+from json import JSONDecodeError, dumps, loads
+from os import fsync, makedirs, path
+from threading import Lock
+from time import monotonic
+from typing import Optional
+
+from lib.log import logger
+from lib.models.journal import JournalNode, JournalState
+from lib.models.llm import SERPQuery
+from lib.types import TokenUsage
+
+
+def _usage_to_dict(usage: TokenUsage) -> dict:
+    return {
+        "input_tokens": usage.input_tokens,
+        "cached_input_tokens": usage.cached_input_tokens,
+        "completion_tokens": usage.completion_tokens,
+    }
+
+
+# Append-only JSON Lines. Every record is flushed to the OS as it is written,
+# so a crashed process loses nothing; `fsync` (which protects against host
+# crashes) is batched by record count and elapsed time.
+class ResearchJournal:
+    def __init__(
+        self,
+        journal_path: str,
+        fsync_batch_size: int = 32,
+        fsync_interval_s: float = 1.0,
+    ):
+        self.journal_path = journal_path
+        self.fsync_batch_size = fsync_batch_size
+        self.fsync_interval_s = fsync_interval_s
+
+        self._file = None
+        self._pending_records = 0
+        self._last_fsync_s = monotonic()
+        self._lock = Lock()
+
+    def __repr__(self):
+        return f"ResearchJournal(journal_path={self.journal_path})"
+
+    def load(self) -> JournalState:
+        state = JournalState()
+        if not path.exists(self.journal_path):
+            return state
+
+        with open(self.journal_path, "r", encoding="utf-8") as file_handle:
+            for line_number, line in enumerate(file_handle, start=1):
+                try:
+                    record = loads(line)
+                except JSONDecodeError:
+                    # A torn write can only affect the last line
+                    logger.warning(
+                        "Journal: Skipping Corrupt Record (line: %d)", line_number
+                    )
+                    continue
+
+                self._apply(state, record)
+
+        logger.info("Journal: Loaded %s", state)
+        return state
+
+    def _apply(self, state: JournalState, record: dict) -> None:
+        if record["type"] == "run":
+            state.user_query = record["user_query"]
+        elif record["type"] == "serp_queries":
+            state.serp_queries[tuple(record["path"])] = [
+                SERPQuery(**serp_query) for serp_query in record["serp_queries"]
+            ]
+        elif record["type"] == "node":
+            node_path = tuple(record["path"])
+            state.nodes[node_path] = JournalNode(
+                path=node_path,
+                serp_query=SERPQuery(**record["serp_query"]),
+                learning=record["learning"],
+                follow_up_queries=record["follow_up_queries"],
+                usage=TokenUsage(**record["usage"]),
+                # Absent from journals written before sources were recorded
+                source_urls=record.get("source_urls", []),
+            )
+
+    def reset(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+            if path.exists(self.journal_path):
+                logger.info("Journal: Discarding %s", self.journal_path)
+                open(self.journal_path, "w", encoding="utf-8").close()
+
+            self._pending_records = 0
+
+    def record_run(self, user_query: str) -> None:
+        self._append({"type": "run", "user_query": user_query})
+
+    def record_serp_queries(
+        self,
+        node_path: tuple[int, ...],
+        serp_queries: list[SERPQuery],
+        usage: TokenUsage,
+    ) -> None:
+        self._append({
+            "type": "serp_queries",
+            "path": list(node_path),
+            "serp_queries": [
+                serp_query.model_dump() for serp_query in serp_queries
+            ],
+            "usage": _usage_to_dict(usage),
+        })
+
+    def record_node(
+        self,
+        node_path: tuple[int, ...],
+        serp_query: SERPQuery,
+        learning: str,
+        follow_up_queries: list[str],
+        usage: TokenUsage,
+        source_urls: Optional[list[str]] = None,
+    ) -> None:
+        self._append({
+            "type": "node",
+            "path": list(node_path),
+            "serp_query": serp_query.model_dump(),
+            "learning": learning,
+            "follow_up_queries": follow_up_queries,
+            "source_urls": source_urls or [],
+            "usage": _usage_to_dict(usage),
+        })
+
+    def _append(self, record: dict) -> None:
+        line = dumps(record) + "\n"
+
+        with self._lock:
+            if self._file is None:
+                makedirs(
+                    path.dirname(path.abspath(self.journal_path)), exist_ok=True
+                )
+                self._file = open(self.journal_path, "a", encoding="utf-8")
+
+            self._file.write(line)
+            self._file.flush()
+            self._pending_records += 1
+
+            if (
+                self._pending_records >= self.fsync_batch_size
+                or monotonic() - self._last_fsync_s >= self.fsync_interval_s
+            ):
+                self._fsync()
+
+    def _fsync(self) -> None:
+        fsync(self._file.fileno())
+        logger.debug("Journal: Synced %d Records", self._pending_records)
+
+        self._pending_records = 0
+        self._last_fsync_s = monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+
+            self._fsync()
+            self._file.close()
+            self._file = None
@@ -0,0 +1,205 @@
+from collections import Counter
+from hashlib import blake2b
+from math import log
+from threading import Lock
+from typing import Optional
+
+from lib.cache import normalize_query
+from lib.dedup import query_shingles, query_terms
+from lib.log import logger
+from lib.models.learnings import LearningRecord
+from lib.scheduler import learning_novelty
+from lib.tokens import TokenCounter
+
+
+def learning_hash(learning: str) -> str:
+    # Learnings that only differ in case, punctuation or spacing collide
+    return blake2b(
+        normalize_query(learning).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+# Okapi BM25 over an inverted index of the (stemmed) query terms
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+        # Term -> {document: term frequency}
+        self._postings: dict[str, dict[int, int]] = {}
+        self._document_lengths: list[int] = []
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._document_lengths)
+
+    def add(self, text: str) -> int:
+        document = len(self._document_lengths)
+        term_counts = Counter(query_terms(text))
+        for term, term_count in term_counts.items():
+            self._postings.setdefault(term, {})[document] = term_count
+
+        document_length = sum(term_counts.values())
+        self._document_lengths.append(document_length)
+        self._total_length += document_length
+        return document
+
+    def rank(self, query: str) -> list[tuple[int, float]]:
+        num_documents = len(self._document_lengths)
+        if not num_documents:
+            return []
+
+        mean_length = max(self._total_length / num_documents, 1.0)
+        scores = [0.0] * num_documents
+        for term in set(query_terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+
+            # Stays positive for terms found in most documents
+            num_postings = len(postings)
+            idf = log(
+                1 + (num_documents - num_postings + 0.5) / (num_postings + 0.5)
+            )
+            for document, term_count in postings.items():
+                length_norm = self.k1 * (
+                    1
+                    - self.b
+                    + self.b * self._document_lengths[document] / mean_length
+                )
+                scores[document] += (
+                    idf
+                    * term_count
+                    * (self.k1 + 1)
+                    / (term_count + length_norm)
+                )
+
+        # Every document is ranked; ties keep insertion order
+        return sorted(
+            enumerate(scores), key=lambda document: (-document[1], document[0])
+        )
+
+
+def select_relevant(
+    index: BM25Index,
+    texts: list[str],
+    query: str,
+    top_k: Optional[int] = None,
+    budget_tokens: Optional[int] = None,
+    token_counter: Optional[TokenCounter] = None,
+) -> list[int]:
+    if budget_tokens is not None and token_counter is None:
+        raise ValueError("Required: token_counter (budget_tokens)")
+
+    selected, used_tokens = [], 0
+    for document, _ in index.rank(query):
+        if top_k is not None and len(selected) >= top_k:
+            break
+
+        if budget_tokens is not None:
+            # Shorter, less relevant texts may still fit
+            num_tokens = token_counter.count(texts[document])
+            if used_tokens + num_tokens > budget_tokens:
+                continue
+            used_tokens += num_tokens
+
+        selected.append(document)
+
+    # Prompts keep the research (depth-first) order
+    return sorted(selected)
+
+
+# Scores each learning against the learnings of its own ancestors. Other
+# branches are left out, so that the score (and any pruning) does not depend
+# on which concurrent branch finished first.
+class NoveltyTracker:
+    def __init__(self):
+        self._lock = Lock()
+
+        self.branches_pruned: int = 0
+        self.searches_avoided: int = 0
+        self.llm_calls_avoided: int = 0
+
+    def novelty(self, learning: str, ancestor_learnings: list[str]) -> float:
+        return learning_novelty(
+            query_shingles(learning),
+            [
+                query_shingles(ancestor_learning)
+                for ancestor_learning in ancestor_learnings
+            ],
+        )
+
+    def record_pruned_branch(self, searches: int, llm_calls: int) -> None:
+        with self._lock:
+            self.branches_pruned += 1
+            self.searches_avoided += searches
+            self.llm_calls_avoided += llm_calls
+
+
+class LearningStore:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self._records: list[LearningRecord] = []
+        self._texts: list[str] = []
+        self._hashes: set[str] = set()
+        self._index = BM25Index(k1=k1, b=b)
+        self._lock = Lock()
+
+        self.duplicates_found: int = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __repr__(self):
+        return (
+            f"LearningStore(records={len(self._records)}, "
+            f"duplicates_found={self.duplicates_found})"
+        )
+
+    @property
+    def records(self) -> list[LearningRecord]:
+        with self._lock:
+            return list(self._records)
+
+    def add(self, record: LearningRecord) -> bool:
+        digest = learning_hash(record.learning)
+
+        with self._lock:
+            if digest in self._hashes:
+                self.duplicates_found += 1
+                logger.debug(
+                    "Learning Store: Duplicate Learning (Path: %s)", record.path
+                )
+                return False
+
+            text = record.text
+            self._hashes.add(digest)
+            self._records.append(record)
+            self._texts.append(text)
+            self._index.add(text)
+
+        return True
+
+    def top_k(
+        self,
+        query: str,
+        k: Optional[int] = None,
+        budget_tokens: Optional[int] = None,
+        token_counter: Optional[TokenCounter] = None,
+    ) -> list[LearningRecord]:
+        with self._lock:
+            selected = select_relevant(
+                self._index,
+                self._texts,
+                query,
+                top_k=k,
+                budget_tokens=budget_tokens,
+                token_counter=token_counter,
+            )
+            records = [self._records[document] for document in selected]
+
+        logger.debug(
+            "Learning Store: Selected %d of %d Learnings",
+            len(records),
+            len(self._records),
+        )
+        return records
@@ -1,15 +1,61 @@
+from __future__ import annotations
+
 from abc import ABC, abstractmethod
-from typing import Optional
+from asyncio import to_thread
+from json import dumps, loads
+from time import monotonic, sleep
+from typing import TYPE_CHECKING, Callable, Optional, TypeVar
 
-from google.genai import Client
-from google.genai.types import GenerateContentResponseUsageMetadata
-from openai import OpenAI
-from openai.types import CompletionUsage
 from pydantic import BaseModel
 
+from lib.analytics import to_token_usage
+from lib.clients import (
+    loop_local_async_openai_clients,
+    openai_timeout_errors,
+)
+from lib.config import DeepResearchBatchParameters
 from lib.constants import LLMIdentifier
 from lib.log import logger
-from lib.types import ModelProvider
+from lib.sdk import is_gemini_client, is_openai_client
+from lib.types import BatchUsage, ModelProvider
+
+# Provider SDKs are imported by the plugins that use them
+if TYPE_CHECKING:
+    from google.genai import Client
+    from google.genai.types import GenerateContentResponseUsageMetadata
+    from openai import AsyncOpenAI, OpenAI
+    from openai.types import CompletionUsage
+
+    from lib.context_cache import GeminiContextCache
+
+Batch = TypeVar("Batch")
+
+# Malformed batch results (pydantic's ValidationError is a ValueError); the
+# request is retried online like a failed one
+BATCH_RESULT_ERRORS = (ValueError, KeyError, IndexError, TypeError)
+
+
+def _wait_for_batch(
+    batch_id: str,
+    retrieve_batch: Callable[[], Batch],
+    is_pending: Callable[[Batch], bool],
+    cancel_batch: Callable[[], None],
+    batch_parameters: DeepResearchBatchParameters,
+) -> Batch:
+    deadline_s = monotonic() + batch_parameters.max_wait_s
+
+    batch = retrieve_batch()
+    while is_pending(batch):
+        if monotonic() >= deadline_s:
+            logger.error("Batch: Timeout (cancelling: %s)", batch_id)
+            cancel_batch()
+            raise TimeoutError(f"Batch Timeout: {batch_id}")
+
+        logger.debug("Batch: Waiting for %s", batch_id)
+        sleep(batch_parameters.poll_interval_s)
+        batch = retrieve_batch()
+
+    return batch
 
 
 class LLMModel(ABC):
@@ -17,10 +63,10 @@ class LLMModel(ABC):
         self, llm_identifier: LLMIdentifier, llm_instance: OpenAI | Client
     ):
         if (
-            isinstance(llm_instance, OpenAI)
+            is_openai_client(llm_instance)
             and llm_identifier.value.model_provider != ModelProvider.OPENAI
         ) or (
-            isinstance(llm_instance, Client)
+            is_gemini_client(llm_instance)
             and llm_identifier.value.model_provider != ModelProvider.GOOGLE
         ):
             raise ValueError("Mismatch: LLM Model Provider and LLM Instance")
@@ -38,13 +84,125 @@ class LLMModel(ABC):
         BaseModel | str, CompletionUsage | GenerateContentResponseUsageMetadata
     ]: ...
 
+    # Plugins without a native async client fall back to a worker thread.
+    async def agenerate_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+    ) -> tuple[
+        BaseModel | str, CompletionUsage | GenerateContentResponseUsageMetadata
+    ]:
+        return await to_thread(
+            self.generate_llm_response,
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            response_format=response_format,
+        )
+
+    # Plugins without native streaming emit the whole response as one chunk.
+    def stream_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+    ) -> tuple[str, CompletionUsage | GenerateContentResponseUsageMetadata]:
+        result, usage = self.generate_llm_response(
+            system_prompt=system_prompt, user_prompt=user_prompt
+        )
+        if result:
+            on_chunk(result)
+
+        return result, usage
+
+    async def astream_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+    ) -> tuple[str, CompletionUsage | GenerateContentResponseUsageMetadata]:
+        result, usage = await self.agenerate_llm_response(
+            system_prompt=system_prompt, user_prompt=user_prompt
+        )
+        if result:
+            on_chunk(result)
+
+        return result, usage
+
+    # Plugins without a batch API run the requests online, one at a time.
+    def batch_generate_llm_responses(
+        self,
+        system_prompt: str,
+        user_prompts: list[str],
+        response_format: BaseModel,
+        batch_parameters: DeepResearchBatchParameters,
+    ) -> list[
+        tuple[
+            BaseModel,
+            CompletionUsage | GenerateContentResponseUsageMetadata | BatchUsage,
+        ]
+    ]:
+        return [
+            self.generate_llm_response(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                response_format=response_format,
+            )
+            for user_prompt in user_prompts
+        ]
+
+    def _complete_batch_results(
+        self,
+        system_prompt: str,
+        user_prompts: list[str],
+        response_format: BaseModel,
+        results: dict[int, tuple],
+    ) -> list[tuple]:
+        failed_indices = [
+            index for index in range(len(user_prompts)) if index not in results
+        ]
+        if failed_indices:
+            logger.warning(
+                "Batch: %d Requests Failed (retrying online)",
+                len(failed_indices),
+            )
+
+        for index in failed_indices:
+            results[index] = self.generate_llm_response(
+                system_prompt=system_prompt,
+                user_prompt=user_prompts[index],
+                response_format=response_format,
+            )
+
+        return [results[index] for index in range(len(user_prompts))]
+
 
 class OpenAICompatibleLLMModel(LLMModel):
-    def __init__(self, llm_identifier: LLMIdentifier, llm_instance: OpenAI):
+    def __init__(
+        self,
+        llm_identifier: LLMIdentifier,
+        llm_instance: OpenAI,
+        async_llm_instance: Optional[AsyncOpenAI] = None,
+        request_timeout_s: Optional[float] = None,
+    ):
         super().__init__(
             llm_identifier=llm_identifier, llm_instance=llm_instance
         )
 
+        # Per-request timeout; defaults to the client's own (its `timeout`)
+        self.request_timeout_s = request_timeout_s
+        # A client passed in is used as is, on the caller's event loop
+        self.async_llm_instance = async_llm_instance
+        self._async_llm_instances = loop_local_async_openai_clients(
+            llm_instance
+        )
+
+    async def _async_llm_instance(self) -> AsyncOpenAI:
+        if self.async_llm_instance is not None:
+            return self.async_llm_instance
+
+        return await self._async_llm_instances.get()
+
     def generate_llm_response(
         self,
         system_prompt: str,
@@ -56,13 +214,7 @@ class OpenAICompatibleLLMModel(LLMModel):
             "structured_completion" if response_format else "completion",
         )
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {
-                "role": "user",
-                "content": user_prompt,
-            },
-        ]
+        messages = self._build_messages(system_prompt, user_prompt)
 
         try:
             if response_format:
@@ -70,7 +222,7 @@ class OpenAICompatibleLLMModel(LLMModel):
                     model=self.llm_identifier.value.model_identifier,
                     messages=messages,
                     response_format=response_format,
-                    timeout=120000,
+                    **self._request_options(),
                 )
                 result = response.choices[0].message.parsed
 
@@ -78,27 +230,266 @@ class OpenAICompatibleLLMModel(LLMModel):
                 response = self.llm_instance.chat.completions.create(
                     model=self.llm_identifier.value.model_identifier,
                     messages=messages,
+                    **self._request_options(),
                 )
                 result = response.choices[0].message.content
-        except TimeoutError:
-            logger.error(
-                "OpenAI: Request Timeout for Query: %s",
-                user_prompt,
+        except openai_timeout_errors():
+            return self._timeout_response(user_prompt)
+
+        return result, response.usage
+
+    async def agenerate_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+    ) -> tuple[BaseModel | str, CompletionUsage]:
+        logger.info(
+            "Generating LLM Response (Async): %s",
+            "structured_completion" if response_format else "completion",
+        )
+
+        messages = self._build_messages(system_prompt, user_prompt)
+        async_llm_instance = await self._async_llm_instance()
+
+        try:
+            if response_format:
+                response = await async_llm_instance.beta.chat.completions.parse(
+                    model=self.llm_identifier.value.model_identifier,
+                    messages=messages,
+                    response_format=response_format,
+                    **self._request_options(),
+                )
+                result = response.choices[0].message.parsed
+
+            else:
+                response = await async_llm_instance.chat.completions.create(
+                    model=self.llm_identifier.value.model_identifier,
+                    messages=messages,
+                    **self._request_options(),
+                )
+                result = response.choices[0].message.content
+        except openai_timeout_errors():
+            return self._timeout_response(user_prompt)
+
+        return result, response.usage
+
+    def batch_generate_llm_responses(
+        self,
+        system_prompt: str,
+        user_prompts: list[str],
+        response_format: BaseModel,
+        batch_parameters: DeepResearchBatchParameters,
+    ) -> list[tuple[BaseModel, BatchUsage | CompletionUsage]]:
+        from openai.lib._parsing._completions import (
+            type_to_response_format_param,
+        )
+        from openai.types import CompletionUsage
+
+        logger.info("Submitting Batch: %d Requests", len(user_prompts))
+
+        input_file = self.llm_instance.files.create(
+            file=(
+                "batch.jsonl",
+                "\n".join(
+                    dumps({
+                        "custom_id": str(index),
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": {
+                            "model": self.llm_identifier.value.model_identifier,
+                            "messages": self._build_messages(
+                                system_prompt, user_prompt
+                            ),
+                            # Same schema translation as `parse()`
+                            "response_format": type_to_response_format_param(
+                                response_format
+                            ),
+                        },
+                    })
+                    for index, user_prompt in enumerate(user_prompts)
+                ).encode("utf-8"),
+                "application/jsonl",
+            ),
+            purpose="batch",
+        )
+        batch = self.llm_instance.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=batch_parameters.completion_window,
+        )
+        logger.info("Batch Submitted: %s", batch.id)
+
+        batch = _wait_for_batch(
+            batch_id=batch.id,
+            retrieve_batch=lambda: self.llm_instance.batches.retrieve(batch.id),
+            is_pending=lambda batch: batch.status
+            in ("validating", "in_progress", "finalizing"),
+            cancel_batch=lambda: self.llm_instance.batches.cancel(batch.id),
+            batch_parameters=batch_parameters,
+        )
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.status}: {batch.id}")
+
+        results = {}
+        if batch.output_file_id:
+            output = self.llm_instance.files.content(batch.output_file_id).text
+            for line in output.splitlines():
+                try:
+                    record = loads(line)
+                    response = record.get("response")
+                    if record.get("error") or response["status_code"] != 200:
+                        continue
+
+                    body = response["body"]
+                    results[int(record["custom_id"])] = (
+                        response_format.model_validate_json(
+                            body["choices"][0]["message"]["content"]
+                        ),
+                        BatchUsage(
+                            usage=to_token_usage(
+                                CompletionUsage(**body["usage"])
+                            )
+                        ),
+                    )
+                except BATCH_RESULT_ERRORS as exception:
+                    logger.warning(
+                        "Batch: Skipping Invalid Result (%s)",
+                        type(exception).__name__,
+                    )
+
+        logger.info(
+            "Batch Completed: %s (%d/%d Succeeded)",
+            batch.id,
+            len(results),
+            len(user_prompts),
+        )
+        return self._complete_batch_results(
+            system_prompt, user_prompts, response_format, results
+        )
+
+    def stream_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+    ) -> tuple[str, CompletionUsage]:
+        logger.info("Generating LLM Response (Streaming): completion")
+
+        chunks = []
+        usage = None
+        try:
+            stream = self.llm_instance.chat.completions.create(
+                **self._build_stream_request(system_prompt, user_prompt)
+            )
+            for chunk in stream:
+                usage = chunk.usage or usage
+                content = self._chunk_content(chunk)
+                if content:
+                    chunks.append(content)
+                    on_chunk(content)
+        except openai_timeout_errors():
+            return self._timeout_response(user_prompt)
+
+        return "".join(chunks), self._stream_usage(usage)
+
+    async def astream_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+    ) -> tuple[str, CompletionUsage]:
+        logger.info("Generating LLM Response (Async, Streaming): completion")
+
+        chunks = []
+        usage = None
+        async_llm_instance = await self._async_llm_instance()
+        try:
+            stream = await async_llm_instance.chat.completions.create(
+                **self._build_stream_request(system_prompt, user_prompt)
             )
-            logger.warning("Returning Empty Response")
-            return "", CompletionUsage(
+            async for chunk in stream:
+                usage = chunk.usage or usage
+                content = self._chunk_content(chunk)
+                if content:
+                    chunks.append(content)
+                    on_chunk(content)
+        except openai_timeout_errors():
+            return self._timeout_response(user_prompt)
+
+        return "".join(chunks), self._stream_usage(usage)
+
+    def _build_stream_request(self, system_prompt: str, user_prompt: str) -> dict:
+        return {
+            "model": self.llm_identifier.value.model_identifier,
+            "messages": self._build_messages(system_prompt, user_prompt),
+            "stream": True,
+            # Usage arrives in a final chunk with no choices
+            "stream_options": {"include_usage": True},
+            **self._request_options(),
+        }
+
+    def _request_options(self) -> dict:
+        if self.request_timeout_s is None:
+            return {}
+
+        return {"timeout": self.request_timeout_s}
+
+    def _chunk_content(self, chunk) -> Optional[str]:
+        if not chunk.choices:
+            return None
+
+        return chunk.choices[0].delta.content
+
+    def _stream_usage(self, usage: Optional[CompletionUsage]) -> CompletionUsage:
+        from openai.types import CompletionUsage
+
+        if usage is None:
+            # Compatible servers may ignore `stream_options`
+            logger.warning("OpenAI: Stream Ended without Usage")
+            return CompletionUsage(
                 completion_tokens=0, prompt_tokens=0, total_tokens=0
             )
 
-        return result, response.usage
+        return usage
+
+    def _build_messages(self, system_prompt: str, user_prompt: str) -> list:
+        return [
+            {"role": "system", "content": system_prompt},
+            {
+                "role": "user",
+                "content": user_prompt,
+            },
+        ]
+
+    def _timeout_response(self, user_prompt: str) -> tuple[str, CompletionUsage]:
+        from openai.types import CompletionUsage
+
+        logger.error(
+            "OpenAI: Request Timeout for Query: %s",
+            user_prompt,
+        )
+        logger.warning("Returning Empty Response")
+        return "", CompletionUsage(
+            completion_tokens=0, prompt_tokens=0, total_tokens=0
+        )
 
 
 class GeminiLLMModel(LLMModel):
-    def __init__(self, llm_identifier: LLMIdentifier, llm_instance: Client):
+    def __init__(
+        self,
+        llm_identifier: LLMIdentifier,
+        llm_instance: Client,
+        context_cache: Optional[GeminiContextCache] = None,
+    ):
         super().__init__(
             llm_identifier=llm_identifier, llm_instance=llm_instance
         )
 
+        # Shared by the Gemini plugins of a run; streamed (report) and batch
+        # requests are sent uncached
+        self.context_cache = context_cache
+
     def generate_llm_response(
         self,
         system_prompt: str,
@@ -110,26 +501,268 @@ class GeminiLLMModel(LLMModel):
             "structured_completion" if response_format else "completion",
         )
 
-        if response_format:
+        cached_content, contents = self._cached_request(
+            system_prompt, user_prompt, response_format
+        )
+        try:
             response = self.llm_instance.models.generate_content(
-                model=self.llm_identifier.value.model_identifier,
-                contents=user_prompt,
-                config={
-                    "response_mime_type": "application/json",
-                    "system_instruction": system_prompt,
-                    "response_schema": response_format,
-                },
+                **self._build_request(
+                    system_prompt, contents, response_format, cached_content
+                )
             )
-            result = response.parsed
+        except Exception as error:
+            if not self.context_cache or not self.context_cache.is_stale(
+                cached_content, error
+            ):
+                raise
 
-        else:
-            response = self.llm_identifier.models.generate_content(
-                model=self.llm_identifier.value.model_identifier,
-                config={
-                    "system_instruction": system_prompt,
-                },
-                contents=[user_prompt],
+            response = self.llm_instance.models.generate_content(
+                **self._build_request(
+                    system_prompt, user_prompt, response_format
+                )
             )
-            result = response.text
 
-        return result, response.usage
+        return (
+            response.parsed if response_format else response.text,
+            response.usage_metadata,
+        )
+
+    async def agenerate_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+    ) -> tuple[BaseModel | str, GenerateContentResponseUsageMetadata]:
+        logger.info(
+            "Generating LLM Response (Async): %s",
+            "structured_completion" if response_format else "completion",
+        )
+
+        # Handles are created and refreshed with the synchronous client
+        cached_content, contents = (
+            await to_thread(
+                self._cached_request,
+                system_prompt,
+                user_prompt,
+                response_format,
+            )
+            if self.context_cache
+            else (None, user_prompt)
+        )
+        try:
+            response = await self.llm_instance.aio.models.generate_content(
+                **self._build_request(
+                    system_prompt, contents, response_format, cached_content
+                )
+            )
+        except Exception as error:
+            if not self.context_cache or not self.context_cache.is_stale(
+                cached_content, error
+            ):
+                raise
+
+            response = await self.llm_instance.aio.models.generate_content(
+                **self._build_request(
+                    system_prompt, user_prompt, response_format
+                )
+            )
+
+        return (
+            response.parsed if response_format else response.text,
+            response.usage_metadata,
+        )
+
+    def stream_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+    ) -> tuple[str, GenerateContentResponseUsageMetadata]:
+        logger.info("Generating LLM Response (Streaming): completion")
+
+        chunks = []
+        usage = None
+        for chunk in self.llm_instance.models.generate_content_stream(
+            **self._build_request(system_prompt, user_prompt)
+        ):
+            # Every chunk carries the cumulative usage so far
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                chunks.append(chunk.text)
+                on_chunk(chunk.text)
+
+        return "".join(chunks), self._stream_usage(usage)
+
+    async def astream_llm_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+    ) -> tuple[str, GenerateContentResponseUsageMetadata]:
+        logger.info("Generating LLM Response (Async, Streaming): completion")
+
+        chunks = []
+        usage = None
+        stream = await self.llm_instance.aio.models.generate_content_stream(
+            **self._build_request(system_prompt, user_prompt)
+        )
+        async for chunk in stream:
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                chunks.append(chunk.text)
+                on_chunk(chunk.text)
+
+        return "".join(chunks), self._stream_usage(usage)
+
+    def batch_generate_llm_responses(
+        self,
+        system_prompt: str,
+        user_prompts: list[str],
+        response_format: BaseModel,
+        batch_parameters: DeepResearchBatchParameters,
+    ) -> list[
+        tuple[BaseModel, BatchUsage | GenerateContentResponseUsageMetadata]
+    ]:
+        from google.genai.types import JobState
+
+        # The Batch API is only available in newer google-genai releases
+        if not hasattr(self.llm_instance, "batches"):
+            logger.warning("Gemini: Batch API Unavailable (running online)")
+            return super().batch_generate_llm_responses(
+                system_prompt, user_prompts, response_format, batch_parameters
+            )
+
+        logger.info("Submitting Batch: %d Requests", len(user_prompts))
+
+        batch_job = self.llm_instance.batches.create(
+            model=self.llm_identifier.value.model_identifier,
+            src=[
+                {
+                    "contents": request["contents"],
+                    "config": request["config"],
+                }
+                for request in (
+                    self._build_request(
+                        system_prompt, user_prompt, response_format
+                    )
+                    for user_prompt in user_prompts
+                )
+            ],
+        )
+        logger.info("Batch Submitted: %s", batch_job.name)
+
+        batch_job = _wait_for_batch(
+            batch_id=batch_job.name,
+            retrieve_batch=lambda: self.llm_instance.batches.get(
+                name=batch_job.name
+            ),
+            is_pending=lambda batch_job: batch_job.state
+            in (
+                JobState.JOB_STATE_QUEUED,
+                JobState.JOB_STATE_PENDING,
+                JobState.JOB_STATE_RUNNING,
+                JobState.JOB_STATE_UPDATING,
+            ),
+            cancel_batch=lambda: self.llm_instance.batches.cancel(
+                name=batch_job.name
+            ),
+            batch_parameters=batch_parameters,
+        )
+        if batch_job.state not in (
+            JobState.JOB_STATE_SUCCEEDED,
+            JobState.JOB_STATE_PARTIALLY_SUCCEEDED,
+        ):
+            raise RuntimeError(f"Batch {batch_job.state}: {batch_job.name}")
+
+        results = {}
+        inlined_responses = (
+            batch_job.dest.inlined_responses if batch_job.dest else None
+        ) or []
+        for index, inlined_response in enumerate(inlined_responses):
+            if inlined_response.error or not inlined_response.response:
+                continue
+
+            response = inlined_response.response
+            try:
+                results[index] = (
+                    response_format.model_validate_json(response.text),
+                    BatchUsage(usage=to_token_usage(response.usage_metadata)),
+                )
+            except BATCH_RESULT_ERRORS as exception:
+                logger.warning(
+                    "Batch: Skipping Invalid Result (%s)",
+                    type(exception).__name__,
+                )
+
+        logger.info(
+            "Batch Completed: %s (%d/%d Succeeded)",
+            batch_job.name,
+            len(results),
+            len(user_prompts),
+        )
+        return self._complete_batch_results(
+            system_prompt, user_prompts, response_format, results
+        )
+
+    def _stream_usage(
+        self, usage: Optional[GenerateContentResponseUsageMetadata]
+    ) -> GenerateContentResponseUsageMetadata:
+        from google.genai.types import GenerateContentResponseUsageMetadata
+
+        if usage is None:
+            logger.warning("Gemini: Stream Ended without Usage")
+            return GenerateContentResponseUsageMetadata()
+
+        return usage
+
+    def _cached_request(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+    ) -> tuple[Optional[str], str]:
+        if self.context_cache is None:
+            return None, user_prompt
+
+        # Prompts of the same type share their leading context (e.g. the
+        # instructions and ancestor learnings of the prefix cache layout)
+        return self.context_cache.cached_request(
+            self.llm_identifier,
+            user_prompt,
+            system_instruction=system_prompt,
+            scope=(
+                f"{self.llm_identifier.name}:"
+                f"{response_format.__name__ if response_format else 'text'}"
+            ),
+        )
+
+    # With a cached-content handle, the system instruction is part of the
+    # cached context and must not be sent again
+    def _build_request(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[BaseModel] = None,
+        cached_content: Optional[str] = None,
+    ) -> dict:
+        context_config = (
+            {"cached_content": cached_content}
+            if cached_content
+            else {"system_instruction": system_prompt}
+        )
+        if response_format:
+            return {
+                "model": self.llm_identifier.value.model_identifier,
+                "contents": user_prompt,
+                "config": {
+                    "response_mime_type": "application/json",
+                    **context_config,
+                    "response_schema": response_format,
+                },
+            }
+
+        return {
+            "model": self.llm_identifier.value.model_identifier,
+            "config": context_config,
+            "contents": [user_prompt],
+        }
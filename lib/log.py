@@ -1,23 +1,142 @@
 import logging
+from atexit import register
+from copy import copy
 from datetime import datetime
-
-file_handler = logging.FileHandler(
-    datetime.now().strftime("./logs/%Y-%m-%d_%H-%M-%S.log"), mode="w"
-)
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(
-    logging.Formatter(
-        "%(asctime)s - %(filename)s | %(funcName)s - %(levelname)s - %(message)s"
-    )
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
 )
+from os import makedirs, path
+from queue import SimpleQueue
+from typing import Optional
 
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(filename)s - %(levelname)s - %(message)s")
+FILE_LOG_FORMAT = (
+    "%(asctime)s - %(filename)s | %(funcName)s - %(levelname)s - %(message)s"
 )
+CONSOLE_LOG_FORMAT = "%(asctime)s - %(filename)s - %(levelname)s - %(message)s"
 
+# Importing `lib` never touches the filesystem: handlers are attached by the
+# application through `setup_logging`. Until then, warnings and errors reach
+# stderr through the `logging` module's last-resort handler.
 logger = logging.getLogger("lib")
-logger.setLevel(logging.DEBUG)
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+
+# Set while records are handed to a background thread (asynchronous mode)
+_listener: Optional[QueueListener] = None
+
+
+class TruncatingFormatter(logging.Formatter):
+    def __init__(self, fmt: str, max_message_chars: Optional[int] = None):
+        super().__init__(fmt)
+
+        self.max_message_chars = max_message_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if (
+            self.max_message_chars is not None
+            and len(message) > self.max_message_chars
+        ):
+            message = (
+                f"{message[: self.max_message_chars]}... "
+                f"[truncated: {len(message) - self.max_message_chars} chars]"
+            )
+
+        # Other handlers may format the same record differently
+        record = copy(record)
+        record.msg, record.args = message, None
+        return super().format(record)
+
+
+# Unlike `QueueHandler.prepare`, leaves formatting (and therefore the reprs
+# of the logged objects) to the listener thread. Mutable containers are
+# copied, so that later changes do not leak into the record.
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.args, tuple):
+            record.args = tuple(
+                copy(arg) if isinstance(arg, list | dict | set) else arg
+                for arg in record.args
+            )
+
+        return record
+
+
+def setup_logging(
+    log_dir: Optional[str] = "./logs",
+    console_level: int | str = logging.INFO,
+    file_level: int | str = logging.DEBUG,
+    asynchronous: bool = False,
+    max_message_chars: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    rotate_when: Optional[str] = None,
+    backup_count: int = 5,
+) -> Optional[str]:
+    if max_bytes is not None and rotate_when is not None:
+        raise ValueError("Invalid: max_bytes and rotate_when (choose one)")
+
+    # Replaces earlier handlers, so repeated calls do not duplicate records
+    _stop_listener()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(console_level)
+    console_handler.setFormatter(
+        TruncatingFormatter(CONSOLE_LOG_FORMAT, max_message_chars)
+    )
+    handlers: list[logging.Handler] = [console_handler]
+
+    log_path = None
+    if log_dir is not None:
+        makedirs(log_dir, exist_ok=True)
+        log_path = path.join(
+            log_dir, datetime.now().strftime("%Y-%m-%d_%H-%M-%S.log")
+        )
+
+        if max_bytes is not None:
+            file_handler = RotatingFileHandler(
+                log_path, maxBytes=max_bytes, backupCount=backup_count
+            )
+        elif rotate_when is not None:
+            file_handler = TimedRotatingFileHandler(
+                log_path, when=rotate_when, backupCount=backup_count
+            )
+        else:
+            file_handler = logging.FileHandler(log_path, mode="w")
+
+        file_handler.setLevel(file_level)
+        file_handler.setFormatter(
+            TruncatingFormatter(FILE_LOG_FORMAT, max_message_chars)
+        )
+        handlers.append(file_handler)
+
+    # Records below every handler level are dropped before being formatted
+    logger.setLevel(min(handler.level for handler in handlers))
+
+    if not asynchronous:
+        for handler in handlers:
+            logger.addHandler(handler)
+        return log_path
+
+    global _listener
+    queue = SimpleQueue()
+    _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    logger.addHandler(DeferredQueueHandler(queue))
+    return log_path
+
+
+# Waits for queued records to be written
+@register
+def _stop_listener() -> None:
+    global _listener
+    if _listener is None:
+        return
+
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
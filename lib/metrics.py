@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from threading import Lock, Thread
+from typing import TYPE_CHECKING, Optional
+
+from lib.log import logger
+from lib.types import (
+    BatchUsage,
+    CacheHitUsage,
+    ResearchStage,
+    TokenUsage,
+    UsageDescription,
+)
+
+if TYPE_CHECKING:
+    from google.genai.types import GenerateContentResponseUsageMetadata
+    from openai.types import CompletionUsage
+
+    from lib.constants import LLMIdentifier
+
+# Searches and completions range from sub-second (cache hits) to minutes
+DEFAULT_LATENCY_BUCKETS_S = (
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+METRICS_PREFIX = "deep_researcher"
+
+# (stage, usage, provider, depth)
+SeriesKey = tuple[str, str, str, str]
+SERIES_LABELS = ("stage", "usage", "provider", "depth")
+
+
+# Filled in by the caller while an instrumented call is running
+@dataclass
+class CallRecord:
+    usage: Optional[
+        CompletionUsage
+        | GenerateContentResponseUsageMetadata
+        | BatchUsage
+        | CacheHitUsage
+    ] = None
+    error: bool = False
+    duration_s: Optional[float] = None
+    # Model that answered, when not the plugin's own (a hedged call's backup)
+    llm_identifier: Optional[LLMIdentifier] = None
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> list[int]:
+        cumulative_counts, total = [], 0
+        for bucket_count in self.bucket_counts:
+            total += bucket_count
+            cumulative_counts.append(total)
+
+        return cumulative_counts
+
+
+class CallSeries:
+    def __init__(self, latency_buckets_s: tuple[float, ...]):
+        self.latency_s = Histogram(latency_buckets_s)
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.completion_tokens = 0
+
+
+class ResearchMetrics:
+    def __init__(
+        self, latency_buckets_s: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS_S
+    ):
+        self.latency_buckets_s = tuple(sorted(latency_buckets_s))
+
+        self._series: dict[SeriesKey, CallSeries] = {}
+        self._runs = Histogram(self.latency_buckets_s)
+        self._lock = Lock()
+
+    def __repr__(self):
+        return f"ResearchMetrics(series={len(self._series)})"
+
+    def record_call(
+        self,
+        stage: ResearchStage,
+        usage_description: UsageDescription,
+        provider: str,
+        depth: Optional[int],
+        duration_s: float,
+        usage: Optional[TokenUsage] = None,
+        cache_hit: bool = False,
+        error: bool = False,
+    ) -> None:
+        key = (
+            stage.value,
+            usage_description.value,
+            provider,
+            "none" if depth is None else str(depth),
+        )
+
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = CallSeries(self.latency_buckets_s)
+
+            series.latency_s.observe(duration_s)
+            series.calls += 1
+            series.errors += error
+            series.cache_hits += cache_hit
+            if usage is not None:
+                series.input_tokens += usage.input_tokens
+                series.cached_input_tokens += usage.cached_input_tokens
+                series.completion_tokens += usage.completion_tokens
+
+    def record_run(self, duration_s: float) -> None:
+        with self._lock:
+            self._runs.observe(duration_s)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "series": [
+                    {
+                        "labels": dict(zip(SERIES_LABELS, key, strict=True)),
+                        "calls": series.calls,
+                        "errors": series.errors,
+                        "cache_hits": series.cache_hits,
+                        "input_tokens": series.input_tokens,
+                        "cached_input_tokens": series.cached_input_tokens,
+                        "completion_tokens": series.completion_tokens,
+                        "latency_s": self._histogram_snapshot(series.latency_s),
+                    }
+                    for key, series in sorted(self._series.items())
+                ],
+                "runs": self._histogram_snapshot(self._runs),
+            }
+
+    def _histogram_snapshot(self, histogram: Histogram) -> dict:
+        return {
+            "buckets": dict(
+                zip(
+                    [str(bucket) for bucket in histogram.buckets],
+                    histogram.cumulative_counts(),
+                    strict=True,
+                )
+            ),
+            "count": histogram.count,
+            "sum": histogram.sum,
+        }
+
+    def to_json(self) -> str:
+        return dumps(self.snapshot(), indent=2)
+
+    def write_json(self, json_path: str) -> None:
+        with open(json_path, "w", encoding="utf-8") as file_handle:
+            file_handle.write(self.to_json())
+
+    # Prometheus text exposition format (version 0.0.4)
+    def to_prometheus(self) -> str:
+        counters = (
+            ("calls_total", "Research calls", "calls"),
+            ("call_errors_total", "Failed research calls", "errors"),
+            ("cache_hits_total", "Calls served from a cache", "cache_hits"),
+            ("input_tokens_total", "Input tokens", "input_tokens"),
+            (
+                "cached_input_tokens_total",
+                "Input tokens served from the provider's prompt cache",
+                "cached_input_tokens",
+            ),
+            ("completion_tokens_total", "Completion tokens", "completion_tokens"),
+        )
+
+        with self._lock:
+            series_items = sorted(self._series.items())
+            lines = []
+
+            for name, help_text, attribute in counters:
+                lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+                lines.append(f"# TYPE {METRICS_PREFIX}_{name} counter")
+                lines.extend(
+                    f"{METRICS_PREFIX}_{name}{self._labels(key)} "
+                    f"{getattr(series, attribute)}"
+                    for key, series in series_items
+                )
+
+            name = f"{METRICS_PREFIX}_call_duration_seconds"
+            lines.append(f"# HELP {name} Research call latency")
+            lines.append(f"# TYPE {name} histogram")
+            for key, series in series_items:
+                lines.extend(
+                    self._histogram_lines(name, series.latency_s, key)
+                )
+
+            name = f"{METRICS_PREFIX}_run_duration_seconds"
+            lines.append(f"# HELP {name} Research run latency")
+            lines.append(f"# TYPE {name} histogram")
+            lines.extend(self._histogram_lines(name, self._runs))
+
+        return "\n".join(lines) + "\n"
+
+    def _histogram_lines(
+        self, name: str, histogram: Histogram, key: Optional[SeriesKey] = None
+    ) -> list[str]:
+        lines = [
+            f"{name}_bucket{self._labels(key, le=str(bucket))} {count}"
+            for bucket, count in zip(
+                histogram.buckets, histogram.cumulative_counts(), strict=True
+            )
+        ]
+        lines.append(
+            f"{name}_bucket{self._labels(key, le='+Inf')} {histogram.count}"
+        )
+        lines.append(f"{name}_sum{self._labels(key)} {histogram.sum}")
+        lines.append(f"{name}_count{self._labels(key)} {histogram.count}")
+        return lines
+
+    def _labels(self, key: Optional[SeriesKey], **extra_labels: str) -> str:
+        labels = {
+            **(dict(zip(SERIES_LABELS, key, strict=True)) if key else {}),
+            **extra_labels,
+        }
+        if not labels:
+            return ""
+
+        return (
+            "{"
+            + ",".join(
+                f'{name}="{self._escape(value)}"'
+                for name, value in labels.items()
+            )
+            + "}"
+        )
+
+    def _escape(self, value: str) -> str:
+        return (
+            value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+
+
+# Serves `/metrics` (Prometheus) and `/metrics.json` for scraping
+class MetricsServer:
+    def __init__(
+        self,
+        metrics: ResearchMetrics,
+        host: str = "127.0.0.1",
+        port: int = 9464,
+    ):
+        self.metrics = metrics
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    def __repr__(self):
+        host, port = self._server.server_address[:2]
+        return f"MetricsServer(address={host}:{port})"
+
+    def start(self) -> None:
+        Thread(
+            target=self._server.serve_forever,
+            name="metrics-server",
+            daemon=True,
+        ).start()
+        logger.info("Metrics: Serving on %s", self)
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug("Metrics: %s", format % args)
+
+            def do_GET(self):
+                if self.path == "/metrics":
+                    content = metrics.to_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path == "/metrics.json":
+                    content = metrics.to_json().encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        return Handler
@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+from typing import Literal, Optional
+
+from lib.config import DeepResearchHyperParameters
+
+
+@dataclass
+class BatchJob:
+    job_id: str
+    user_query: str
+    research_parameters: Optional[DeepResearchHyperParameters] = None
+
+    def __repr__(self):
+        return (
+            f"BatchJob(job_id={self.job_id}, "
+            f"research_parameters={self.research_parameters})"
+        )
+
+
+@dataclass
+class BatchJobResult:
+    job_id: str
+    status: Literal["completed", "failed"]
+    duration_s: float
+    num_learnings: int = 0
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    completion_tokens: int = 0
+    total_calls: int = 0
+    search_calls: int = 0
+    cost: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchSummary:
+    completed_jobs: int
+    failed_jobs: int
+    skipped_jobs: int
+    duration_s: float
+    input_tokens: int
+    completion_tokens: int
+    cost: float
+
+    @property
+    def jobs_per_hour(self) -> float:
+        if self.duration_s <= 0:
+            return 0.0
+
+        return self.completed_jobs / self.duration_s * 3600
+
+    @property
+    def tokens_per_s(self) -> float:
+        if self.duration_s <= 0:
+            return 0.0
+
+        return (self.input_tokens + self.completion_tokens) / self.duration_s
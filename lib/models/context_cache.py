@@ -0,0 +1,24 @@
+from dataclasses import dataclass
+
+from lib.constants import LLMIdentifier
+
+
+@dataclass
+class CachedContextHandle:
+    # Provider resource name (e.g. "cachedContents/...")
+    name: str
+    llm_identifier: LLMIdentifier
+    # Leading part of the user prompt stored with the system instruction
+    context: str
+    num_tokens: int
+    # Wall-clock (epoch) seconds, as reported by the provider
+    expire_time_s: float
+    last_used_time_s: float
+
+    def __repr__(self):
+        return (
+            f"CachedContextHandle(name={self.name}, "
+            f"llm_identifier={self.llm_identifier.name}, "
+            f"context={len(self.context)} chars, "
+            f"num_tokens={self.num_tokens})"
+        )
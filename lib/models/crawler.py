@@ -1,4 +1,8 @@
 from dataclasses import dataclass
+from typing import Optional
+
+# Page content can be megabytes; reprs (e.g. in debug logs) show a preview
+REPR_CONTENT_CHARS = 200
 
 
 @dataclass
@@ -9,11 +13,17 @@ class SERPQuerySearchResult:
     url: str
 
     def __repr__(self):
+        content = (
+            f"{self.content[:REPR_CONTENT_CHARS]}... "
+            f"({len(self.content)} chars)"
+            if len(self.content) > REPR_CONTENT_CHARS
+            else self.content
+        )
         return (
             f"SERPQuerySearchResult("
             f"title={self.title}, "
             f"description={self.description}, "
-            f"content={self.content}, "
+            f"content={content}, "
             f"url={self.url})"
         )
 
@@ -26,3 +36,35 @@ class SERPQuerySearchResults:
         return (
             f"SERPQuerySearchResults(search_results={self.search_results})"
         )
+
+
+@dataclass
+class FetchedPage:
+    url: str
+    status_code: Optional[int]
+    content: str = ""
+    content_type: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # Body or text cut off at the fetcher's caps
+    truncated: bool = False
+    # Served from the page cache after a 304 Not Modified
+    revalidated: bool = False
+    error: Optional[str] = None
+
+    def __repr__(self):
+        content = (
+            f"{self.content[:REPR_CONTENT_CHARS]}... "
+            f"({len(self.content)} chars)"
+            if len(self.content) > REPR_CONTENT_CHARS
+            else self.content
+        )
+        return (
+            f"FetchedPage("
+            f"url={self.url}, "
+            f"status_code={self.status_code}, "
+            f"content={content}, "
+            f"truncated={self.truncated}, "
+            f"revalidated={self.revalidated}, "
+            f"error={self.error})"
+        )
@@ -0,0 +1,31 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+from lib.models.llm import SERPQuery
+from lib.types import TokenUsage
+
+
+@dataclass
+class JournalNode:
+    path: tuple[int, ...]
+    serp_query: SERPQuery
+    learning: str
+    follow_up_queries: list[str]
+    usage: TokenUsage
+    source_urls: list[str] = field(default_factory=list)
+
+
+@dataclass
+class JournalState:
+    user_query: Optional[str] = None
+    # Child SERP queries generated under each path (the root is `()`)
+    serp_queries: dict[tuple[int, ...], list[SERPQuery]] = field(
+        default_factory=dict
+    )
+    nodes: dict[tuple[int, ...], JournalNode] = field(default_factory=dict)
+
+    def __repr__(self):
+        return (
+            f"JournalState(user_query={self.user_query is not None}, "
+            f"serp_queries={len(self.serp_queries)}, nodes={len(self.nodes)})"
+        )
@@ -0,0 +1,34 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class LearningRecord:
+    # Tree position (sibling indices from the root)
+    path: tuple[int, ...]
+    query: str
+    research_goal: str
+    learning: str
+    source_urls: list[str] = field(default_factory=list)
+
+    @property
+    def depth(self) -> int:
+        return len(self.path) - 1
+
+    @property
+    def text(self) -> str:
+        text = (
+            f"SERP Query: {self.query}\n"
+            f"Research Goal: {self.research_goal}\n"
+            f"Learnings: {self.learning}"
+        )
+        if self.source_urls:
+            text += "\nSources: " + ", ".join(self.source_urls)
+
+        return text
+
+    def __repr__(self):
+        return (
+            f"LearningRecord(path={self.path}, query={self.query}, "
+            f"learning={len(self.learning)} chars, "
+            f"source_urls={len(self.source_urls)})"
+        )
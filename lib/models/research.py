@@ -0,0 +1,52 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+from lib.models.learnings import LearningRecord
+from lib.models.llm import SERPQuery
+
+
+@dataclass
+class ResearchNode:
+    serp_query: SERPQuery
+    depth: int
+    # Tree position (sibling indices from the root)
+    path: tuple[int, ...]
+    # Learnings of the ancestors (used to expand the node's children)
+    learnings: list[str] = field(default_factory=list)
+
+    def __repr__(self):
+        return f"ResearchNode(path={self.path}, depth={self.depth})"
+
+
+# SERP queries prompt for the children of a node (or of the root)
+@dataclass
+class ResearchExpansion:
+    user_query: str
+    width: int
+    # Depth of the children
+    depth: int
+    # Path of the expanded node; () for the root
+    path: tuple[int, ...] = ()
+    # Learnings of the children's ancestors
+    learnings: list[str] = field(default_factory=list)
+
+    def __repr__(self):
+        return (
+            f"ResearchExpansion(path={self.path}, depth={self.depth}, "
+            f"width={self.width})"
+        )
+
+
+@dataclass
+class NodeResult:
+    record: LearningRecord
+    novelty: float
+    # None when the node is a leaf (max depth reached or branch pruned)
+    expansion: Optional[ResearchExpansion] = None
+
+    def __repr__(self):
+        return (
+            f"NodeResult(path={self.record.path}, "
+            f"novelty={self.novelty:.2f}, "
+            f"expanded={self.expansion is not None})"
+        )
@@ -0,0 +1,18 @@
+from dataclasses import dataclass
+
+from lib.models.research import ResearchNode
+
+
+@dataclass
+class FrontierNode(ResearchNode):
+    # Novelty of the parent's learning; 1.0 for nodes under the root
+    novelty: float = 1.0
+    estimated_cost: float = 0.0
+    priority: float = 0.0
+
+    def __repr__(self):
+        return (
+            f"FrontierNode(path={self.path}, depth={self.depth}, "
+            f"priority={self.priority:.3f}, "
+            f"estimated_cost={self.estimated_cost:.6f})"
+        )
@@ -1,9 +1,17 @@
 from enum import Enum
 from os import path
+from typing import Literal
 
 from lib.log import logger
 
 
+# "prefix_cache" puts stable instructions first and volatile data last, so
+# that calls share a long prefix for provider prompt caching. Layouts only
+# override some templates (`lib/prompts/<layout>/`); the rest are shared.
+PromptLayout = Literal["default", "prefix_cache"]
+PROMPT_LAYOUTS: tuple[PromptLayout, ...] = ("default", "prefix_cache")
+
+
 class PromptTemplates(Enum):
     SYSTEM_PROMPT = "system_prompt"
     USER_PROMPT__SERP_QUERY_GENERATION = "up_serp_query_generation"
@@ -16,6 +24,8 @@ class PromptTemplates(Enum):
     )
     USER_PROMPT__LEARNING_GENERATION = "up_learning_generation"
     USER_PROMPT__REPORT_GENERATION = "up_report_generation"
+    USER_PROMPT__REPORT_PARTIAL_SUMMARY = "up_report_partial_summary"
+    USER_PROMPT__REPORT_MERGE = "up_report_merge"
 
 
 # Singleton Factory
@@ -39,6 +49,11 @@ class PromptFactory:
             PromptTemplates.USER_PROMPT__QUERY_REFINEMENT: "",
             PromptTemplates.USER_PROMPT__LEARNING_GENERATION: "",
             PromptTemplates.USER_PROMPT__REPORT_GENERATION: "",
+            PromptTemplates.USER_PROMPT__REPORT_PARTIAL_SUMMARY: "",
+            PromptTemplates.USER_PROMPT__REPORT_MERGE: "",
+        }
+        self._layout_prompts: dict[str, dict[PromptTemplates, str]] = {
+            layout: {} for layout in PROMPT_LAYOUTS if layout != "default"
         }
 
         self._load_prompts()
@@ -55,6 +70,24 @@ class PromptFactory:
             ) as f:
                 self._prompts[prompt] = f.read()
 
-    def get_prompt(self, prompt_template: PromptTemplates, **kwargs):
-        logger.debug("Fetched Prompt: %s", prompt_template.name)
-        return self._prompts[prompt_template].format(**kwargs)
+            for layout, layout_prompts in self._layout_prompts.items():
+                layout_path = path.join(
+                    base_path, "prompts", layout, f"{prompt.value}.md"
+                )
+                if not path.exists(layout_path):
+                    continue
+
+                with open(layout_path, "r", encoding="utf-8") as f:
+                    layout_prompts[prompt] = f.read()
+
+    def get_prompt(
+        self,
+        prompt_template: PromptTemplates,
+        layout: PromptLayout = "default",
+        **kwargs,
+    ):
+        logger.debug("Fetched Prompt: %s (%s)", prompt_template.name, layout)
+        prompt = self._layout_prompts.get(layout, {}).get(
+            prompt_template, self._prompts[prompt_template]
+        )
+        return prompt.format(**kwargs)
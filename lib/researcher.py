@@ -1,21 +1,105 @@
+from __future__ import annotations
+
+from asyncio import TaskGroup, to_thread
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar, copy_context
+from datetime import datetime
+from itertools import groupby
 from time import perf_counter
-from typing import Optional
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Literal,
+    Optional,
+)
 
-from openai.types import CompletionUsage
 from pydantic import BaseModel
 
-from lib.analytics import Analytics
-from lib.config import DeepResearchHyperParameters
+from lib.analytics import (
+    Analytics,
+    search_call_cost,
+    sum_token_usage,
+    to_token_usage,
+    usage_cost,
+)
+from lib.concurrency import ProviderLimiter, provider_key
+from lib.config import (
+    DeepResearchBatchParameters,
+    DeepResearchConcurrencyParameters,
+    DeepResearchHyperParameters,
+    DeepResearchLearningParameters,
+    DeepResearchSchedulerParameters,
+    DeepResearchTokenBudgetParameters,
+)
+from lib.constants import LLMIdentifier
 from lib.crawlers import Crawler, LLMCrawler
+from lib.dedup import QueryRegistry
+from lib.hedging import call_limiter, call_llm_identifier, call_stage
+from lib.journal import ResearchJournal
+from lib.learnings import (
+    BM25Index,
+    LearningStore,
+    NoveltyTracker,
+    select_relevant,
+)
 from lib.llm import LLMModel
 from lib.log import logger
+from lib.metrics import CallRecord, ResearchMetrics
 from lib.models.crawler import SERPQuerySearchResults
+from lib.models.journal import JournalNode, JournalState
+from lib.models.learnings import LearningRecord
 from lib.models.llm import (
     Learning,
     SERPQueries,
+    SERPQuery,
     UserQueryRefinementQuestions,
 )
-from lib.types import UsageDescription
+from lib.models.research import NodeResult, ResearchExpansion, ResearchNode
+from lib.prompts import PromptFactory, PromptLayout, PromptTemplates
+from lib.tracing import (
+    SPAN_KIND_CLIENT,
+    SPAN_KIND_INTERNAL,
+    ResearchTracer,
+    Span,
+)
+from lib.scheduler import ResearchBudget
+from lib.strategies import (
+    AsyncStrategy,
+    BestFirstStrategy,
+    ConcurrentStrategy,
+    LevelSynchronousStrategy,
+    ResearchStrategy,
+    SequentialStrategy,
+)
+from lib.tokens import PromptBudget
+from lib.types import (
+    BatchUsage,
+    CacheHitUsage,
+    ResearchStage,
+    TokenUsage,
+    UsageDescription,
+)
+
+if TYPE_CHECKING:
+    from google.genai.types import GenerateContentResponseUsageMetadata
+    from openai.types import CompletionUsage
+
+# Usage of the calls made inside the current `_usage_scope` (if any)
+_scope_usages: ContextVar[Optional[list[TokenUsage]]] = ContextVar(
+    "scope_usages", default=None
+)
+# Tree depth of the node the current call belongs to (None outside the tree)
+_scope_depth: ContextVar[Optional[int]] = ContextVar(
+    "scope_depth", default=None
+)
+# Cost (dollars) of the calls made inside the current `cost_scope` (if any)
+_scope_costs: ContextVar[Optional[list[float]]] = ContextVar(
+    "scope_costs", default=None
+)
 
 
 class DeepResearcher:
@@ -25,7 +109,34 @@ class DeepResearcher:
         llm_model: LLMModel,
         research_parameters: Optional[DeepResearchHyperParameters] = None,
         analytics_instance: Optional[Analytics] = None,
+        concurrency_parameters: Optional[
+            DeepResearchConcurrencyParameters
+        ] = None,
+        token_budget_parameters: Optional[
+            DeepResearchTokenBudgetParameters
+        ] = None,
+        report_mode: Literal["single", "hierarchical"] = "single",
+        query_registry: Optional[QueryRegistry] = None,
+        journal: Optional[ResearchJournal] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+        limiter: Optional[ProviderLimiter] = None,
+        batch_parameters: Optional[DeepResearchBatchParameters] = None,
+        metrics_instance: Optional[ResearchMetrics] = None,
+        tracer: Optional[ResearchTracer] = None,
+        scheduler_parameters: Optional[DeepResearchSchedulerParameters] = None,
+        prompt_layout: PromptLayout = "default",
+        learning_parameters: Optional[DeepResearchLearningParameters] = None,
+        stage_llm_models: Optional[dict[ResearchStage, LLMModel]] = None,
     ):
+        if scheduler_parameters and batch_parameters:
+            raise ValueError(
+                "Invalid: scheduler_parameters (not supported in batch mode)"
+            )
+        if stage_llm_models and ResearchStage.SEARCH in stage_llm_models:
+            raise ValueError(
+                "Invalid: stage_llm_models (searches are made by the crawler)"
+            )
+
         self.crawler = crawler
         self.llm_model = llm_model
         self.research_parameters = research_parameters or DeepResearchHyperParameters(
@@ -35,163 +146,1193 @@ class DeepResearcher:
             learning_depth=2,
         )
         self.analytics_instance = analytics_instance
+        self.concurrency_parameters = concurrency_parameters
+        self.token_budget_parameters = token_budget_parameters
+        self.report_mode = report_mode
+        self.query_registry = query_registry
+        self.journal = journal
+        # Shared by several researchers (e.g. batch runs); never shut down here
+        self.executor = executor
+        # Trades latency for the provider batch API discount
+        self.batch_parameters = batch_parameters
+        self.metrics_instance = metrics_instance
+        self.tracer = tracer
+        # Expands the most promising nodes first until a budget runs out
+        self.scheduler_parameters = scheduler_parameters
+        self.prompt_layout = prompt_layout
+        # Ranks learnings by relevance for the report and follow-up prompts
+        self.learning_parameters = learning_parameters
+        # Stages without a model of their own use `llm_model`
+        self.stage_llm_models = stage_llm_models or {}
+
+        self.prompt_factory = PromptFactory()
+        self.system_prompt = self.prompt_factory.get_prompt(
+            PromptTemplates.SYSTEM_PROMPT, now=datetime.now().strftime("%Y-%m-%d")
+        )
+        self._limiter = limiter or ProviderLimiter(
+            concurrency_parameters.max_in_flight_per_provider
+            if concurrency_parameters
+            else None
+        )
+        # Prompts are budgeted for the context window of their stage's model
+        self._prompt_budgets = (
+            self._model_budgets(token_budget_parameters)
+            if token_budget_parameters
+            else {}
+        )
+        # Group sizes for the hierarchical report follow the context window
+        # even when prompt budgeting is otherwise disabled.
+        self._report_budgets = self._prompt_budgets or (
+            self._model_budgets(DeepResearchTokenBudgetParameters())
+            if report_mode == "hierarchical"
+            else {}
+        )
 
+        # One record per distinct learning; `final_learnings` holds their text
+        self.learning_store = (
+            LearningStore(
+                k1=learning_parameters.bm25_k1, b=learning_parameters.bm25_b
+            )
+            if learning_parameters
+            else LearningStore()
+        )
+        # Novelty of each learning against the learnings of its ancestors
+        self.novelty_tracker = NoveltyTracker()
         self.final_learnings = []
+        # Tree position of each learning (sibling indices from the root)
+        self.final_learning_paths: list[tuple[int, ...]] = []
+        # Set when resuming; completed nodes are replayed from it
+        self._journal_state: Optional[JournalState] = None
+        # Set while a best-first run is in progress
+        self.budget: Optional[ResearchBudget] = None
 
-    def __call__(self, user_query: str, auto_query_refinement: bool = False):
-        start_time_s = perf_counter()
+    def __call__(
+        self,
+        user_query: str,
+        auto_query_refinement: bool = False,
+        resume: bool = False,
+        on_report_chunk: Optional[Callable[[str], None]] = None,
+    ):
+        with self._span(
+            "deep_research",
+            report_mode=self.report_mode,
+            learning_width=self.research_parameters.learning_width,
+            learning_depth=self.research_parameters.learning_depth,
+            resume=resume,
+        ) as span:
+            start_time_s = perf_counter()
+            self._log_run_configuration(user_query=user_query)
 
+            try:
+                journaled_user_query = self._load_journal(resume=resume)
+                if journaled_user_query is not None:
+                    logger.info("Query Refinement: Resumed from Journal")
+                    user_query = journaled_user_query
+                elif auto_query_refinement:
+                    logger.info("Query Refinement: Auto")
+                    user_query = self._auto_refine_user_query(
+                        user_query=user_query
+                    )
+                else:
+                    logger.info("Query Refinement: Manual")
+                    new_questions = self._refine_user_query(
+                        user_query=user_query
+                    )
+                    answers = self._prompt_user_for_answers(
+                        questions=new_questions
+                    )
+                    user_query = self._append_refinement_answers(
+                        user_query=user_query,
+                        questions=new_questions,
+                        answers=answers,
+                    )
+
+                if self.journal is not None and journaled_user_query is None:
+                    self.journal.record_run(user_query=user_query)
+
+                self.run(
+                    width=self.research_parameters.learning_width,
+                    user_query=user_query,
+                )
+            finally:
+                if self.journal is not None:
+                    self.journal.close()
+
+            report = self._generate_report(
+                user_query=user_query, on_chunk=on_report_chunk
+            )
+            self._log_run_summary(start_time_s=start_time_s)
+            if span is not None:
+                span.set_attributes(num_learnings=len(self.final_learnings))
+            return self.final_learnings, report
+
+    async def acall(
+        self,
+        user_query: str,
+        auto_query_refinement: bool = False,
+        resume: bool = False,
+        on_report_chunk: Optional[Callable[[str], None]] = None,
+    ):
+        with self._span(
+            "deep_research",
+            report_mode=self.report_mode,
+            learning_width=self.research_parameters.learning_width,
+            learning_depth=self.research_parameters.learning_depth,
+            resume=resume,
+        ) as span:
+            start_time_s = perf_counter()
+            self._log_run_configuration(user_query=user_query)
+
+            try:
+                journaled_user_query = self._load_journal(resume=resume)
+                if journaled_user_query is not None:
+                    logger.info("Query Refinement: Resumed from Journal")
+                    user_query = journaled_user_query
+                elif auto_query_refinement:
+                    logger.info("Query Refinement: Auto")
+                    user_query = self._auto_refine_user_query(
+                        user_query=user_query
+                    )
+                else:
+                    logger.info("Query Refinement: Manual")
+                    new_questions = await self._arefine_user_query(
+                        user_query=user_query
+                    )
+                    answers = await to_thread(
+                        self._prompt_user_for_answers, questions=new_questions
+                    )
+                    user_query = self._append_refinement_answers(
+                        user_query=user_query,
+                        questions=new_questions,
+                        answers=answers,
+                    )
+
+                if self.journal is not None and journaled_user_query is None:
+                    self.journal.record_run(user_query=user_query)
+
+                await self.arun(
+                    width=self.research_parameters.learning_width,
+                    user_query=user_query,
+                )
+            finally:
+                if self.journal is not None:
+                    self.journal.close()
+
+            report = await self._agenerate_report(
+                user_query=user_query, on_chunk=on_report_chunk
+            )
+            self._log_run_summary(start_time_s=start_time_s)
+            if span is not None:
+                span.set_attributes(num_learnings=len(self.final_learnings))
+            return self.final_learnings, report
+
+    def _log_run_configuration(self, user_query: str) -> None:
         logger.info("Starting Deep Researcher")
         logger.debug("User Query: %s", user_query)
         logger.debug("LLM: %s", self.llm_model)
+        logger.debug(
+            "Stage LLMs: %s",
+            {
+                stage.value: llm_model
+                for stage, llm_model in self.stage_llm_models.items()
+            },
+        )
         logger.debug("Crawler: %s", self.crawler)
         logger.debug("Research Parameters: %s", self.research_parameters)
+        logger.debug(
+            "Concurrency Parameters: %s", self.concurrency_parameters
+        )
+        logger.debug(
+            "Token Budget Parameters: %s", self.token_budget_parameters
+        )
+        logger.debug("Report Mode: %s", self.report_mode)
+        logger.debug("Prompt Layout: %s", self.prompt_layout)
+        logger.debug("Journal: %s", self.journal)
+        logger.debug("Batch Parameters: %s", self.batch_parameters)
+        logger.debug("Scheduler Parameters: %s", self.scheduler_parameters)
+        logger.debug("Learning Parameters: %s", self.learning_parameters)
+        logger.debug(
+            "Query Deduplication: %s",
+            "Enabled" if self.query_registry is not None else "Disabled",
+        )
         logger.debug(
             "Analytics: %s",
             "Enabled" if self.analytics_instance else "Disabled",
         )
-
-        if auto_query_refinement:
-            logger.info("Query Refinement: Auto")
-            user_query = (
-                USER_PROMPT__QUERY_GENERATION_ADDON__AUTO_REFINEMENT_QUERY.format(
-                    user_query=user_query
-                )
-            )
-        else:
-            logger.info("Query Refinement: Manual")
-            new_questions = self._refine_user_query(user_query=user_query)
-            answers = self._prompt_user_for_answers(questions=new_questions)
-
-            logger.info("Generated: %d Follow-up Questions", len(new_questions))
-            user_query += "\n\nFollow-up Questions and Answers:\n" + "\n\n".join([
-                f"Question: {question}\nAnswer: {answer}"
-                for question, answer in zip(new_questions, answers, strict=False)
-            ])
-        self.run(
-            width=self.research_parameters.learning_width,
-            depth=0,
-            user_query=user_query,
-            learnings=[],
+        logger.debug(
+            "Metrics: %s", "Enabled" if self.metrics_instance else "Disabled"
         )
+        logger.debug("Tracer: %s", self.tracer)
 
-        report = self._generate_report(user_query=user_query)
+    def _log_run_summary(self, start_time_s: float) -> None:
         logger.debug("Generated: %d Learnings", len(self.final_learnings))
+        if self.learning_store.duplicates_found:
+            logger.info(
+                "Learning Store: Dropped %d Duplicate Learnings",
+                self.learning_store.duplicates_found,
+            )
+
+        if self.novelty_tracker.branches_pruned:
+            logger.info(
+                "Novelty Pruning: %d Branches (Avoided: %d Searches, %d LLM "
+                "Calls)",
+                self.novelty_tracker.branches_pruned,
+                self.novelty_tracker.searches_avoided,
+                self.novelty_tracker.llm_calls_avoided,
+            )
         logger.info("Deep Researcher Completed")
 
+        if self.query_registry is not None:
+            logger.info(
+                "Query Deduplication: %d Duplicates (Avoided: %d Searches, "
+                "%d LLM Calls)",
+                self.query_registry.duplicates_found,
+                self.query_registry.searches_avoided,
+                self.query_registry.llm_calls_avoided,
+            )
+
         if self.analytics_instance:
             cost = self.analytics_instance.total_cost(
                 llm_model=self.llm_model.llm_identifier,
-                search_context_size=self.crawler.search_context_size,  # None | "low" | "medium" | "high"
+                search_context_size=getattr(
+                    self.crawler, "search_context_size", None
+                ),  # None | "low" | "medium" | "high"
+                search_llm_model=getattr(self.crawler, "llm_identifier", None),
             )
             logger.info("Total Cost: $%f", cost)
+            self._log_cost_breakdown()
+            if self.analytics_instance.hedged_calls:
+                logger.info(
+                    "Hedged Requests: %d (Backup Wins: %d, Hedge Cost: $%f)",
+                    self.analytics_instance.hedged_calls,
+                    self.analytics_instance.hedge_backup_wins,
+                    self.analytics_instance.total_hedge_cost,
+                )
+            if self.analytics_instance.context_cache_handles:
+                logger.info(
+                    "Context Cache: %d Handles (Storage Cost: $%f)",
+                    self.analytics_instance.context_cache_handles,
+                    self.analytics_instance.total_context_cache_storage_cost,
+                )
+            logger.info(
+                "Cached Input Savings: $%f",
+                self.analytics_instance.cached_input_savings(),
+            )
+
+            for stage, cached_input_ratio in (
+                self.analytics_instance.stage_cached_input_ratios().items()
+            ):
+                logger.info(
+                    "Prompt Cache: %s (%.1f%% of %d Input Tokens Cached)",
+                    stage,
+                    cached_input_ratio * 100,
+                    self.analytics_instance.stage_input_tokens[stage],
+                )
 
         end_time_s = perf_counter() - start_time_s
         logger.info("Execution Time: %.2f seconds", end_time_s)
-        return self.final_learnings, report
+        if self.metrics_instance:
+            self.metrics_instance.record_run(duration_s=end_time_s)
+
+    def _log_cost_breakdown(self) -> None:
+        stage_latencies_s = self.analytics_instance.stage_mean_latencies_s()
+        for stage, stage_cost in self.analytics_instance.stage_cost.items():
+            logger.info(
+                "Stage Cost: %s ($%f, %d Calls, %.2f seconds Mean Latency)",
+                stage,
+                stage_cost,
+                self.analytics_instance.stage_calls[stage],
+                stage_latencies_s.get(stage, 0.0),
+            )
+
+        model_latencies_s = self.analytics_instance.model_mean_latencies_s()
+        for name, model_cost in self.analytics_instance.model_cost.items():
+            logger.info(
+                "Model Cost: %s ($%f, %d Calls, %.2f seconds Mean Latency)",
+                name,
+                model_cost,
+                self.analytics_instance.model_calls[name],
+                model_latencies_s.get(name, 0.0),
+            )
+
+    def _model_budgets(
+        self, token_budget_parameters: DeepResearchTokenBudgetParameters
+    ) -> dict[LLMIdentifier, PromptBudget]:
+        return {
+            llm_model.llm_identifier: PromptBudget(
+                llm_model.llm_identifier, token_budget_parameters
+            )
+            for llm_model in (self.llm_model, *self.stage_llm_models.values())
+        }
+
+    def _prompt_budget(self, stage: ResearchStage) -> Optional[PromptBudget]:
+        return self._prompt_budgets.get(
+            self.stage_llm_model(stage).llm_identifier
+        )
+
+    def _report_budget(self, stage: ResearchStage) -> Optional[PromptBudget]:
+        return self._report_budgets.get(
+            self.stage_llm_model(stage).llm_identifier
+        )
+
+    def _get_prompt(self, prompt_template: PromptTemplates, **kwargs) -> str:
+        return self.prompt_factory.get_prompt(
+            prompt_template, layout=self.prompt_layout, **kwargs
+        )
+
+    def _auto_refine_user_query(self, user_query: str) -> str:
+        return self._get_prompt(
+            PromptTemplates.USER_PROMPT__QUERY_GENERATION_ADDON__AUTO_REFINEMENT_QUERY,
+            user_query=user_query,
+        )
+
+    def _append_refinement_answers(
+        self, user_query: str, questions: list[str], answers: list[str]
+    ) -> str:
+        logger.info("Generated: %d Follow-up Questions", len(questions))
+        return user_query + "\n\nFollow-up Questions and Answers:\n" + "\n\n".join([
+            f"Question: {question}\nAnswer: {answer}"
+            for question, answer in zip(questions, answers, strict=False)
+        ])
 
     def _prompt_user_for_answers(self, questions: list[str]) -> list[str]:
         return [input(f"{question}: ") for question in questions]
 
-    def run(
+    def run(self, width: int, user_query: str) -> None:
+        strategy = self._strategy(asynchronous=False)
+        logger.info("Execution Mode: %s", strategy.name)
+        logger.debug("Width: %d | Depth: 0", width)
+
+        self._record_learnings(
+            strategy.run(
+                ResearchExpansion(user_query=user_query, width=width, depth=0)
+            )
+        )
+
+    async def arun(self, width: int, user_query: str) -> None:
+        strategy = self._strategy(asynchronous=True)
+        logger.info("Execution Mode: %s", strategy.name)
+        logger.debug("Width: %d | Depth: 0", width)
+
+        self._record_learnings(
+            await strategy.arun(
+                ResearchExpansion(user_query=user_query, width=width, depth=0)
+            )
+        )
+
+    def _strategy(self, asynchronous: bool) -> ResearchStrategy:
+        if self.scheduler_parameters:
+            return BestFirstStrategy(self)
+        if self.batch_parameters:
+            return LevelSynchronousStrategy(self)
+        if asynchronous:
+            return AsyncStrategy(self)
+        if self.concurrency_parameters:
+            return ConcurrentStrategy(self)
+
+        return SequentialStrategy(self)
+
+    def _record_learnings(self, records: list[LearningRecord]) -> None:
+        # Paths sort into depth-first pre-order, whichever branch finished
+        # first
+        for record in sorted(records, key=lambda record: record.path):
+            self._record_learning(record)
+
+    # The node step shared by every strategy: research a node, then decide
+    # whether (and with which prompt) its children are generated.
+    def research_node(
         self,
-        width: int,
-        depth: int,
-        user_query: str,
-        learnings: list[str],
-    ) -> None:
-        logger.info("Running Deep Researcher")
-        logger.debug(
-            "Width: %d | Depth: %d",
-            width,
-            depth,
+        node: ResearchNode,
+        prompt_learnings: Optional[list[str]] = None,
+    ) -> NodeResult:
+        learning, follow_up_queries, source_urls = self._research_serp_query(
+            node=node
+        )
+        return self._node_result(
+            node=node,
+            learning=learning,
+            follow_up_queries=follow_up_queries,
+            source_urls=source_urls,
+            prompt_learnings=prompt_learnings,
         )
-        logger.debug("User Query: %s", user_query)
 
-        serp_queries = self._generate_serp_queries(
-            user_query=user_query, width=width
-        ).queries
+    async def aresearch_node(self, node: ResearchNode) -> NodeResult:
+        learning, follow_up_queries, source_urls = (
+            await self._aresearch_serp_query(node=node)
+        )
+        return self._node_result(
+            node=node,
+            learning=learning,
+            follow_up_queries=follow_up_queries,
+            source_urls=source_urls,
+        )
 
-        logger.info("Generated: %d SERP Queries", len(serp_queries))
-        logger.debug(
-            "SERP Queries:\n%s",
-            serp_queries,
+    def expand_node(self, expansion: ResearchExpansion) -> list[ResearchNode]:
+        return self._child_nodes(
+            expansion=expansion,
+            serp_queries=self._expand_serp_queries(expansion=expansion),
         )
 
-        for serp_query in serp_queries:
-            if depth == 0:
-                learnings.clear()
+    async def aexpand_node(
+        self, expansion: ResearchExpansion
+    ) -> list[ResearchNode]:
+        return self._child_nodes(
+            expansion=expansion,
+            serp_queries=await self._aexpand_serp_queries(expansion=expansion),
+        )
 
-            if isinstance(self.crawler, LLMCrawler):
-                logger.info("Crawler: LLM-based")
-                serp_data = self._search_query(
-                    query=f"Query: {serp_query.query}\nResearch Goal: {serp_query.research_goal}"
+    # Every expansion of a level has the same depth. A level is two batches:
+    # SERP queries, then learnings.
+    def research_level(
+        self, expansions: list[ResearchExpansion]
+    ) -> list[NodeResult]:
+        with self._span(
+            "research_level",
+            depth=expansions[0].depth,
+            num_expansions=len(expansions),
+        ):
+            nodes = [
+                node
+                for expansion, serp_queries in zip(
+                    expansions,
+                    self._batch_expand_serp_queries(expansions=expansions),
+                    strict=True,
+                )
+                for node in self._child_nodes(
+                    expansion=expansion, serp_queries=serp_queries
+                )
+            ]
+
+            return [
+                self._node_result(
+                    node=node,
+                    learning=learning,
+                    follow_up_queries=follow_up_queries,
+                    source_urls=source_urls,
+                )
+                for node, (learning, follow_up_queries, source_urls) in zip(
+                    nodes,
+                    self._batch_research_serp_queries(nodes=nodes),
+                    strict=True,
                 )
+            ]
+
+    def _node_result(
+        self,
+        node: ResearchNode,
+        learning: str,
+        follow_up_queries: list[str],
+        source_urls: list[str],
+        prompt_learnings: Optional[list[str]] = None,
+    ) -> NodeResult:
+        result = NodeResult(
+            record=LearningRecord(
+                path=node.path,
+                query=node.serp_query.query,
+                research_goal=node.serp_query.research_goal,
+                learning=learning,
+                source_urls=source_urls,
+            ),
+            novelty=self.novelty_tracker.novelty(
+                learning=learning, ancestor_learnings=node.learnings
+            ),
+        )
+        if self._prune_branch(
+            novelty=result.novelty, depth=node.depth, path=node.path
+        ):
+            return result
+
+        new_depth = node.depth + 1
+        if new_depth >= self.research_parameters.learning_depth:
+            logger.debug("Max Depth Reached")
+            return result
+
+        # Children only see the learnings of their own ancestors, unless the
+        # strategy passes more (e.g. those of earlier siblings).
+        learnings = [*node.learnings, learning]
+        result.expansion = ResearchExpansion(
+            user_query=self._previous_research_details_prompt(
+                serp_query=node.serp_query,
+                learnings=(
+                    learnings
+                    if prompt_learnings is None
+                    else [*prompt_learnings, learning]
+                ),
+                follow_up_queries=follow_up_queries,
+            ),
+            width=self.research_parameters.calculate_width_for_depth(
+                depth=new_depth
+            ),
+            depth=new_depth,
+            path=node.path,
+            learnings=learnings,
+        )
+        return result
+
+    def _child_nodes(
+        self, expansion: ResearchExpansion, serp_queries: list[SERPQuery]
+    ) -> list[ResearchNode]:
+        logger.info(
+            "Generated: %d SERP Queries (Depth: %d)",
+            len(serp_queries),
+            expansion.depth,
+        )
+        logger.debug("SERP Queries:\n%s", serp_queries)
+
+        return [
+            ResearchNode(
+                serp_query=serp_query,
+                depth=expansion.depth,
+                path=(*expansion.path, index),
+                learnings=expansion.learnings,
+            )
+            for index, serp_query in enumerate(serp_queries)
+        ]
+
+    def _batch_expand_serp_queries(
+        self, expansions: list[ResearchExpansion]
+    ) -> list[list[SERPQuery]]:
+        serp_queries = {}
+        pending_expansions = []
+        for index, expansion in enumerate(expansions):
+            replayed_serp_queries = self._replayed_serp_queries(
+                path=expansion.path
+            )
+            if replayed_serp_queries is None:
+                pending_expansions.append(index)
+            else:
+                serp_queries[index] = replayed_serp_queries
+
+        with self._depth_scope(depth=expansions[0].depth):
+            responses = self._batch_generate_llm_responses(
+                user_prompts=[
+                    self._serp_queries_prompt(
+                        user_query=expansions[index].user_query,
+                        width=expansions[index].width,
+                    )
+                    for index in pending_expansions
+                ],
+                response_format=SERPQueries,
+                stage=ResearchStage.SERP_QUERIES,
+            )
+        for index, (response, usage) in zip(
+            pending_expansions, responses, strict=True
+        ):
+            expansion = expansions[index]
+            serp_queries[index] = self._deduplicate_serp_queries(
+                serp_queries=response.queries, depth=expansion.depth
+            )
+            self._journal_serp_queries(
+                path=expansion.path,
+                serp_queries=serp_queries[index],
+                usages=[to_token_usage(usage)],
+            )
+
+        return [serp_queries[index] for index in range(len(expansions))]
+
+    def _batch_research_serp_queries(
+        self, nodes: list[ResearchNode]
+    ) -> list[tuple[str, list[str], list[str]]]:
+        results = {}
+        pending_nodes = []
+        for index, node in enumerate(nodes):
+            replayed_node = self._replayed_node(path=node.path)
+            if replayed_node is None:
+                pending_nodes.append(index)
             else:
-                logger.info("Crawler: Non-LLM-based")
-                serp_data = self._search_query(query=serp_query.query)
+                results[index] = (
+                    replayed_node.learning,
+                    replayed_node.follow_up_queries,
+                    replayed_node.source_urls,
+                )
+
+        # Searches stay online; only the learning calls are batched
+        with self.pooled_executor(
+            num_tasks=max(len(pending_nodes), 1),
+            thread_name_prefix="deep-researcher-search",
+        ) as executor:
+            searches = self._map_in_context(
+                executor,
+                self._search_serp_query_with_usage,
+                [nodes[index] for index in pending_nodes],
+            )
 
-            learnings_followup_questions_serp_query = (
-                f"SERP Query: {serp_query.query}\n"
-                f"Research Goal: {serp_query.research_goal}"
+        with self._depth_scope(depth=nodes[0].depth if nodes else None):
+            responses = self._batch_generate_llm_responses(
+                user_prompts=[
+                    self._learning_prompt(
+                        serp_query=self._format_serp_query(
+                            serp_query=nodes[index].serp_query
+                        ),
+                        serp_data=serp_data,
+                    )
+                    for index, (serp_data, _) in zip(
+                        pending_nodes, searches, strict=True
+                    )
+                ],
+                response_format=Learning,
+                stage=ResearchStage.LEARNINGS,
             )
+        for index, (serp_data, search_usages), (response, usage) in zip(
+            pending_nodes, searches, responses, strict=True
+        ):
+            source_urls = self._source_urls(serp_data=serp_data)
+            results[index] = (
+                response.learning,
+                response.follow_up_queries,
+                source_urls,
+            )
+            self._journal_node(
+                node=nodes[index],
+                learning=response.learning,
+                follow_up_queries=response.follow_up_queries,
+                source_urls=source_urls,
+                usages=[*search_usages, to_token_usage(usage)],
+            )
+
+        return [results[index] for index in range(len(nodes))]
+
+    def _search_serp_query_with_usage(
+        self, node: ResearchNode
+    ) -> tuple[SERPQuerySearchResults | str, list[TokenUsage]]:
+        # Runs on a pool thread, which does not inherit the caller's context
+        with self._usage_scope() as usages, self._depth_scope(depth=node.depth):
+            serp_data = self._search_serp_query(serp_query=node.serp_query)
+
+        return serp_data, usages
+
+    def _expand_serp_queries(
+        self, expansion: ResearchExpansion
+    ) -> list[SERPQuery]:
+        replayed_serp_queries = self._replayed_serp_queries(path=expansion.path)
+        if replayed_serp_queries is not None:
+            return replayed_serp_queries
+
+        with (
+            self._usage_scope() as usages,
+            self._depth_scope(depth=expansion.depth),
+        ):
+            serp_queries = self._deduplicate_serp_queries(
+                serp_queries=self._generate_serp_queries(
+                    user_query=expansion.user_query, width=expansion.width
+                ).queries,
+                depth=expansion.depth,
+            )
+
+        self._journal_serp_queries(
+            path=expansion.path, serp_queries=serp_queries, usages=usages
+        )
+        return serp_queries
+
+    async def _aexpand_serp_queries(
+        self, expansion: ResearchExpansion
+    ) -> list[SERPQuery]:
+        replayed_serp_queries = self._replayed_serp_queries(path=expansion.path)
+        if replayed_serp_queries is not None:
+            return replayed_serp_queries
+
+        with (
+            self._usage_scope() as usages,
+            self._depth_scope(depth=expansion.depth),
+        ):
+            serp_queries = self._deduplicate_serp_queries(
+                serp_queries=(
+                    await self._agenerate_serp_queries(
+                        user_query=expansion.user_query, width=expansion.width
+                    )
+                ).queries,
+                depth=expansion.depth,
+            )
+
+        self._journal_serp_queries(
+            path=expansion.path, serp_queries=serp_queries, usages=usages
+        )
+        return serp_queries
+
+    def _research_serp_query(
+        self, node: ResearchNode
+    ) -> tuple[str, list[str], list[str]]:
+        replayed_node = self._replayed_node(path=node.path)
+        if replayed_node is not None:
+            return (
+                replayed_node.learning,
+                replayed_node.follow_up_queries,
+                replayed_node.source_urls,
+            )
+
+        with self._usage_scope() as usages, self._depth_scope(depth=node.depth):
+            serp_data = self._search_serp_query(serp_query=node.serp_query)
             learning, follow_up_queries = (
                 self._generate_learnings_and_follow_up_questions(
-                    serp_query=learnings_followup_questions_serp_query,
+                    serp_query=self._format_serp_query(
+                        serp_query=node.serp_query
+                    ),
                     serp_data=serp_data,
                 )
             )
 
-            learnings.append(learning)
-            self.final_learnings.append(
-                learnings_followup_questions_serp_query + "\nLearnings: " + learning
+        source_urls = self._source_urls(serp_data=serp_data)
+        self._journal_node(
+            node=node,
+            learning=learning,
+            follow_up_queries=follow_up_queries,
+            source_urls=source_urls,
+            usages=usages,
+        )
+        return learning, follow_up_queries, source_urls
+
+    async def _aresearch_serp_query(
+        self, node: ResearchNode
+    ) -> tuple[str, list[str], list[str]]:
+        replayed_node = self._replayed_node(path=node.path)
+        if replayed_node is not None:
+            return (
+                replayed_node.learning,
+                replayed_node.follow_up_queries,
+                replayed_node.source_urls,
             )
-            new_user_query = (
-                USER_PROMPT__QUERY_GENERATION_ADDON__PREVIOUS_RESEARCH_DETAILS.format(
-                    previous_research_goal=serp_query.research_goal,
-                    learnings=learnings,
-                    follow_up_questions=follow_up_queries,
+
+        with self._usage_scope() as usages, self._depth_scope(depth=node.depth):
+            serp_data = await self._asearch_serp_query(
+                serp_query=node.serp_query
+            )
+            learning, follow_up_queries = (
+                await self._agenerate_learnings_and_follow_up_questions(
+                    serp_query=self._format_serp_query(
+                        serp_query=node.serp_query
+                    ),
+                    serp_data=serp_data,
                 )
             )
 
-            new_depth = depth + 1
-            if new_depth < self.research_parameters.learning_depth:
-                self.run(
-                    width=self.research_parameters.calculate_width_for_depth(
-                        depth=new_depth
-                    ),
-                    depth=new_depth,
-                    user_query=new_user_query,
-                    learnings=learnings,
+        source_urls = self._source_urls(serp_data=serp_data)
+        self._journal_node(
+            node=node,
+            learning=learning,
+            follow_up_queries=follow_up_queries,
+            source_urls=source_urls,
+            usages=usages,
+        )
+        return learning, follow_up_queries, source_urls
+
+    def _load_journal(self, resume: bool) -> Optional[str]:
+        if self.journal is None:
+            if resume:
+                raise ValueError("Required: journal (resume mode)")
+            return None
+
+        if not resume:
+            self.journal.reset()
+            return None
+
+        self._journal_state = self.journal.load()
+        if self.query_registry is not None:
+            # Replayed queries were deduplicated when first generated; only
+            # register them so that new queries are checked against them.
+            for serp_queries in self._journal_state.serp_queries.values():
+                for serp_query in serp_queries:
+                    self.query_registry.register(serp_query.query)
+
+        return self._journal_state.user_query
+
+    def _replayed_serp_queries(
+        self, path: tuple[int, ...]
+    ) -> Optional[list[SERPQuery]]:
+        if self._journal_state is None:
+            return None
+
+        serp_queries = self._journal_state.serp_queries.get(path)
+        if serp_queries is not None:
+            logger.info("Journal: Replaying SERP Queries (Path: %s)", path)
+
+        return serp_queries
+
+    def _replayed_node(self, path: tuple[int, ...]) -> Optional[JournalNode]:
+        if self._journal_state is None:
+            return None
+
+        node = self._journal_state.nodes.get(path)
+        if node is not None:
+            logger.info("Journal: Replaying Node (Path: %s)", path)
+
+        return node
+
+    def _journal_serp_queries(
+        self,
+        path: tuple[int, ...],
+        serp_queries: list[SERPQuery],
+        usages: list[TokenUsage],
+    ) -> None:
+        if self.journal is not None:
+            self.journal.record_serp_queries(
+                node_path=path,
+                serp_queries=serp_queries,
+                usage=sum_token_usage(usages),
+            )
+
+    def _journal_node(
+        self,
+        node: ResearchNode,
+        learning: str,
+        follow_up_queries: list[str],
+        source_urls: list[str],
+        usages: list[TokenUsage],
+    ) -> None:
+        if self.journal is not None:
+            self.journal.record_node(
+                node_path=node.path,
+                serp_query=node.serp_query,
+                learning=learning,
+                follow_up_queries=follow_up_queries,
+                source_urls=source_urls,
+                usage=sum_token_usage(usages),
+            )
+
+    @contextmanager
+    def _usage_scope(self) -> Iterator[list[TokenUsage]]:
+        # Collects the usage of every call made in this scope (per thread and
+        # per task, since context variables are not shared between them).
+        usages = []
+        token = _scope_usages.set(usages)
+        try:
+            yield usages
+        finally:
+            _scope_usages.reset(token)
+
+    # Tracing is off unless a tracer is set; spans are then a no-op
+    def _span(
+        self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes
+    ) -> AbstractContextManager[Optional[Span]]:
+        if self.tracer is None:
+            return nullcontext()
+
+        return self.tracer.span(name, kind=kind, **attributes)
+
+    def node_span(
+        self, node: ResearchNode
+    ) -> AbstractContextManager[Optional[Span]]:
+        return self._span(
+            "research_node",
+            path=".".join(str(index) for index in node.path),
+            depth=node.depth,
+            serp_query=node.serp_query.query,
+        )
+
+    @contextmanager
+    def cost_scope(self) -> Iterator[list[float]]:
+        costs = []
+        token = _scope_costs.set(costs)
+        try:
+            yield costs
+        finally:
+            _scope_costs.reset(token)
+
+    @contextmanager
+    def _depth_scope(self, depth: Optional[int]) -> Iterator[None]:
+        token = _scope_depth.set(depth)
+        try:
+            yield
+        finally:
+            _scope_depth.reset(token)
+
+    def _deduplicate_serp_queries(
+        self, serp_queries: list[SERPQuery], depth: int
+    ) -> list[SERPQuery]:
+        if self.query_registry is None:
+            return serp_queries
+
+        unique_serp_queries = []
+        for serp_query in serp_queries:
+            duplicate_of = self.query_registry.register(serp_query.query)
+            if duplicate_of is None:
+                unique_serp_queries.append(serp_query)
+                continue
+
+            logger.info(
+                "Skipping Duplicate SERP Query: %s (duplicate of: %s)",
+                serp_query.query,
+                duplicate_of,
+            )
+            search_calls, llm_calls = self.estimate_subtree_calls(depth=depth)
+            self.query_registry.record_avoided_calls(
+                searches=search_calls, llm_calls=llm_calls
+            )
+            if self.analytics_instance:
+                self.analytics_instance.update_avoided_calls(
+                    reason="deduplication",
+                    search_calls=search_calls,
+                    llm_calls=llm_calls,
                 )
-            else:
-                logger.debug("Max Depth Reached")
+
+        return unique_serp_queries
+
+    def _prune_branch(
+        self, novelty: float, depth: int, path: tuple[int, ...]
+    ) -> bool:
+        min_branch_novelty = (
+            self.learning_parameters.min_branch_novelty
+            if self.learning_parameters
+            else None
+        )
+        if (
+            min_branch_novelty is None
+            or novelty >= min_branch_novelty
+            or depth + 1 >= self.research_parameters.learning_depth
+        ):
+            return False
+
+        # The node itself has been researched; its children are skipped
+        search_calls, llm_calls = self.estimate_subtree_calls(depth=depth)
+        search_calls, llm_calls = search_calls - 1, llm_calls - 1
+        logger.info(
+            "Pruning Branch: Novelty %.2f Below %.2f (Path: %s, Avoided: %d "
+            "Searches, %d LLM Calls)",
+            novelty,
+            min_branch_novelty,
+            path,
+            search_calls,
+            llm_calls,
+        )
+        self.novelty_tracker.record_pruned_branch(
+            searches=search_calls, llm_calls=llm_calls
+        )
+        if self.analytics_instance:
+            self.analytics_instance.update_avoided_calls(
+                reason="novelty",
+                search_calls=search_calls,
+                llm_calls=llm_calls,
+            )
+
+        return True
+
+    def estimate_subtree_calls(self, depth: int) -> tuple[int, int]:
+        # Upper bound: assumes every node gets its full width of children.
+        # A node costs one search and one learning call, plus one SERP query
+        # generation call when it has children.
+        if depth + 1 >= self.research_parameters.learning_depth:
+            return 1, 1
+
+        child_search_calls, child_llm_calls = self.estimate_subtree_calls(
+            depth=depth + 1
+        )
+        child_width = self.research_parameters.calculate_width_for_depth(
+            depth=depth + 1
+        )
+        return (
+            1 + child_width * child_search_calls,
+            2 + child_width * child_llm_calls,
+        )
+
+    def _record_learning(self, record: LearningRecord) -> None:
+        if self.learning_store.add(record):
+            self.final_learnings.append(record.text)
+            self.final_learning_paths.append(record.path)
+
+    def _source_urls(
+        self, serp_data: SERPQuerySearchResults | str
+    ) -> list[str]:
+        # LLM crawlers return prose (with inline citations, if any)
+        if not isinstance(serp_data, SERPQuerySearchResults):
+            return []
+
+        return list(
+            dict.fromkeys(
+                result.url for result in serp_data.search_results if result.url
+            )
+        )
+
+    def _previous_research_details_prompt(
+        self,
+        serp_query: SERPQuery,
+        learnings: list[str],
+        follow_up_queries: list[str],
+    ) -> str:
+        if self.learning_parameters and learnings:
+            learnings = self._relevant_branch_learnings(
+                serp_query=serp_query,
+                learnings=learnings,
+                follow_up_queries=follow_up_queries,
+            )
+
+        return self._get_prompt(
+            PromptTemplates.USER_PROMPT__QUERY_GENERATION_ADDON__PREVIOUS_RESEARCH_DETAILS,
+            previous_research_goal=serp_query.research_goal,
+            learnings=learnings,
+            follow_up_questions=follow_up_queries,
+        )
+
+    def _relevant_branch_learnings(
+        self,
+        serp_query: SERPQuery,
+        learnings: list[str],
+        follow_up_queries: list[str],
+    ) -> list[str]:
+        # Only the branch's own learnings are ranked (not the store), so the
+        # prompt does not depend on which other branches finished first.
+        index = BM25Index(
+            k1=self.learning_parameters.bm25_k1,
+            b=self.learning_parameters.bm25_b,
+        )
+        for learning in learnings:
+            index.add(learning)
+
+        budget_tokens, token_counter = None, None
+        prompt_budget = self._prompt_budget(ResearchStage.SERP_QUERIES)
+        if prompt_budget:
+            budget_tokens = prompt_budget.available_tokens(
+                self.system_prompt,
+                self._get_prompt(
+                    PromptTemplates.USER_PROMPT__QUERY_GENERATION_ADDON__PREVIOUS_RESEARCH_DETAILS,
+                    previous_research_goal=serp_query.research_goal,
+                    learnings=[],
+                    follow_up_questions=follow_up_queries,
+                ),
+            )
+            token_counter = prompt_budget.token_counter
+
+        return [
+            learnings[document]
+            for document in select_relevant(
+                index,
+                learnings,
+                f"{serp_query.query} {serp_query.research_goal}",
+                top_k=self.learning_parameters.follow_up_top_k,
+                budget_tokens=budget_tokens,
+                token_counter=token_counter,
+            )
+        ]
+
+    def _format_serp_query(self, serp_query: SERPQuery) -> str:
+        return (
+            f"SERP Query: {serp_query.query}\n"
+            f"Research Goal: {serp_query.research_goal}"
+        )
+
+    def _search_serp_query(
+        self, serp_query: SERPQuery
+    ) -> SERPQuerySearchResults | str:
+        return self._search_query(query=self._crawler_query(serp_query))
+
+    async def _asearch_serp_query(
+        self, serp_query: SERPQuery
+    ) -> SERPQuerySearchResults | str:
+        return await self._asearch_query(query=self._crawler_query(serp_query))
+
+    def _crawler_query(self, serp_query: SERPQuery) -> str:
+        if isinstance(self.crawler, LLMCrawler):
+            logger.info("Crawler: LLM-based")
+            return f"Query: {serp_query.query}\nResearch Goal: {serp_query.research_goal}"
+
+        logger.info("Crawler: Non-LLM-based")
+        return serp_query.query
 
     def _refine_user_query(self, user_query) -> list[str]:
         logger.info("Refining User Query")
         return self._generate_llm_response(
-            user_prompt=USER_PROMPT__QUERY_REFINEMENT.format(
-                num_questions=self.research_parameters.num_refinement_questions,
-                query=user_query,
-            ),
+            user_prompt=self._query_refinement_prompt(user_query=user_query),
             response_format=UserQueryRefinementQuestions,
+            stage=ResearchStage.QUERY_REFINEMENT,
+        ).questions
+
+    async def _arefine_user_query(self, user_query) -> list[str]:
+        logger.info("Refining User Query")
+        return (
+            await self._agenerate_llm_response(
+                user_prompt=self._query_refinement_prompt(user_query=user_query),
+                response_format=UserQueryRefinementQuestions,
+                stage=ResearchStage.QUERY_REFINEMENT,
+            )
         ).questions
 
+    def _query_refinement_prompt(self, user_query: str) -> str:
+        return self._get_prompt(
+            PromptTemplates.USER_PROMPT__QUERY_REFINEMENT,
+            num_questions=self.research_parameters.num_refinement_questions,
+            query=user_query,
+        )
+
     def _generate_serp_queries(self, user_query: str, width: int) -> SERPQueries:
         logger.info("Generating SERP Queries")
 
         return self._generate_llm_response(
-            user_prompt=USER_PROMPT__SERP_QUERY_GENERATION.format(
-                num_queries=width, query_addon=user_query
+            user_prompt=self._serp_queries_prompt(
+                user_query=user_query, width=width
             ),
             response_format=SERPQueries,
+            stage=ResearchStage.SERP_QUERIES,
+        )
+
+    async def _agenerate_serp_queries(
+        self, user_query: str, width: int
+    ) -> SERPQueries:
+        logger.info("Generating SERP Queries")
+
+        return await self._agenerate_llm_response(
+            user_prompt=self._serp_queries_prompt(
+                user_query=user_query, width=width
+            ),
+            response_format=SERPQueries,
+            stage=ResearchStage.SERP_QUERIES,
+        )
+
+    def _serp_queries_prompt(self, user_query: str, width: int) -> str:
+        return self._get_prompt(
+            PromptTemplates.USER_PROMPT__SERP_QUERY_GENERATION,
+            num_queries=width,
+            query_addon=user_query,
         )
 
     def _generate_learnings_and_follow_up_questions(
         self, serp_query: str, serp_data: SERPQuerySearchResults | str
-    ) -> list[str]:
+    ) -> tuple[str, list[str]]:
         logger.info("Generating Learnings and Follow-up Questions")
 
+        response = self._generate_llm_response(
+            user_prompt=self._learning_prompt(
+                serp_query=serp_query, serp_data=serp_data
+            ),
+            response_format=Learning,
+            stage=ResearchStage.LEARNINGS,
+        )
+
+        return response.learning, response.follow_up_queries
+
+    async def _agenerate_learnings_and_follow_up_questions(
+        self, serp_query: str, serp_data: SERPQuerySearchResults | str
+    ) -> tuple[str, list[str]]:
+        logger.info("Generating Learnings and Follow-up Questions")
+
+        response = await self._agenerate_llm_response(
+            user_prompt=self._learning_prompt(
+                serp_query=serp_query, serp_data=serp_data
+            ),
+            response_format=Learning,
+            stage=ResearchStage.LEARNINGS,
+        )
+
+        return response.learning, response.follow_up_queries
+
+    def _learning_prompt(
+        self, serp_query: str, serp_data: SERPQuerySearchResults | str
+    ) -> str:
+        prompt_budget = self._prompt_budget(ResearchStage.LEARNINGS)
+        if prompt_budget:
+            fixed_prompt = self._get_prompt(
+                PromptTemplates.USER_PROMPT__LEARNING_GENERATION,
+                num_learnings=self.research_parameters.num_learnings,
+                serp_query=serp_query,
+                serp_data="",
+            )
+            serp_data = (
+                prompt_budget.fit_search_results(
+                    serp_data, self.system_prompt, fixed_prompt
+                )
+                if isinstance(serp_data, SERPQuerySearchResults)
+                else prompt_budget.fit_text(
+                    serp_data, self.system_prompt, fixed_prompt
+                )
+            )
+
         if isinstance(serp_data, SERPQuerySearchResults):
             serp_data = "\n\n".join([
                 (
@@ -202,53 +1343,814 @@ class DeepResearcher:
                 for result in serp_data.search_results
             ])
 
-        response = self._generate_llm_response(
-            user_prompt=USER_PROMPT__LEARNING_GENERATION.format(
-                num_learnings=self.research_parameters.num_learnings,
-                serp_query=serp_query,
-                serp_data=serp_data,
+        return self._get_prompt(
+            PromptTemplates.USER_PROMPT__LEARNING_GENERATION,
+            num_learnings=self.research_parameters.num_learnings,
+            serp_query=serp_query,
+            serp_data=serp_data,
+        )
+
+    def _generate_report(
+        self,
+        user_query: str,
+        on_chunk: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        with self._span("generate_report", report_mode=self.report_mode):
+            logger.info("Generating Report")
+
+            if self.report_mode == "hierarchical":
+                learning_groups = self._plan_learning_groups(
+                    user_query=user_query
+                )
+                if learning_groups:
+                    return self._generate_hierarchical_report(
+                        user_query=user_query,
+                        learning_groups=learning_groups,
+                        on_chunk=on_chunk,
+                    )
+
+            return self._generate_report_response(
+                user_prompt=self._report_prompt(user_query=user_query),
+                on_chunk=on_chunk,
+            )
+
+    async def _agenerate_report(
+        self,
+        user_query: str,
+        on_chunk: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        with self._span("generate_report", report_mode=self.report_mode):
+            logger.info("Generating Report")
+
+            if self.report_mode == "hierarchical":
+                learning_groups = self._plan_learning_groups(
+                    user_query=user_query
+                )
+                if learning_groups:
+                    return await self._agenerate_hierarchical_report(
+                        user_query=user_query,
+                        learning_groups=learning_groups,
+                        on_chunk=on_chunk,
+                    )
+
+            return await self._agenerate_report_response(
+                user_prompt=self._report_prompt(user_query=user_query),
+                on_chunk=on_chunk,
+            )
+
+    # Only the final report is streamed; partial summaries are intermediate.
+    def _generate_report_response(
+        self,
+        user_prompt: str,
+        on_chunk: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        if on_chunk is None:
+            return self._generate_llm_response(
+                user_prompt=user_prompt, stage=ResearchStage.REPORT
+            )
+
+        return self._stream_llm_response(
+            user_prompt=user_prompt,
+            on_chunk=on_chunk,
+            stage=ResearchStage.REPORT,
+        )
+
+    async def _agenerate_report_response(
+        self,
+        user_prompt: str,
+        on_chunk: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        if on_chunk is None:
+            return await self._agenerate_llm_response(
+                user_prompt=user_prompt, stage=ResearchStage.REPORT
+            )
+
+        return await self._astream_llm_response(
+            user_prompt=user_prompt,
+            on_chunk=on_chunk,
+            stage=ResearchStage.REPORT,
+        )
+
+    def _generate_hierarchical_report(
+        self,
+        user_query: str,
+        learning_groups: list[list[str]],
+        on_chunk: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        with self.pooled_executor(
+            num_tasks=len(learning_groups),
+            thread_name_prefix="deep-researcher-report",
+        ) as executor:
+            while True:
+                logger.info("Summarizing: %d Learning Groups", len(learning_groups))
+                summaries = self._map_in_context(
+                    executor,
+                    lambda learning_group: self._generate_llm_response(
+                        user_prompt=self._partial_summary_prompt(
+                            user_query=user_query, learnings=learning_group
+                        ),
+                        stage=ResearchStage.REPORT_SUMMARY,
+                    ),
+                    learning_groups,
+                )
+
+                learning_groups = self._plan_summary_groups(
+                    user_query=user_query, summaries=summaries
+                )
+                if not learning_groups:
+                    break
+
+        logger.info("Merging: %d Summaries", len(summaries))
+        return self._generate_report_response(
+            user_prompt=self._merge_prompt(
+                user_query=user_query, summaries=summaries
             ),
-            response_format=Learning,
+            on_chunk=on_chunk,
         )
 
-        return response.learning, response.follow_up_queries
+    async def _agenerate_hierarchical_report(
+        self,
+        user_query: str,
+        learning_groups: list[list[str]],
+        on_chunk: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        while True:
+            logger.info("Summarizing: %d Learning Groups", len(learning_groups))
+            async with TaskGroup() as task_group:
+                tasks = [
+                    task_group.create_task(
+                        self._agenerate_llm_response(
+                            user_prompt=self._partial_summary_prompt(
+                                user_query=user_query, learnings=learning_group
+                            ),
+                            stage=ResearchStage.REPORT_SUMMARY,
+                        )
+                    )
+                    for learning_group in learning_groups
+                ]
+            summaries = [task.result() for task in tasks]
 
-    def _generate_report(self, user_query: str) -> str:
-        logger.info("Generating Report")
-        return self._generate_llm_response(
-            user_prompt=USER_PROMPT__REPORT_GENERATION.format(
-                user_query=user_query, learnings=self.final_learnings
+            learning_groups = self._plan_summary_groups(
+                user_query=user_query, summaries=summaries
+            )
+            if not learning_groups:
+                break
+
+        logger.info("Merging: %d Summaries", len(summaries))
+        return await self._agenerate_report_response(
+            user_prompt=self._merge_prompt(
+                user_query=user_query, summaries=summaries
+            ),
+            on_chunk=on_chunk,
+        )
+
+    @contextmanager
+    def pooled_executor(
+        self, num_tasks: int, thread_name_prefix: str
+    ) -> Iterator[ThreadPoolExecutor]:
+        if self.executor is not None:
+            yield self.executor
+            return
+
+        with ThreadPoolExecutor(
+            max_workers=(
+                self.concurrency_parameters.max_workers
+                if self.concurrency_parameters
+                else num_tasks
+            ),
+            thread_name_prefix=thread_name_prefix,
+        ) as executor:
+            yield executor
+
+    def _map_in_context(
+        self,
+        executor: ThreadPoolExecutor,
+        function: Callable[..., Any],
+        *iterables: Iterable,
+    ) -> list:
+        # Pool threads do not inherit context variables (e.g. the current
+        # span), so each task runs in a copy of the caller's context.
+        futures = [
+            executor.submit(copy_context().run, function, *arguments)
+            for arguments in zip(*iterables, strict=True)
+        ]
+        return [future.result() for future in futures]
+
+    def _plan_learning_groups(self, user_query: str) -> list[list[str]]:
+        records = self._report_learnings(user_query=user_query)
+        report_budget = self._report_budget(ResearchStage.REPORT)
+        summary_budget = self._report_budget(ResearchStage.REPORT_SUMMARY)
+        token_counter = summary_budget.token_counter
+        learning_tokens = [
+            token_counter.count(record.text) for record in records
+        ]
+
+        if sum(learning_tokens) <= report_budget.available_tokens(
+            self.system_prompt,
+            self._get_prompt(
+                PromptTemplates.USER_PROMPT__REPORT_GENERATION,
+                user_query=user_query,
+                learnings="",
+            ),
+        ):
+            logger.info("Report Mode: Hierarchical (fits single prompt)")
+            return []
+
+        group_budget_tokens = summary_budget.available_tokens(
+            self.system_prompt,
+            self._partial_summary_prompt(user_query=user_query, learnings=[]),
+        )
+        subtrees = self._partition_subtrees(
+            items=[
+                (record.path, record.text, num_tokens)
+                for record, num_tokens in zip(
+                    records, learning_tokens, strict=True
+                )
+            ],
+            level=0,
+            budget_tokens=group_budget_tokens,
+        )
+
+        return self._pack_groups(
+            units=[
+                [(learning, num_tokens) for _, learning, num_tokens in subtree]
+                for subtree in subtrees
+            ],
+            budget_tokens=group_budget_tokens,
+        )
+
+    def _plan_summary_groups(
+        self, user_query: str, summaries: list[str]
+    ) -> list[list[str]]:
+        report_budget = self._report_budget(ResearchStage.REPORT)
+        summary_budget = self._report_budget(ResearchStage.REPORT_SUMMARY)
+        token_counter = summary_budget.token_counter
+        summary_tokens = [token_counter.count(summary) for summary in summaries]
+
+        if sum(summary_tokens) <= report_budget.available_tokens(
+            self.system_prompt,
+            self._merge_prompt(user_query=user_query, summaries=[]),
+        ):
+            return []
+
+        summary_groups = self._pack_groups(
+            units=[
+                [(summary, num_tokens)]
+                for summary, num_tokens in zip(
+                    summaries, summary_tokens, strict=True
+                )
+            ],
+            budget_tokens=summary_budget.available_tokens(
+                self.system_prompt,
+                self._partial_summary_prompt(user_query=user_query, learnings=[]),
             ),
         )
+        # Summaries that no longer shrink are merged as-is (the merge prompt
+        # is fitted to the budget) rather than being re-summarized forever.
+        if len(summary_groups) >= len(summaries):
+            logger.warning("Report: Summaries Exceed Merge Budget")
+            return []
+
+        return summary_groups
+
+    def _partition_subtrees(
+        self,
+        items: list[tuple[tuple[int, ...], str, int]],
+        level: int,
+        budget_tokens: int,
+    ) -> list[list[tuple[tuple[int, ...], str, int]]]:
+        # `items` are in depth-first pre-order, so every subtree is a
+        # contiguous run sharing the same path prefix. Subtrees that do not
+        # fit are split into their own children.
+        subtrees = []
+        for _, subtree in groupby(items, key=lambda item: item[0][: level + 1]):
+            subtree = list(subtree)
+
+            if len(subtree) == 1 or sum(
+                num_tokens for _, _, num_tokens in subtree
+            ) <= budget_tokens:
+                subtrees.append(subtree)
+            else:
+                subtrees.extend(
+                    self._partition_subtrees(subtree, level + 1, budget_tokens)
+                )
+
+        return subtrees
+
+    def _pack_groups(
+        self, units: list[list[tuple[str, int]]], budget_tokens: int
+    ) -> list[list[str]]:
+        groups, group, group_tokens = [], [], 0
+        for unit in units:
+            unit_tokens = sum(num_tokens for _, num_tokens in unit)
+
+            if group and group_tokens + unit_tokens > budget_tokens:
+                groups.append(group)
+                group, group_tokens = [], 0
+
+            group.extend(text for text, _ in unit)
+            group_tokens += unit_tokens
+
+        if group:
+            groups.append(group)
+
+        return groups
+
+    def _partial_summary_prompt(self, user_query: str, learnings: list[str]) -> str:
+        prompt_budget = self._prompt_budget(ResearchStage.REPORT_SUMMARY)
+        if prompt_budget and learnings:
+            learnings = prompt_budget.fit_items(
+                learnings,
+                self.system_prompt,
+                self._partial_summary_prompt(user_query=user_query, learnings=[]),
+            )
+
+        return self._get_prompt(
+            PromptTemplates.USER_PROMPT__REPORT_PARTIAL_SUMMARY,
+            user_query=user_query,
+            learnings="\n\n".join(learnings),
+        )
 
-    def _search_query(self, query: str) -> SERPQuerySearchResults:
-        response, usage = self.crawler.search(query)
+    def _merge_prompt(self, user_query: str, summaries: list[str]) -> str:
+        if summaries:
+            summaries = self._report_budget(ResearchStage.REPORT).fit_items(
+                summaries,
+                self.system_prompt,
+                self._merge_prompt(user_query=user_query, summaries=[]),
+            )
+
+        return self._get_prompt(
+            PromptTemplates.USER_PROMPT__REPORT_MERGE,
+            user_query=user_query,
+            summaries="\n\n".join(summaries),
+        )
 
+    def _report_prompt(self, user_query: str) -> str:
+        fixed_prompt = self._get_prompt(
+            PromptTemplates.USER_PROMPT__REPORT_GENERATION,
+            user_query=user_query,
+            learnings="",
+        )
+        report_budget = self._report_budget(ResearchStage.REPORT)
+        learnings = [
+            record.text
+            for record in self._report_learnings(
+                user_query=user_query,
+                budget_tokens=(
+                    report_budget.available_tokens(
+                        self.system_prompt, fixed_prompt
+                    )
+                    if report_budget
+                    else None
+                ),
+            )
+        ]
+        prompt_budget = self._prompt_budget(ResearchStage.REPORT)
+        if prompt_budget:
+            learnings = prompt_budget.fit_items(
+                learnings, self.system_prompt, fixed_prompt
+            )
+
+        return self._get_prompt(
+            PromptTemplates.USER_PROMPT__REPORT_GENERATION,
+            user_query=user_query,
+            learnings="\n\n".join(learnings),
+        )
+
+    def _report_learnings(
+        self, user_query: str, budget_tokens: Optional[int] = None
+    ) -> list[LearningRecord]:
+        # Without learning parameters, every learning is reported (and
+        # trimmed to the budget by the prompt budget, if any)
+        if self.learning_parameters is None:
+            return self.learning_store.records
+
+        return self.learning_store.top_k(
+            query=user_query,
+            k=self.learning_parameters.report_top_k,
+            budget_tokens=budget_tokens,
+            token_counter=(
+                self._report_budget(ResearchStage.REPORT).token_counter
+                if budget_tokens is not None
+                else None
+            ),
+        )
+
+    def _search_query(self, query: str) -> SERPQuerySearchResults | str:
+        with (
+            self._limiter.limit(provider_key(self.crawler)),
+            self._instrumented_call(
+                stage=ResearchStage.SEARCH,
+                usage_description=UsageDescription.SEARCH,
+                plugin=self.crawler,
+            ) as call_record,
+        ):
+            if isinstance(self.crawler, LLMCrawler):
+                response, usage = self.crawler.search(query)
+            else:
+                response, usage = self.crawler.search(query), None
+            call_record.usage = usage
+
+        self._update_search_stats(
+            usage=usage, duration_s=call_record.duration_s
+        )
+        return response
+
+    async def _asearch_query(self, query: str) -> SERPQuerySearchResults | str:
+        async with self._limiter.alimit(provider_key(self.crawler)):
+            with self._instrumented_call(
+                stage=ResearchStage.SEARCH,
+                usage_description=UsageDescription.SEARCH,
+                plugin=self.crawler,
+            ) as call_record:
+                if isinstance(self.crawler, LLMCrawler):
+                    response, usage = await self.crawler.asearch(query)
+                else:
+                    response, usage = await self.crawler.asearch(query), None
+                call_record.usage = usage
+
+        self._update_search_stats(
+            usage=usage, duration_s=call_record.duration_s
+        )
+        return response
+
+    def _update_search_stats(
+        self,
+        usage: Optional[CompletionUsage | GenerateContentResponseUsageMetadata],
+        duration_s: Optional[float] = None,
+    ) -> None:
+        self._record_scope_usage(usage=usage)
+        self._record_spend(plugin=self.crawler, usage=usage)
         if self.analytics_instance:
             self.analytics_instance.update_stats(
                 usage_stats=usage,
                 usage_description=UsageDescription.SEARCH,
+                stage=ResearchStage.SEARCH,
+                llm_model=getattr(self.crawler, "llm_identifier", None),
+                duration_s=duration_s,
             )
 
-            return response
+    def stage_llm_model(self, stage: ResearchStage) -> LLMModel:
+        return self.stage_llm_models.get(stage, self.llm_model)
 
     def _generate_llm_response(
-        self, user_prompt: str, response_format: Optional[BaseModel] = None
-    ) -> tuple[BaseModel | str, CompletionUsage]:
-        response, usage = self.llm_model.generate_llm_response(
-            system_prompt=SYSTEM_PROMPT,
-            user_prompt=user_prompt,
+        self,
+        user_prompt: str,
+        stage: ResearchStage,
+        response_format: Optional[BaseModel] = None,
+    ) -> BaseModel | str:
+        llm_model = self.stage_llm_model(stage)
+        with (
+            self._limiter.limit(provider_key(llm_model)),
+            self._instrumented_call(
+                stage=stage,
+                usage_description=self._llm_usage_description(response_format),
+                plugin=llm_model,
+            ) as call_record,
+        ):
+            response, usage = llm_model.generate_llm_response(
+                system_prompt=self.system_prompt,
+                user_prompt=user_prompt,
+                response_format=response_format,
+            )
+            call_record.usage = usage
+
+        self._update_llm_stats(
+            usage=usage,
+            stage=stage,
+            llm_model=llm_model,
+            response_format=response_format,
+            duration_s=call_record.duration_s,
+            llm_identifier=call_record.llm_identifier,
+        )
+        return response
+
+    async def _agenerate_llm_response(
+        self,
+        user_prompt: str,
+        stage: ResearchStage,
+        response_format: Optional[BaseModel] = None,
+    ) -> BaseModel | str:
+        llm_model = self.stage_llm_model(stage)
+        async with self._limiter.alimit(provider_key(llm_model)):
+            with self._instrumented_call(
+                stage=stage,
+                usage_description=self._llm_usage_description(response_format),
+                plugin=llm_model,
+            ) as call_record:
+                response, usage = await llm_model.agenerate_llm_response(
+                    system_prompt=self.system_prompt,
+                    user_prompt=user_prompt,
+                    response_format=response_format,
+                )
+                call_record.usage = usage
+
+        self._update_llm_stats(
+            usage=usage,
+            stage=stage,
+            llm_model=llm_model,
             response_format=response_format,
+            duration_s=call_record.duration_s,
+            llm_identifier=call_record.llm_identifier,
+        )
+        return response
+
+    def _batch_generate_llm_responses(
+        self,
+        user_prompts: list[str],
+        response_format: BaseModel,
+        stage: ResearchStage,
+    ) -> list[
+        tuple[
+            BaseModel,
+            CompletionUsage
+            | GenerateContentResponseUsageMetadata
+            | BatchUsage
+            | CacheHitUsage,
+        ]
+    ]:
+        if not user_prompts:
+            return []
+
+        llm_model = self.stage_llm_model(stage)
+        start_time_s = perf_counter()
+        try:
+            with self._call_span(
+                stage=stage,
+                usage_description=UsageDescription.STRUCTURED_COMPLETION,
+                plugin=llm_model,
+                batch_size=len(user_prompts),
+            ) as span:
+                responses = llm_model.batch_generate_llm_responses(
+                    system_prompt=self.system_prompt,
+                    user_prompts=user_prompts,
+                    response_format=response_format,
+                    batch_parameters=self.batch_parameters,
+                )
+                if span is not None:
+                    self._set_usage_attributes(
+                        span=span, usages=[usage for _, usage in responses]
+                    )
+        except BaseException:
+            self._record_call_metrics(
+                stage=stage,
+                usage_description=UsageDescription.STRUCTURED_COMPLETION,
+                plugin=llm_model,
+                duration_s=perf_counter() - start_time_s,
+                call_record=CallRecord(error=True),
+            )
+            raise
+
+        # Every request of a batch waits for the whole batch
+        duration_s = perf_counter() - start_time_s
+        for _, usage in responses:
+            self._record_call_metrics(
+                stage=stage,
+                usage_description=UsageDescription.STRUCTURED_COMPLETION,
+                plugin=llm_model,
+                duration_s=duration_s,
+                call_record=CallRecord(usage=usage),
+            )
+            self._update_llm_stats(
+                usage=usage,
+                stage=stage,
+                llm_model=llm_model,
+                response_format=response_format,
+                duration_s=duration_s,
+            )
+
+        return responses
+
+    def _stream_llm_response(
+        self,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+        stage: ResearchStage,
+    ) -> str:
+        llm_model = self.stage_llm_model(stage)
+        with (
+            self._limiter.limit(provider_key(llm_model)),
+            self._instrumented_call(
+                stage=stage,
+                usage_description=UsageDescription.COMPLETION,
+                plugin=llm_model,
+            ) as call_record,
+        ):
+            response, usage = llm_model.stream_llm_response(
+                system_prompt=self.system_prompt,
+                user_prompt=user_prompt,
+                on_chunk=on_chunk,
+            )
+            call_record.usage = usage
+
+        # Usage is only known once the stream has ended
+        self._update_llm_stats(
+            usage=usage,
+            stage=stage,
+            llm_model=llm_model,
+            duration_s=call_record.duration_s,
         )
+        return response
 
+    async def _astream_llm_response(
+        self,
+        user_prompt: str,
+        on_chunk: Callable[[str], None],
+        stage: ResearchStage,
+    ) -> str:
+        llm_model = self.stage_llm_model(stage)
+        async with self._limiter.alimit(provider_key(llm_model)):
+            with self._instrumented_call(
+                stage=stage,
+                usage_description=UsageDescription.COMPLETION,
+                plugin=llm_model,
+            ) as call_record:
+                response, usage = await llm_model.astream_llm_response(
+                    system_prompt=self.system_prompt,
+                    user_prompt=user_prompt,
+                    on_chunk=on_chunk,
+                )
+                call_record.usage = usage
+
+        self._update_llm_stats(
+            usage=usage,
+            stage=stage,
+            llm_model=llm_model,
+            duration_s=call_record.duration_s,
+        )
+        return response
+
+    # Timed inside the provider limiter, so waiting for a slot is excluded
+    @contextmanager
+    def _instrumented_call(
+        self,
+        stage: ResearchStage,
+        usage_description: UsageDescription,
+        plugin: object,
+    ) -> Iterator[CallRecord]:
+        call_record = CallRecord()
+        with self._call_span(
+            stage=stage, usage_description=usage_description, plugin=plugin
+        ) as span:
+            # Read by plugins that track latency per stage (hedging)
+            stage_token = call_stage.set(stage)
+            limiter_token = call_limiter.set(self._limiter)
+            llm_identifier_token = call_llm_identifier.set(None)
+            start_time_s = perf_counter()
+            try:
+                yield call_record
+            except BaseException:
+                call_record.error = True
+                raise
+            finally:
+                call_record.llm_identifier = call_llm_identifier.get()
+                call_llm_identifier.reset(llm_identifier_token)
+                call_limiter.reset(limiter_token)
+                call_stage.reset(stage_token)
+                call_record.duration_s = perf_counter() - start_time_s
+                self._record_call_metrics(
+                    stage=stage,
+                    usage_description=usage_description,
+                    plugin=plugin,
+                    duration_s=call_record.duration_s,
+                    call_record=call_record,
+                )
+                if span is not None:
+                    self._set_usage_attributes(
+                        span=span, usages=[call_record.usage]
+                    )
+
+    def _call_span(
+        self,
+        stage: ResearchStage,
+        usage_description: UsageDescription,
+        plugin: object,
+        **attributes,
+    ) -> AbstractContextManager[Optional[Span]]:
+        return self._span(
+            stage.value,
+            kind=SPAN_KIND_CLIENT,
+            stage=stage.value,
+            usage=usage_description.value,
+            provider=provider_key(plugin),
+            depth=_scope_depth.get(),
+            **attributes,
+        )
+
+    def _set_usage_attributes(
+        self,
+        span: Span,
+        usages: list[
+            Optional[
+                CompletionUsage
+                | GenerateContentResponseUsageMetadata
+                | BatchUsage
+                | CacheHitUsage
+            ]
+        ],
+    ) -> None:
+        usage = sum_token_usage([to_token_usage(usage) for usage in usages])
+        span.set_attributes(
+            input_tokens=usage.input_tokens,
+            cached_input_tokens=usage.cached_input_tokens,
+            completion_tokens=usage.completion_tokens,
+            cache_hits=sum(
+                isinstance(usage, CacheHitUsage) for usage in usages
+            ),
+        )
+
+    def _record_call_metrics(
+        self,
+        stage: ResearchStage,
+        usage_description: UsageDescription,
+        plugin: object,
+        duration_s: float,
+        call_record: CallRecord,
+    ) -> None:
+        if self.metrics_instance is None:
+            return
+
+        self.metrics_instance.record_call(
+            stage=stage,
+            usage_description=usage_description,
+            provider=provider_key(plugin),
+            depth=_scope_depth.get(),
+            duration_s=duration_s,
+            usage=to_token_usage(call_record.usage),
+            cache_hit=isinstance(call_record.usage, CacheHitUsage),
+            error=call_record.error,
+        )
+
+    def _llm_usage_description(
+        self, response_format: Optional[BaseModel]
+    ) -> UsageDescription:
+        return (
+            UsageDescription.STRUCTURED_COMPLETION
+            if response_format
+            else UsageDescription.COMPLETION
+        )
+
+    def _update_llm_stats(
+        self,
+        usage: CompletionUsage | GenerateContentResponseUsageMetadata,
+        stage: ResearchStage,
+        llm_model: LLMModel,
+        response_format: Optional[BaseModel] = None,
+        duration_s: Optional[float] = None,
+        llm_identifier: Optional[LLMIdentifier] = None,
+    ) -> None:
+        # Defaults to the model called; a hedged call may be answered by its
+        # backup model instead
+        llm_identifier = llm_identifier or llm_model.llm_identifier
+        self._record_scope_usage(usage=usage)
+        self._record_spend(
+            plugin=llm_model, usage=usage, llm_identifier=llm_identifier
+        )
         if self.analytics_instance:
             self.analytics_instance.update_stats(
                 usage_stats=usage,
-                usage_description=(
-                    UsageDescription.STRUCTURED_COMPLETION
-                    if response_format
-                    else UsageDescription.COMPLETION
-                ),
+                usage_description=self._llm_usage_description(response_format),
+                stage=stage,
+                llm_model=llm_identifier,
+                duration_s=duration_s,
             )
 
-        return response
+    def _record_scope_usage(
+        self,
+        usage: Optional[CompletionUsage | GenerateContentResponseUsageMetadata],
+    ) -> None:
+        scope_usages = _scope_usages.get()
+        if scope_usages is not None:
+            scope_usages.append(to_token_usage(usage))
+
+    def _record_spend(
+        self,
+        plugin: object,
+        usage: Optional[
+            CompletionUsage
+            | GenerateContentResponseUsageMetadata
+            | BatchUsage
+            | CacheHitUsage
+        ],
+        llm_identifier: Optional[LLMIdentifier] = None,
+    ) -> None:
+        if self.budget is None:
+            return
+
+        # Non-LLM crawlers have no known price and count as free
+        llm_identifier = llm_identifier or getattr(
+            plugin, "llm_identifier", None
+        )
+        if llm_identifier is None or isinstance(usage, CacheHitUsage):
+            return
+
+        dollars = usage_cost(llm_identifier, usage)
+        if plugin is self.crawler:
+            dollars += search_call_cost(
+                llm_identifier, getattr(plugin, "search_context_size", None)
+            )
+
+        self.budget.record_spend(dollars=dollars)
+        scope_costs = _scope_costs.get()
+        if scope_costs is not None:
+            scope_costs.append(dollars)
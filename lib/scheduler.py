@@ -0,0 +1,131 @@
+from heapq import heappop, heappush
+from itertools import count
+from threading import Lock
+from time import perf_counter
+from typing import Literal, Optional
+
+from lib.config import DeepResearchSchedulerParameters
+from lib.dedup import jaccard_similarity
+from lib.models.scheduler import FrontierNode
+
+
+def learning_novelty(
+    learning_shingles: frozenset[str],
+    previous_learning_shingles: list[frozenset[str]],
+) -> float:
+    return 1.0 - max(
+        (
+            jaccard_similarity(learning_shingles, previous_shingles)
+            for previous_shingles in previous_learning_shingles
+        ),
+        default=0.0,
+    )
+
+
+# Max-priority queue of SERP queries waiting to be researched. Shallow,
+# novel and cheap nodes go first; ties keep insertion (sibling) order.
+class ResearchFrontier:
+    def __init__(self, scheduler_parameters: DeepResearchSchedulerParameters):
+        self.scheduler_parameters = scheduler_parameters
+
+        self._heap: list[tuple[float, int, FrontierNode]] = []
+        self._sequence = count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __repr__(self):
+        return f"ResearchFrontier(pending={len(self._heap)})"
+
+    def push(self, node: FrontierNode, cost_scale_dollars: float) -> None:
+        # Costs are relative to a typical node, so the weights stay
+        # comparable across models
+        node.priority = (
+            self.scheduler_parameters.novelty_weight * node.novelty
+            - self.scheduler_parameters.depth_weight * node.depth
+            - self.scheduler_parameters.cost_weight
+            * node.estimated_cost
+            / max(cost_scale_dollars, 1e-9)
+        )
+        heappush(self._heap, (-node.priority, next(self._sequence), node))
+
+    def peek(self) -> FrontierNode:
+        return self._heap[0][2]
+
+    def pop(self) -> FrontierNode:
+        return heappop(self._heap)[2]
+
+    def drain(self) -> list[FrontierNode]:
+        nodes = [node for _, _, node in sorted(self._heap)]
+        self._heap.clear()
+        return nodes
+
+
+class ResearchBudget:
+    def __init__(self, scheduler_parameters: DeepResearchSchedulerParameters):
+        research_fraction = 1 - scheduler_parameters.report_reserve_fraction
+        self.max_cost_dollars = (
+            scheduler_parameters.max_cost_dollars * research_fraction
+            if scheduler_parameters.max_cost_dollars is not None
+            else None
+        )
+        self.deadline_s = (
+            scheduler_parameters.deadline_s * research_fraction
+            if scheduler_parameters.deadline_s is not None
+            else None
+        )
+
+        self.spent_dollars = 0.0
+        self._num_nodes = 0
+        self._total_node_cost_dollars = 0.0
+        self._start_time_s = perf_counter()
+        self._lock = Lock()
+
+    def __repr__(self):
+        return (
+            f"ResearchBudget(spent_dollars={self.spent_dollars:.6f}, "
+            f"max_cost_dollars={self.max_cost_dollars}, "
+            f"elapsed_s={self.elapsed_s:.2f}, deadline_s={self.deadline_s})"
+        )
+
+    @property
+    def elapsed_s(self) -> float:
+        return perf_counter() - self._start_time_s
+
+    @property
+    def num_nodes(self) -> int:
+        return self._num_nodes
+
+    def record_spend(self, dollars: float) -> None:
+        with self._lock:
+            self.spent_dollars += dollars
+
+    def record_node_cost(self, dollars: float) -> None:
+        with self._lock:
+            self._num_nodes += 1
+            self._total_node_cost_dollars += dollars
+
+    def mean_node_cost(self, default_dollars: float) -> float:
+        with self._lock:
+            if not self._num_nodes:
+                return default_dollars
+
+            return self._total_node_cost_dollars / self._num_nodes
+
+    # `committed_dollars` is the estimated cost of work that has been (or is
+    # about to be) started but is not yet paid for.
+    def exhausted_reason(
+        self, committed_dollars: float = 0.0
+    ) -> Optional[Literal["budget", "deadline"]]:
+        if self.deadline_s is not None and self.elapsed_s >= self.deadline_s:
+            return "deadline"
+
+        with self._lock:
+            if (
+                self.max_cost_dollars is not None
+                and self.spent_dollars + committed_dollars
+                > self.max_cost_dollars
+            ):
+                return "budget"
+
+        return None
@@ -0,0 +1,28 @@
+from sys import modules
+
+# Provider SDKs are only imported by the plugins that use them. A value cannot
+# be an instance of an SDK class before that SDK has been imported, so the
+# checks below look the class up in `sys.modules` instead of importing it.
+
+
+def is_sdk_instance(value: object, module_name: str, class_name: str) -> bool:
+    module = modules.get(module_name)
+    return module is not None and isinstance(value, getattr(module, class_name))
+
+
+def is_openai_usage(value: object) -> bool:
+    return is_sdk_instance(value, "openai.types", "CompletionUsage")
+
+
+def is_gemini_usage(value: object) -> bool:
+    return is_sdk_instance(
+        value, "google.genai.types", "GenerateContentResponseUsageMetadata"
+    )
+
+
+def is_openai_client(value: object) -> bool:
+    return is_sdk_instance(value, "openai", "OpenAI")
+
+
+def is_gemini_client(value: object) -> bool:
+    return is_sdk_instance(value, "google.genai", "Client")
@@ -0,0 +1,409 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from asyncio import TaskGroup, run as run_coroutine, to_thread
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    CancelledError,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextvars import copy_context
+from threading import Event
+from typing import TYPE_CHECKING
+
+from lib.analytics import search_call_cost, usage_cost
+from lib.log import logger
+from lib.models.learnings import LearningRecord
+from lib.models.research import NodeResult, ResearchExpansion, ResearchNode
+from lib.models.scheduler import FrontierNode
+from lib.scheduler import ResearchBudget, ResearchFrontier
+from lib.tokens import TokenCounter
+from lib.types import ResearchStage, TokenUsage
+
+if TYPE_CHECKING:
+    from lib.researcher import DeepResearcher
+
+# Assumed usage of a research node (one search and one learning call) until
+# the first nodes have been paid for
+PRIOR_NODE_USAGE = TokenUsage(
+    input_tokens=6_000, cached_input_tokens=0, completion_tokens=600
+)
+
+
+# Execution modes of the research tree. Every strategy runs the researcher's
+# node step (`research_node`, then `expand_node` for the children it asks
+# for); they only differ in the order and concurrency of the nodes.
+class ResearchStrategy(ABC):
+    name: str
+
+    def __init__(self, researcher: DeepResearcher):
+        self.researcher = researcher
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+    # Returns the learning records of the tree below `expansion` (the root)
+    @abstractmethod
+    def run(self, expansion: ResearchExpansion) -> list[LearningRecord]: ...
+
+    # Blocking strategies run on a worker thread
+    async def arun(self, expansion: ResearchExpansion) -> list[LearningRecord]:
+        return await to_thread(self.run, expansion)
+
+
+class SequentialStrategy(ResearchStrategy):
+    name = "Sequential"
+
+    def run(self, expansion: ResearchExpansion) -> list[LearningRecord]:
+        records = []
+        for node in self.researcher.expand_node(expansion):
+            self._research_branch(node=node, learnings=[], records=records)
+
+        return records
+
+    # Follow-up prompts build on every learning of the root branch so far,
+    # including those of earlier siblings and their subtrees.
+    def _research_branch(
+        self,
+        node: ResearchNode,
+        learnings: list[str],
+        records: list[LearningRecord],
+    ) -> None:
+        with self.researcher.node_span(node):
+            result = self.researcher.research_node(
+                node, prompt_learnings=list(learnings)
+            )
+            learnings.append(result.record.learning)
+            records.append(result.record)
+            if result.expansion is None:
+                return
+
+            for child in self.researcher.expand_node(result.expansion):
+                self._research_branch(
+                    node=child, learnings=learnings, records=records
+                )
+
+
+# Siblings are researched on a bounded thread pool (the researcher's shared
+# executor, if any).
+class ConcurrentStrategy(ResearchStrategy):
+    name = "Concurrent"
+
+    def __init__(self, researcher: DeepResearcher):
+        super().__init__(researcher)
+        self._cancelled = Event()
+
+    def run(self, expansion: ResearchExpansion) -> list[LearningRecord]:
+        nodes = self.researcher.expand_node(expansion)
+
+        shared_executor = self.researcher.executor
+        executor = shared_executor or ThreadPoolExecutor(
+            max_workers=self.researcher.concurrency_parameters.max_workers,
+            thread_name_prefix="deep-researcher",
+        )
+        try:
+            futures = [self._submit(executor, node) for node in nodes]
+
+            # Collected in submission order (depth-first, pre-order)
+            records = []
+            for future in futures:
+                records.extend(self._collect(future))
+        except BaseException:
+            # Pending branches of this run are skipped; a shared pool keeps
+            # serving the other researchers.
+            self._cancelled.set()
+            if executor is not shared_executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        else:
+            if executor is not shared_executor:
+                executor.shutdown(wait=True)
+
+        return records
+
+    def _submit(
+        self, executor: ThreadPoolExecutor, node: ResearchNode
+    ) -> Future:
+        return executor.submit(
+            copy_context().run, self._research_branch, executor, node
+        )
+
+    def _research_branch(
+        self, executor: ThreadPoolExecutor, node: ResearchNode
+    ) -> tuple[LearningRecord, list[Future]]:
+        if self._cancelled.is_set():
+            raise CancelledError()
+
+        # Children outlive this span: they are submitted, not awaited
+        with self.researcher.node_span(node):
+            result = self.researcher.research_node(node)
+            if result.expansion is None:
+                return result.record, []
+
+            # Children are submitted rather than awaited, so no worker ever
+            # blocks on another worker and the bounded pool cannot deadlock.
+            return result.record, [
+                self._submit(executor, child)
+                for child in self.researcher.expand_node(result.expansion)
+            ]
+
+    def _collect(self, future: Future) -> list[LearningRecord]:
+        record, child_futures = future.result()
+
+        records = [record]
+        for child_future in child_futures:
+            records.extend(self._collect(child_future))
+
+        return records
+
+
+class AsyncStrategy(ResearchStrategy):
+    name = "Async"
+
+    # Each call runs on an event loop of its own; the limiter's semaphores and
+    # the plugins' async clients are kept per loop
+    def run(self, expansion: ResearchExpansion) -> list[LearningRecord]:
+        return run_coroutine(self.arun(expansion))
+
+    async def arun(self, expansion: ResearchExpansion) -> list[LearningRecord]:
+        return await self._research_nodes(
+            await self.researcher.aexpand_node(expansion)
+        )
+
+    async def _research_nodes(
+        self, nodes: list[ResearchNode]
+    ) -> list[LearningRecord]:
+        # A TaskGroup cancels the remaining branches if any branch fails
+        async with TaskGroup() as task_group:
+            tasks = [
+                task_group.create_task(self._research_branch(node))
+                for node in nodes
+            ]
+
+        return [record for task in tasks for record in task.result()]
+
+    async def _research_branch(
+        self, node: ResearchNode
+    ) -> list[LearningRecord]:
+        with self.researcher.node_span(node):
+            result = await self.researcher.aresearch_node(node)
+            if result.expansion is None:
+                return [result.record]
+
+            return [
+                result.record,
+                *await self._research_nodes(
+                    await self.researcher.aexpand_node(result.expansion)
+                ),
+            ]
+
+
+# Expands the most promising nodes first until the budget (cost or deadline)
+# of the scheduler parameters runs out.
+class BestFirstStrategy(ResearchStrategy):
+    name = "Best-First"
+
+    def __init__(self, researcher: DeepResearcher):
+        super().__init__(researcher)
+        self._budget = ResearchBudget(researcher.scheduler_parameters)
+        self._frontier = ResearchFrontier(researcher.scheduler_parameters)
+        self._token_counter = TokenCounter(
+            researcher.stage_llm_model(
+                ResearchStage.SERP_QUERIES
+            ).llm_identifier
+        )
+        self._prior_node_cost = self._estimate_prior_node_cost()
+
+    def run(self, expansion: ResearchExpansion) -> list[LearningRecord]:
+        researcher = self.researcher
+        # Spend of every call made while the run is in progress
+        researcher.budget = self._budget
+        try:
+            return self._run(expansion)
+        finally:
+            researcher.budget = None
+
+    def _run(self, expansion: ResearchExpansion) -> list[LearningRecord]:
+        budget = self._budget
+        self._push_nodes(
+            nodes=self.researcher.expand_node(expansion),
+            learnings=expansion.learnings,
+            novelty=1.0,
+        )
+
+        records = []
+        in_flight: dict[Future, FrontierNode] = {}
+        stop_reason = None
+        max_in_flight = (
+            self.researcher.concurrency_parameters.max_workers
+            if self.researcher.concurrency_parameters
+            else 1
+        )
+        with self.researcher.pooled_executor(
+            num_tasks=max_in_flight, thread_name_prefix="deep-researcher"
+        ) as executor:
+            while True:
+                # Nodes are started best-first while the estimated cost of
+                # everything in flight still fits the budget. Until a node
+                # has been paid for, the estimate is only a prior, so a
+                # single node runs and only actual spend counts.
+                while (
+                    self._frontier
+                    and stop_reason is None
+                    and len(in_flight) < max_in_flight
+                    and not (in_flight and budget.num_nodes == 0)
+                ):
+                    stop_reason = budget.exhausted_reason(
+                        committed_dollars=(len(in_flight) + 1)
+                        * budget.mean_node_cost(default_dollars=0.0)
+                    )
+                    if stop_reason is None:
+                        node = self._frontier.pop()
+                        in_flight[
+                            executor.submit(
+                                copy_context().run, self._research_node, node
+                            )
+                        ] = node
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.pop(future)
+                    result, children = future.result()
+                    records.append(result.record)
+                    if result.expansion is not None:
+                        self._push_nodes(
+                            nodes=children,
+                            learnings=result.expansion.learnings,
+                            novelty=result.novelty,
+                        )
+
+        if stop_reason is not None:
+            self._log_stop(stop_reason=stop_reason)
+
+        return records
+
+    def _research_node(
+        self, node: FrontierNode
+    ) -> tuple[NodeResult, list[ResearchNode]]:
+        budget = self._budget
+        with (
+            self.researcher.node_span(node),
+            self.researcher.cost_scope() as costs,
+        ):
+            result = self.researcher.research_node(node)
+
+            children = []
+            # Children are only generated if at least one of them fits
+            if result.expansion is not None:
+                if budget.exhausted_reason(
+                    committed_dollars=budget.mean_node_cost(
+                        default_dollars=0.0
+                    )
+                ):
+                    logger.debug(
+                        "Budget Reached: Skipping Children of %s", node
+                    )
+                else:
+                    children = self.researcher.expand_node(result.expansion)
+
+        # Replayed nodes are free and would skew the estimate
+        if costs:
+            budget.record_node_cost(dollars=sum(costs))
+
+        return result, children
+
+    def _push_nodes(
+        self, nodes: list[ResearchNode], learnings: list[str], novelty: float
+    ) -> None:
+        mean_node_cost = self._budget.mean_node_cost(
+            default_dollars=self._prior_node_cost
+        )
+        # A node's SERP queries prompt carries the learnings of its ancestors
+        estimated_cost = mean_node_cost + usage_cost(
+            self.researcher.stage_llm_model(
+                ResearchStage.SERP_QUERIES
+            ).llm_identifier,
+            TokenUsage(
+                input_tokens=self._token_counter.count("\n".join(learnings)),
+                cached_input_tokens=0,
+                completion_tokens=0,
+            ),
+        )
+
+        for node in nodes:
+            self._frontier.push(
+                FrontierNode(
+                    serp_query=node.serp_query,
+                    depth=node.depth,
+                    path=node.path,
+                    learnings=node.learnings,
+                    novelty=novelty,
+                    estimated_cost=estimated_cost,
+                ),
+                cost_scale_dollars=mean_node_cost,
+            )
+
+    def _estimate_prior_node_cost(self) -> float:
+        prior_node_cost = usage_cost(
+            self.researcher.stage_llm_model(
+                ResearchStage.LEARNINGS
+            ).llm_identifier,
+            PRIOR_NODE_USAGE,
+        )
+        crawler = self.researcher.crawler
+        crawler_llm_identifier = getattr(crawler, "llm_identifier", None)
+        if crawler_llm_identifier is not None:
+            prior_node_cost += search_call_cost(
+                crawler_llm_identifier,
+                getattr(crawler, "search_context_size", None),
+            )
+
+        return prior_node_cost
+
+    def _log_stop(self, stop_reason: str) -> None:
+        pending_nodes = self._frontier.drain()
+        logger.info(
+            "Best-First: Stopped (%s) After $%f and %.2f seconds (Pending: "
+            "%d SERP Queries)",
+            stop_reason,
+            self._budget.spent_dollars,
+            self._budget.elapsed_s,
+            len(pending_nodes),
+        )
+
+        analytics_instance = self.researcher.analytics_instance
+        if analytics_instance:
+            for node in pending_nodes:
+                search_calls, llm_calls = (
+                    self.researcher.estimate_subtree_calls(depth=node.depth)
+                )
+                analytics_instance.update_avoided_calls(
+                    reason=stop_reason,
+                    search_calls=search_calls,
+                    llm_calls=llm_calls,
+                )
+
+
+# Researches the tree one level at a time, so that each level's calls can go
+# to the provider batch API together.
+class LevelSynchronousStrategy(ResearchStrategy):
+    name = "Batch"
+
+    def run(self, expansion: ResearchExpansion) -> list[LearningRecord]:
+        records = []
+        expansions = [expansion]
+        while expansions:
+            results = self.researcher.research_level(expansions)
+            records.extend(result.record for result in results)
+            expansions = [
+                result.expansion
+                for result in results
+                if result.expansion is not None
+            ]
+
+        return records
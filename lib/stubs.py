@@ -0,0 +1,690 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from email.utils import formatdate, parsedate_to_datetime
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from json import dumps, loads
+from math import ceil
+from re import fullmatch
+from threading import Lock, Thread
+from time import sleep, time
+from typing import TYPE_CHECKING, Callable, Optional
+
+from lib.log import logger
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+
+def forward_chat_completion(llm_instance: OpenAI) -> Callable[[dict], dict]:
+    # Serves batch requests with online completions, so batch mode can be
+    # exercised against real models without waiting for the batch window.
+    def handle_chat_completion(body: dict) -> dict:
+        return llm_instance.chat.completions.create(**body).model_dump(
+            mode="json"
+        )
+
+    return handle_chat_completion
+
+
+# Local stand-in for the OpenAI Files and Batch endpoints used by
+# `OpenAICompatibleLLMModel.batch_generate_llm_responses`. Point an `OpenAI`
+# client's `base_url` at `base_url`. Each request line is answered by
+# `completion_handler` (request body -> chat completion body); a handler
+# exception becomes an error line in the batch's error file.
+class OpenAIBatchStubServer:
+    def __init__(
+        self,
+        completion_handler: Callable[[dict], dict],
+        processing_delay_s: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.completion_handler = completion_handler
+        self.processing_delay_s = processing_delay_s
+
+        self._files: dict[str, bytes] = {}
+        self._batches: dict[str, dict] = {}
+        self._ids = count(1)
+        self._lock = Lock()
+
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[Thread] = None
+
+    def __repr__(self):
+        return f"OpenAIBatchStubServer(base_url={self.base_url})"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> None:
+        self._thread = Thread(
+            target=self._server.serve_forever,
+            name="openai-batch-stub",
+            daemon=True,
+        )
+        self._thread.start()
+        logger.info("Batch Stub: Listening on %s", self.base_url)
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _next_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}-stub-{next(self._ids)}"
+
+    def _create_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file_id = self._next_id("file")
+        with self._lock:
+            self._files[file_id] = content
+
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+
+    def _create_batch(self, request: dict) -> dict:
+        batch = {
+            "id": self._next_id("batch"),
+            "object": "batch",
+            "endpoint": request["endpoint"],
+            "input_file_id": request["input_file_id"],
+            "completion_window": request["completion_window"],
+            "status": "validating",
+            "created_at": int(time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        with self._lock:
+            self._batches[batch["id"]] = batch
+
+        Thread(
+            target=self._process_batch, args=(batch["id"],), daemon=True
+        ).start()
+        return batch
+
+    def _process_batch(self, batch_id: str) -> None:
+        with self._lock:
+            batch = self._batches[batch_id]
+            batch["status"] = "in_progress"
+            lines = self._files[batch["input_file_id"]].decode("utf-8")
+
+        sleep(self.processing_delay_s)
+
+        output_lines, error_lines = [], []
+        for line in lines.splitlines():
+            request = loads(line)
+            try:
+                output_lines.append({
+                    "id": self._next_id("batch_req"),
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "request_id": self._next_id("req"),
+                        "body": self.completion_handler(request["body"]),
+                    },
+                    "error": None,
+                })
+            except Exception as error:
+                logger.warning(
+                    "Batch Stub: Request Failed (%s): %r",
+                    request["custom_id"],
+                    error,
+                )
+                error_lines.append({
+                    "id": self._next_id("batch_req"),
+                    "custom_id": request["custom_id"],
+                    "response": None,
+                    "error": {"code": "stub_error", "message": repr(error)},
+                })
+
+        output_file = self._create_file(
+            "\n".join(dumps(line) for line in output_lines).encode("utf-8"),
+            f"{batch_id}_output.jsonl",
+            "batch_output",
+        )
+        error_file = (
+            self._create_file(
+                "\n".join(dumps(line) for line in error_lines).encode("utf-8"),
+                f"{batch_id}_error.jsonl",
+                "batch_output",
+            )
+            if error_lines
+            else None
+        )
+
+        with self._lock:
+            if batch["status"] == "cancelling":
+                batch["status"] = "cancelled"
+                return
+
+            batch.update({
+                "status": "completed",
+                "output_file_id": output_file["id"],
+                "error_file_id": error_file["id"] if error_file else None,
+                "request_counts": {
+                    "total": len(output_lines) + len(error_lines),
+                    "completed": len(output_lines),
+                    "failed": len(error_lines),
+                },
+            })
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug("Batch Stub: %s", format % args)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+
+                if self.path == "/v1/files":
+                    fields = _multipart_fields(
+                        self.headers["Content-Type"], body
+                    )
+                    filename, content = fields["file"]
+                    return self._send(
+                        stub._create_file(
+                            content, filename, fields["purpose"][1].decode()
+                        )
+                    )
+
+                if self.path == "/v1/batches":
+                    return self._send(stub._create_batch(loads(body)))
+
+                match = fullmatch(r"/v1/batches/([\w-]+)/cancel", self.path)
+                if match and match.group(1) in stub._batches:
+                    with stub._lock:
+                        batch = stub._batches[match.group(1)]
+                        if batch["status"] in ("validating", "in_progress"):
+                            batch["status"] = "cancelling"
+
+                    return self._send(batch)
+
+                self._send({"error": {"message": "Not Found"}}, 404)
+
+            def do_GET(self):
+                match = fullmatch(r"/v1/batches/([\w-]+)", self.path)
+                if match and match.group(1) in stub._batches:
+                    with stub._lock:
+                        return self._send(dict(stub._batches[match.group(1)]))
+
+                match = fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+                if match and match.group(1) in stub._files:
+                    return self._send_bytes(
+                        stub._files[match.group(1)], "application/jsonl"
+                    )
+
+                self._send({"error": {"message": "Not Found"}}, 404)
+
+            def _send(self, payload: dict, status_code: int = 200) -> None:
+                self._send_bytes(
+                    dumps(payload).encode("utf-8"),
+                    "application/json",
+                    status_code,
+                )
+
+            def _send_bytes(
+                self, content: bytes, content_type: str, status_code: int = 200
+            ) -> None:
+                self.send_response(status_code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        return Handler
+
+
+# Local stand-in for the Gemini cachedContents and generateContent endpoints
+# used by `GeminiContextCache` and the Gemini plugins. Point a `Client`'s
+# `http_options` base URL at `base_url`. Tokens are estimated from the text
+# (4 characters each); generateContent requests are answered with the text
+# returned by `response_handler` (request body -> text). Like the real API,
+# caches below `min_cached_tokens` are refused, and requests that reference
+# a cache must not repeat its system instruction or tools.
+class GeminiCacheStubServer:
+    def __init__(
+        self,
+        response_handler: Optional[Callable[[dict], str]] = None,
+        min_cached_tokens: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.response_handler = response_handler or (lambda body: "stub")
+        self.min_cached_tokens = min_cached_tokens
+
+        self.cached_contents: dict[str, dict] = {}
+        self.requests: list[dict] = []
+        self.deleted: list[str] = []
+        self._ids = count(1)
+        self._lock = Lock()
+
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[Thread] = None
+
+    def __repr__(self):
+        return f"GeminiCacheStubServer(base_url={self.base_url})"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        self._thread = Thread(
+            target=self._server.serve_forever,
+            name="gemini-cache-stub",
+            daemon=True,
+        )
+        self._thread.start()
+        logger.info("Cache Stub: Listening on %s", self.base_url)
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _create_cached_content(self, request: dict) -> tuple[dict, int]:
+        num_tokens = _estimate_tokens(
+            [request.get("systemInstruction"), *request.get("contents", [])]
+        )
+        if num_tokens < self.min_cached_tokens:
+            return _stub_error(
+                400,
+                f"Cached content is too small: {num_tokens} tokens (minimum: "
+                f"{self.min_cached_tokens})",
+            )
+
+        name = f"cachedContents/stub-{next(self._ids)}"
+        cached_content = {
+            "name": name,
+            "model": request["model"],
+            "createTime": _timestamp(time()),
+            "expireTime": _timestamp(time() + _duration_s(request["ttl"])),
+            "usageMetadata": {"totalTokenCount": num_tokens},
+            "_expire_time_s": time() + _duration_s(request["ttl"]),
+        }
+        with self._lock:
+            self.cached_contents[name] = cached_content
+
+        return _public_fields(cached_content), 200
+
+    def _update_cached_content(
+        self, name: str, request: dict
+    ) -> tuple[dict, int]:
+        with self._lock:
+            cached_content = self._live_cached_content(name)
+            if cached_content is None:
+                return _stub_error(404, f"Not Found: {name}")
+
+            expire_time_s = time() + _duration_s(request["ttl"])
+            cached_content.update({
+                "updateTime": _timestamp(time()),
+                "expireTime": _timestamp(expire_time_s),
+                "_expire_time_s": expire_time_s,
+            })
+            return _public_fields(cached_content), 200
+
+    def _delete_cached_content(self, name: str) -> tuple[dict, int]:
+        with self._lock:
+            if self.cached_contents.pop(name, None) is None:
+                return _stub_error(404, f"Not Found: {name}")
+
+            self.deleted.append(name)
+            return {}, 200
+
+    def _generate_content(self, request: dict) -> tuple[dict, int]:
+        with self._lock:
+            self.requests.append(request)
+
+            cached_tokens = 0
+            name = request.get("cachedContent")
+            if name:
+                cached_content = self._live_cached_content(name)
+                if cached_content is None:
+                    return _stub_error(404, f"Not Found: {name}")
+
+                if request.get("systemInstruction") or request.get("tools"):
+                    return _stub_error(
+                        400,
+                        "CachedContent can not be used with "
+                        "GenerateContent request setting system_instruction, "
+                        "tools or tool_config",
+                    )
+
+                cached_tokens = cached_content["usageMetadata"][
+                    "totalTokenCount"
+                ]
+
+        text = self.response_handler(request)
+        prompt_tokens = cached_tokens + _estimate_tokens(
+            [request.get("systemInstruction"), *request.get("contents", [])]
+        )
+        return {
+            "candidates": [
+                {
+                    "content": {"role": "model", "parts": [{"text": text}]},
+                    "finishReason": "STOP",
+                }
+            ],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "cachedContentTokenCount": cached_tokens or None,
+                "candidatesTokenCount": _estimate_tokens([text]),
+            },
+        }, 200
+
+    def _live_cached_content(self, name: str) -> Optional[dict]:
+        cached_content = self.cached_contents.get(name)
+        if cached_content is None or cached_content["_expire_time_s"] <= time():
+            return None
+
+        return cached_content
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug("Cache Stub: %s", format % args)
+
+            def do_POST(self):
+                request = self._read_json()
+
+                if self.path == "/v1beta/cachedContents":
+                    return self._send(*stub._create_cached_content(request))
+
+                if fullmatch(
+                    r"/v1beta/models/[\w.-]+:generateContent", self.path
+                ):
+                    return self._send(*stub._generate_content(request))
+
+                self._send(*_stub_error(404, "Not Found"))
+
+            def do_PATCH(self):
+                request = self._read_json()
+
+                match = fullmatch(
+                    r"/v1beta/(cachedContents/[\w-]+)(\?.*)?", self.path
+                )
+                if match:
+                    return self._send(
+                        *stub._update_cached_content(match.group(1), request)
+                    )
+
+                self._send(*_stub_error(404, "Not Found"))
+
+            def do_GET(self):
+                match = fullmatch(
+                    r"/v1beta/(cachedContents/[\w-]+)", self.path
+                )
+                if match:
+                    with stub._lock:
+                        cached_content = stub._live_cached_content(
+                            match.group(1)
+                        )
+                        if cached_content is not None:
+                            return self._send(
+                                _public_fields(cached_content), 200
+                            )
+
+                self._send(*_stub_error(404, "Not Found"))
+
+            def do_DELETE(self):
+                match = fullmatch(
+                    r"/v1beta/(cachedContents/[\w-]+)", self.path
+                )
+                if match:
+                    return self._send(
+                        *stub._delete_cached_content(match.group(1))
+                    )
+
+                self._send(*_stub_error(404, "Not Found"))
+
+            def _read_json(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return loads(self.rfile.read(length)) if length else {}
+
+            def _send(self, payload: dict, status_code: int) -> None:
+                content = dumps(payload).encode("utf-8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        return Handler
+
+
+# Local web server for `PageFetcher`. `pages` maps paths to a content type
+# and body; pages carry an ETag and Last-Modified and answer conditional
+# GETs with 304 Not Modified. Requests are delayed by `latency_s`, and the
+# peak number of requests in flight is tracked per Host header, so that the
+# fetcher's limits can be checked (127.0.0.1 and localhost count as two
+# hosts). Connections are kept alive (HTTP/1.1).
+class PageStubServer:
+    def __init__(
+        self,
+        pages: Optional[dict[str, tuple[str, bytes | str]]] = None,
+        latency_s: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency_s = latency_s
+
+        self.requests: list[tuple[str, int]] = []
+        self.connections: int = 0
+        self.max_in_flight: dict[str, int] = {}
+        self._pages: dict[str, tuple[str, bytes, str, str]] = {}
+        self._in_flight: dict[str, int] = {}
+        self._lock = Lock()
+
+        for page_path, (content_type, body) in (pages or {}).items():
+            self.set_page(page_path, content_type, body)
+
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[Thread] = None
+
+    def __repr__(self):
+        return f"PageStubServer(base_url={self.base_url})"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        self._thread = Thread(
+            target=self._server.serve_forever,
+            name="page-stub",
+            daemon=True,
+        )
+        self._thread.start()
+        logger.info("Page Stub: Listening on %s", self.base_url)
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    # Replacing a page changes its validators
+    def set_page(
+        self, page_path: str, content_type: str, body: bytes | str
+    ) -> None:
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        with self._lock:
+            self._pages[page_path] = (
+                content_type,
+                body,
+                f'"{sha256(body).hexdigest()[:16]}"',
+                formatdate(time(), usegmt=True),
+            )
+
+    def _page_response(
+        self, page_path: str, headers: dict
+    ) -> tuple[int, dict, bytes]:
+        with self._lock:
+            page = self._pages.get(page_path)
+        if page is None:
+            return 404, {"Content-Type": "text/plain"}, b"Not Found"
+
+        content_type, body, etag, last_modified = page
+        page_headers = {"ETag": etag, "Last-Modified": last_modified}
+
+        # If-None-Match takes precedence (RFC 9110)
+        if_none_match = headers.get("If-None-Match")
+        if_modified_since = headers.get("If-Modified-Since")
+        if (if_none_match is not None and if_none_match == etag) or (
+            if_none_match is None
+            and if_modified_since is not None
+            and parsedate_to_datetime(if_modified_since)
+            >= parsedate_to_datetime(last_modified)
+        ):
+            return 304, page_headers, b""
+
+        return 200, {"Content-Type": content_type, **page_headers}, body
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logger.debug("Page Stub: %s", format % args)
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            # Clients drop the connection when they stop reading a page at
+            # one of their caps
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionError:
+                    pass
+
+            def do_GET(self):
+                host = self.headers.get("Host", "")
+                with stub._lock:
+                    stub._in_flight[host] = stub._in_flight.get(host, 0) + 1
+                    stub.max_in_flight[host] = max(
+                        stub.max_in_flight.get(host, 0), stub._in_flight[host]
+                    )
+
+                try:
+                    sleep(stub.latency_s)
+                    status_code, headers, body = stub._page_response(
+                        self.path, self.headers
+                    )
+                    with stub._lock:
+                        stub.requests.append((self.path, status_code))
+
+                    self.send_response(status_code)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with stub._lock:
+                        stub._in_flight[host] -= 1
+
+        return Handler
+
+
+def _estimate_tokens(contents: list[Optional[dict | str]]) -> int:
+    num_chars = 0
+    for content in contents:
+        if isinstance(content, str):
+            num_chars += len(content)
+        elif content:
+            num_chars += sum(
+                len(part.get("text", "")) for part in content.get("parts", [])
+            )
+
+    return ceil(num_chars / 4)
+
+
+def _duration_s(duration: str) -> float:
+    return float(duration.removesuffix("s"))
+
+
+def _timestamp(time_s: float) -> str:
+    return (
+        datetime.fromtimestamp(time_s, timezone.utc)
+        .isoformat()
+        .replace("+00:00", "Z")
+    )
+
+
+def _public_fields(cached_content: dict) -> dict:
+    return {
+        key: value
+        for key, value in cached_content.items()
+        if not key.startswith("_")
+    }
+
+
+def _stub_error(status_code: int, message: str) -> tuple[dict, int]:
+    status = {400: "INVALID_ARGUMENT", 404: "NOT_FOUND"}[status_code]
+    return {
+        "error": {"code": status_code, "message": message, "status": status}
+    }, status_code
+
+
+def _multipart_fields(
+    content_type: str, body: bytes
+) -> dict[str, tuple[Optional[str], bytes]]:
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body
+    )
+
+    return {
+        part.get_param("name", header="content-disposition"): (
+            part.get_filename(),
+            part.get_payload(decode=True),
+        )
+        for part in message.iter_parts()
+    }
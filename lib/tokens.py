@@ -0,0 +1,225 @@
+from dataclasses import replace
+from functools import lru_cache
+from math import ceil
+from typing import Optional
+
+from tiktoken import Encoding, encoding_for_model, get_encoding
+
+from lib.config import DeepResearchTokenBudgetParameters
+from lib.constants import LLMIdentifier
+from lib.log import logger
+from lib.models.crawler import SERPQuerySearchResults
+
+# Gemini and newer OpenAI models are not registered with tiktoken; o200k_base
+# is close enough for budgeting purposes.
+FALLBACK_ENCODING = "o200k_base"
+# Used when no encoding can be loaded at all (e.g. offline hosts)
+FALLBACK_CHARACTERS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _load_encoding(model_identifier: str) -> Optional[Encoding]:
+    try:
+        return encoding_for_model(model_identifier)
+    except KeyError:
+        logger.debug(
+            "Tokenizer: Unknown Model %s (using: %s)",
+            model_identifier,
+            FALLBACK_ENCODING,
+        )
+    except Exception:
+        logger.warning(
+            "Tokenizer: Failed to Load Encoding for %s", model_identifier
+        )
+        return None
+
+    try:
+        return get_encoding(FALLBACK_ENCODING)
+    except Exception:
+        logger.warning(
+            "Tokenizer: Failed to Load Encoding %s (using character "
+            "estimate)",
+            FALLBACK_ENCODING,
+        )
+        return None
+
+
+class TokenCounter:
+    def __init__(self, llm_identifier: LLMIdentifier):
+        self.llm_identifier = llm_identifier
+        self._encoding = _load_encoding(llm_identifier.value.model_identifier)
+
+    def count(self, text: str) -> int:
+        if self._encoding is None:
+            return ceil(len(text) / FALLBACK_CHARACTERS_PER_TOKEN)
+
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+
+        if self._encoding is None:
+            return text[: max_tokens * FALLBACK_CHARACTERS_PER_TOKEN]
+
+        tokens = self._encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+
+        return self._encoding.decode(tokens[:max_tokens])
+
+
+def allocate_token_budget(
+    token_counts: list[int], budget_tokens: int, min_tokens: int = 0
+) -> list[int]:
+    if sum(token_counts) <= budget_tokens:
+        return list(token_counts)
+
+    # Water-filling: short items keep all their tokens and hand their unused
+    # share to the longer ones. If the fair share drops below `min_tokens`,
+    # the lowest-ranked (last) item is dropped and the budget re-split.
+    for num_kept in range(len(token_counts), 0, -1):
+        allocations = [0] * len(token_counts)
+        remaining_tokens = max(budget_tokens, 0)
+
+        kept_indices = sorted(range(num_kept), key=token_counts.__getitem__)
+        for position, index in enumerate(kept_indices):
+            fair_share = remaining_tokens // (num_kept - position)
+            allocations[index] = min(token_counts[index], fair_share)
+            remaining_tokens -= allocations[index]
+
+        if all(
+            allocations[index] >= min(token_counts[index], min_tokens)
+            for index in range(num_kept)
+        ):
+            return allocations
+
+    return [0] * len(token_counts)
+
+
+class PromptBudget:
+    def __init__(
+        self,
+        llm_identifier: LLMIdentifier,
+        budget_parameters: DeepResearchTokenBudgetParameters,
+    ):
+        self.token_counter = TokenCounter(llm_identifier)
+        self.budget_parameters = budget_parameters
+
+        self.max_prompt_tokens = (
+            int(
+                llm_identifier.value.context_window_size
+                * budget_parameters.context_window_fraction
+            )
+            - budget_parameters.reserved_completion_tokens
+        )
+        if self.max_prompt_tokens <= 0:
+            raise ValueError(
+                "Invalid: Token Budget (reserved_completion_tokens exceeds "
+                "the context window fraction)"
+            )
+
+    def available_tokens(self, *fixed_prompts: str) -> int:
+        return self.max_prompt_tokens - sum(
+            self.token_counter.count(prompt) for prompt in fixed_prompts
+        )
+
+    def fit_search_results(
+        self, search_results: SERPQuerySearchResults, *fixed_prompts: str
+    ) -> SERPQuerySearchResults:
+        # Only `content` is trimmed; titles, descriptions and URLs are short
+        # and are charged against the budget up front.
+        metadata_tokens = sum(
+            self.token_counter.count(
+                f"{result.title}{result.description}{result.url}"
+            )
+            for result in search_results.search_results
+        )
+        content_tokens = [
+            self.token_counter.count(result.content)
+            for result in search_results.search_results
+        ]
+        allocations = allocate_token_budget(
+            content_tokens,
+            self.available_tokens(*fixed_prompts) - metadata_tokens,
+            self.budget_parameters.min_item_tokens,
+        )
+
+        fitted_results = [
+            (
+                result
+                if allocation == num_tokens
+                else replace(
+                    result,
+                    content=self.token_counter.truncate(
+                        result.content, allocation
+                    ),
+                )
+            )
+            for result, num_tokens, allocation in zip(
+                search_results.search_results,
+                content_tokens,
+                allocations,
+                strict=True,
+            )
+            if allocation > 0
+        ]
+
+        self._log_savings(
+            "Search Results",
+            sum(content_tokens) - sum(allocations),
+            len(search_results.search_results) - len(fitted_results),
+        )
+        return SERPQuerySearchResults(search_results=fitted_results)
+
+    def fit_text(self, text: str, *fixed_prompts: str) -> str:
+        num_tokens = self.token_counter.count(text)
+        available_tokens = self.available_tokens(*fixed_prompts)
+        if num_tokens <= available_tokens:
+            return text
+
+        self._log_savings(
+            "Text", num_tokens - max(available_tokens, 0), 0
+        )
+        return self.token_counter.truncate(text, available_tokens)
+
+    def fit_items(self, items: list[str], *fixed_prompts: str) -> list[str]:
+        item_tokens = [self.token_counter.count(item) for item in items]
+        allocations = allocate_token_budget(
+            item_tokens,
+            self.available_tokens(*fixed_prompts),
+            self.budget_parameters.min_item_tokens,
+        )
+
+        fitted_items = [
+            (
+                item
+                if allocation == num_tokens
+                else self.token_counter.truncate(item, allocation)
+            )
+            for item, num_tokens, allocation in zip(
+                items, item_tokens, allocations, strict=True
+            )
+            if allocation > 0
+        ]
+
+        self._log_savings(
+            "Items",
+            sum(item_tokens) - sum(allocations),
+            len(items) - len(fitted_items),
+        )
+        return fitted_items
+
+    def _log_savings(
+        self, content_type: str, saved_tokens: int, dropped_items: int
+    ) -> None:
+        if saved_tokens <= 0:
+            logger.debug("Token Budget: %s Fit (no trimming)", content_type)
+            return
+
+        logger.info(
+            "Token Budget: Saved %d Tokens from %s (Dropped: %d)",
+            saved_tokens,
+            content_type,
+            dropped_items,
+        )
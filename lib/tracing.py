@@ -0,0 +1,189 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from json import dumps
+from secrets import token_hex
+from threading import Lock
+from time import time_ns
+from typing import Iterator, Optional
+
+from lib.log import logger
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_CODE_OK = 1
+STATUS_CODE_ERROR = 2
+
+AttributeValue = str | bool | int | float
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar(
+    "current_span", default=None
+)
+
+
+def current_span() -> Optional["Span"]:
+    return _current_span.get()
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_span_id: Optional[str],
+        kind: int,
+        attributes: dict[str, Optional[AttributeValue]],
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.attributes = {}
+        self.set_attributes(**attributes)
+
+        self.start_time_ns = time_ns()
+        self.end_time_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def __repr__(self):
+        return (
+            f"Span(name={self.name}, trace_id={self.trace_id}, "
+            f"span_id={self.span_id})"
+        )
+
+    def set_attributes(self, **attributes: Optional[AttributeValue]) -> None:
+        self.attributes.update({
+            key: value for key, value in attributes.items() if value is not None
+        })
+
+    # OTLP/JSON encoding (64-bit integers are strings)
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": (
+                {"code": STATUS_CODE_ERROR, "message": self.error}
+                if self.error is not None
+                else {"code": STATUS_CODE_OK}
+            ),
+        }
+        if self.parent_span_id is not None:
+            span["parentSpanId"] = self.parent_span_id
+
+        return span
+
+
+def _otlp_value(value: AttributeValue) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+
+    return {"stringValue": str(value)}
+
+
+# Writes finished spans as OTLP/JSON lines (one `ExportTraceServiceRequest`
+# per line, as written by the OpenTelemetry Collector's file exporter).
+# Spans are buffered and written when a root span ends, when the buffer is
+# full, or on `flush`. Pool threads only see the current span if the task is
+# submitted with `contextvars.copy_context().run`.
+class ResearchTracer:
+    def __init__(
+        self,
+        trace_path: str,
+        service_name: str = "deep-researcher",
+        max_buffered_spans: int = 512,
+    ):
+        self.trace_path = trace_path
+        self.service_name = service_name
+        self.max_buffered_spans = max_buffered_spans
+
+        self._spans: list[Span] = []
+        self._lock = Lock()
+
+    def __repr__(self):
+        return f"ResearchTracer(trace_path={self.trace_path})"
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        kind: int = SPAN_KIND_INTERNAL,
+        **attributes: Optional[AttributeValue],
+    ) -> Iterator[Span]:
+        parent_span = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent_span.trace_id if parent_span else token_hex(16),
+            parent_span_id=parent_span.span_id if parent_span else None,
+            kind=kind,
+            attributes=attributes,
+        )
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.error = repr(error)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_time_ns = time_ns()
+            self._finish(span)
+
+    def flush(self) -> None:
+        with self._lock:
+            spans, self._spans = self._spans, []
+
+            if not spans:
+                return
+
+            request = {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [
+                                {
+                                    "key": "service.name",
+                                    "value": _otlp_value(self.service_name),
+                                }
+                            ]
+                        },
+                        "scopeSpans": [
+                            {
+                                "scope": {"name": "lib.tracing"},
+                                "spans": [span.to_otlp() for span in spans],
+                            }
+                        ],
+                    }
+                ]
+            }
+            with open(self.trace_path, "a", encoding="utf-8") as file_handle:
+                file_handle.write(dumps(request) + "\n")
+
+        logger.debug("Flushed: %d Trace Spans", len(spans))
+
+    def close(self) -> None:
+        self.flush()
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+            flush = (
+                span.parent_span_id is None
+                or len(self._spans) >= self.max_buffered_spans
+            )
+
+        if flush:
+            self.flush()
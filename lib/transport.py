@@ -0,0 +1,357 @@
+from asyncio import sleep as asleep
+from random import uniform
+from threading import Lock
+from time import monotonic, perf_counter, sleep
+from typing import Optional
+
+from httpx import AsyncClient, Limits, Timeout, TransportError
+from httpx import Response as AsyncResponse
+from requests import RequestException, Response, Session
+from requests.adapters import HTTPAdapter
+
+from lib.concurrency import LoopLocalClients
+from lib.log import logger
+
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, recovery_timeout_s: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout_s = recovery_timeout_s
+
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        # Start of the single trial request admitted while half-open
+        self._probe_started_at: Optional[float] = None
+        self._lock = Lock()
+
+        self.times_opened: int = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+
+        if monotonic() - self._opened_at >= self.recovery_timeout_s:
+            return "half_open"
+
+        return "open"
+
+    def allow_request(self) -> bool:
+        # Half-open admits one probe at a time; its outcome closes or
+        # re-opens the circuit. A probe that never reports back (e.g. a
+        # cancelled task) is replaced after another recovery timeout.
+        with self._lock:
+            state = self._state()
+            if state != "half_open":
+                return state == "closed"
+
+            now = monotonic()
+            if (
+                self._probe_started_at is not None
+                and now - self._probe_started_at < self.recovery_timeout_s
+            ):
+                return False
+
+            logger.info("Circuit Breaker: Half-Open (admitting probe)")
+            self._probe_started_at = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Circuit Breaker: Closed")
+
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._probe_started_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+
+            if self._state() == "half_open" or (
+                self._opened_at is None
+                and self._consecutive_failures >= self.failure_threshold
+            ):
+                logger.warning(
+                    "Circuit Breaker: Opened (%d consecutive failures)",
+                    self._consecutive_failures,
+                )
+                self._opened_at = monotonic()
+                self.times_opened += 1
+
+            self._probe_started_at = None
+
+
+class HTTPTransportStats:
+    def __init__(self, max_latency_samples: int = 10_000):
+        self.max_latency_samples = max_latency_samples
+
+        self.requests: int = 0
+        self.retries: int = 0
+        self.failures: int = 0
+        self.rejected: int = 0
+        self.latencies_s: list[float] = []
+        self._lock = Lock()
+
+    def record(self, latency_s: float, retries: int, failed: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.retries += retries
+            self.failures += failed
+
+            # Bounded reservoir: keep the most recent samples only
+            self.latencies_s.append(latency_s)
+            if len(self.latencies_s) > self.max_latency_samples:
+                del self.latencies_s[: -self.max_latency_samples]
+
+    def record_rejected(self) -> None:
+        with self._lock:
+            self.rejected += 1
+
+    def latency_percentile_s(self, percentile: float) -> float:
+        with self._lock:
+            latencies_s = sorted(self.latencies_s)
+
+        if not latencies_s:
+            return 0.0
+
+        index = min(
+            len(latencies_s) - 1, int(round(percentile / 100 * (len(latencies_s) - 1)))
+        )
+        return latencies_s[index]
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "latency_p50_s": self.latency_percentile_s(50),
+            "latency_p95_s": self.latency_percentile_s(95),
+            "latency_max_s": self.latency_percentile_s(100),
+        }
+
+
+class HTTPTransport:
+    def __init__(
+        self,
+        connect_timeout_s: float = 5.0,
+        read_timeout_s: float = 90.0,
+        max_retries: int = 3,
+        backoff_base_s: float = 0.5,
+        backoff_max_s: float = 30.0,
+        pool_connections: int = 10,
+        pool_maxsize: int = 32,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.connect_timeout_s = connect_timeout_s
+        self.read_timeout_s = read_timeout_s
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.stats = HTTPTransportStats()
+
+        # Retries are handled here (with jitter and circuit breaking), so the
+        # adapter itself must not retry.
+        self.session = Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._async_clients = LoopLocalClients(
+            name="Async HTTP Client",
+            create=self._create_async_client,
+            close=AsyncClient.aclose,
+        )
+
+    def _create_async_client(self) -> AsyncClient:
+        return AsyncClient(
+            timeout=Timeout(self.read_timeout_s, connect=self.connect_timeout_s),
+            limits=Limits(
+                max_connections=self.pool_maxsize,
+                max_keepalive_connections=self.pool_maxsize,
+            ),
+        )
+
+    def post(self, url: str, **kwargs) -> Response:
+        return self.request("POST", url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.arequest("POST", url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs) -> Response:
+        self._check_circuit(url)
+        start_time_s = perf_counter()
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    timeout=(self.connect_timeout_s, self.read_timeout_s),
+                    **kwargs,
+                )
+            except RequestException as exception:
+                delay_s = self._on_failure(url, attempt, start_time_s, exception)
+                if delay_s is None:
+                    raise
+
+                sleep(delay_s)
+                continue
+
+            delay_s = self._on_response(
+                url, attempt, start_time_s, response.status_code, response.headers
+            )
+            if delay_s is None:
+                return response
+
+            response.close()
+            sleep(delay_s)
+
+    # With `stream=True` the body is left unread; the caller must close the
+    # response (as with `requests`' own `stream=True`)
+    async def arequest(
+        self, method: str, url: str, stream: bool = False, **kwargs
+    ) -> AsyncResponse:
+        self._check_circuit(url)
+        start_time_s = perf_counter()
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._asend(method, url, stream, **kwargs)
+            except TransportError as exception:
+                delay_s = self._on_failure(url, attempt, start_time_s, exception)
+                if delay_s is None:
+                    raise
+
+                await asleep(delay_s)
+                continue
+
+            delay_s = self._on_response(
+                url, attempt, start_time_s, response.status_code, response.headers
+            )
+            if delay_s is None:
+                return response
+
+            await response.aclose()
+            await asleep(delay_s)
+
+    async def _asend(
+        self, method: str, url: str, stream: bool, **kwargs
+    ) -> AsyncResponse:
+        async_client = await self._async_clients.get()
+        if not stream:
+            return await async_client.request(method, url, **kwargs)
+
+        follow_redirects = kwargs.pop("follow_redirects", False)
+        return await async_client.send(
+            async_client.build_request(method, url, **kwargs),
+            stream=True,
+            follow_redirects=follow_redirects,
+        )
+
+    def close(self) -> None:
+        self.session.close()
+
+    # Closes the async client of the running event loop
+    async def aclose(self) -> None:
+        self.session.close()
+        await self._async_clients.aclose()
+
+    def _check_circuit(self, url: str) -> None:
+        if not self.circuit_breaker.allow_request():
+            self.stats.record_rejected()
+            logger.error("HTTP: Circuit Open (rejecting: %s)", url)
+            raise CircuitOpenError("Circuit Open")
+
+    def _on_response(
+        self,
+        url: str,
+        attempt: int,
+        start_time_s: float,
+        status_code: int,
+        headers: dict,
+    ) -> Optional[float]:
+        if status_code not in RETRYABLE_STATUS_CODES:
+            # Non-retryable client errors say nothing about server health
+            self.circuit_breaker.record_success()
+            self._record(url, attempt, start_time_s, status_code, failed=False)
+            return None
+
+        self.circuit_breaker.record_failure()
+        if attempt >= self.max_retries or not self.circuit_breaker.allow_request():
+            self._record(url, attempt, start_time_s, status_code, failed=True)
+            return None
+
+        delay_s = self._backoff_s(attempt, headers.get("Retry-After"))
+        logger.warning(
+            "HTTP: Retrying %s (status: %d, attempt: %d, delay: %.2fs)",
+            url,
+            status_code,
+            attempt + 1,
+            delay_s,
+        )
+        return delay_s
+
+    def _on_failure(
+        self, url: str, attempt: int, start_time_s: float, exception: Exception
+    ) -> Optional[float]:
+        self.circuit_breaker.record_failure()
+        if attempt >= self.max_retries or not self.circuit_breaker.allow_request():
+            self._record(url, attempt, start_time_s, None, failed=True)
+            return None
+
+        delay_s = self._backoff_s(attempt)
+        logger.warning(
+            "HTTP: Retrying %s (error: %s, attempt: %d, delay: %.2fs)",
+            url,
+            type(exception).__name__,
+            attempt + 1,
+            delay_s,
+        )
+        return delay_s
+
+    def _backoff_s(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max_s)
+
+        # Full jitter, so concurrent callers do not retry in lock-step
+        return uniform(
+            0, min(self.backoff_max_s, self.backoff_base_s * 2**attempt)
+        )
+
+    def _record(
+        self,
+        url: str,
+        attempt: int,
+        start_time_s: float,
+        status_code: Optional[int],
+        failed: bool,
+    ) -> None:
+        latency_s = perf_counter() - start_time_s
+        self.stats.record(latency_s=latency_s, retries=attempt, failed=failed)
+        logger.debug(
+            "HTTP: %s (status: %s, retries: %d, latency: %.3fs)",
+            url,
+            status_code,
+            attempt,
+            latency_s,
+        )
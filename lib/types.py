@@ -19,6 +19,10 @@ class ModelParameters:
     cpm_cached_input_tokens_dollars: float
     cpm_completion_tokens_dollars: float
     search_cost: Optional[ModelParametersSearchCost] = None
+    # Fraction of the online price billed for provider batch API requests
+    batch_cost_multiplier: float = 0.5
+    # Storage of explicitly cached context (per million tokens per hour)
+    cpm_cache_storage_dollars_per_hour: float = 0.0
 
 
 @dataclass
@@ -28,6 +32,20 @@ class TokenUsage:
     completion_tokens: int
 
 
+# Reported in place of provider usage when a response is served from a cache;
+# the saved usage is tracked but never billed.
+@dataclass
+class CacheHitUsage:
+    saved_usage: TokenUsage
+
+
+# Reported for requests served through a provider batch API, which are billed
+# at `ModelParameters.batch_cost_multiplier` of the online price.
+@dataclass
+class BatchUsage:
+    usage: TokenUsage
+
+
 @dataclass
 class TokenUsageCost:
     non_cached_input_tokens_cost: float
@@ -46,3 +64,12 @@ class UsageDescription(Enum):
 class ModelProvider(Enum):
     OPENAI = "OpenAI"
     GOOGLE = "Google"
+
+
+class ResearchStage(Enum):
+    QUERY_REFINEMENT = "query_refinement"
+    SERP_QUERIES = "serp_queries"
+    SEARCH = "search"
+    LEARNINGS = "learnings"
+    REPORT_SUMMARY = "report_summary"
+    REPORT = "report"
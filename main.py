@@ -1,51 +1,137 @@
 from os import getenv
+from sys import argv
 
 from dotenv import load_dotenv
 from google.genai import Client
 from openai import OpenAI
 
 from lib.analytics import LLMAnalytics
+from lib.config import (
+    DeepResearchConcurrencyParameters,
+    DeepResearchHyperParameters,
+    DeepResearchSchedulerParameters,
+    DeepResearchTokenBudgetParameters,
+)
 from lib.constants import LLMIdentifier
+from lib.context_cache import GeminiContextCache
 from lib.crawlers import GeminiSearchCrawler, OpenAISearchCrawler
-from lib.llm import OpenAICompatibleLLMModel
-from lib.models.llm import DeepResearchHyperParameters
+from lib.dedup import QueryRegistry
+from lib.journal import ResearchJournal
+from lib.llm import GeminiLLMModel, OpenAICompatibleLLMModel
+from lib.log import setup_logging
+from lib.metrics import ResearchMetrics
 from lib.researcher import DeepResearcher
+from lib.tracing import ResearchTracer
+from lib.types import ModelProvider, ResearchStage
 
 
 def main():
+    # Debug records are written by a background thread, capped per record
+    # and rotated at 50 MB
+    setup_logging(
+        asynchronous=True,
+        max_message_chars=4_000,
+        max_bytes=50 * 2**20,
+        backup_count=5,
+    )
     load_dotenv(".env.local")
 
     openai_client = OpenAI()
+    gemini_client = Client(api_key=getenv("GEMINI_API_KEY"))
+    analytics_instance = LLMAnalytics()
+    # Context shared by Gemini requests is cached until the run ends
+    context_cache = GeminiContextCache(
+        gemini_client, analytics_instance=analytics_instance
+    )
+    # Short, high-volume SERP query generation runs on a small model
+    query_llm_model = GeminiLLMModel(
+        llm_identifier=LLMIdentifier.GEMINI_2_0_FLASH_LITE,
+        llm_instance=gemini_client,
+        context_cache=context_cache,
+    )
+    metrics_instance = ResearchMetrics()
+    # Best-first research within a dollar budget and/or deadline
+    max_cost_dollars = getenv("MAX_COST_DOLLARS")
+    deadline_s = getenv("DEADLINE_S")
     researcher = DeepResearcher(
         crawler=GeminiSearchCrawler(
             llm_identifier=LLMIdentifier.GEMINI_2_0_FLASH,
-            llm_instance=Client(api_key=getenv("GEMINI_API_KEY")),
+            llm_instance=gemini_client,
+            context_cache=context_cache,
         ),
         llm_model=OpenAICompatibleLLMModel(
             llm_identifier=LLMIdentifier.GPT_4O, llm_instance=openai_client
         ),
-        analytics_instance=LLMAnalytics(),
+        stage_llm_models={
+            ResearchStage.QUERY_REFINEMENT: query_llm_model,
+            ResearchStage.SERP_QUERIES: query_llm_model,
+        },
+        analytics_instance=analytics_instance,
         research_parameters=DeepResearchHyperParameters(
             num_learnings=5,
             num_refinement_questions=3,
             learning_depth=5,
             learning_width=3,
         ),
+        concurrency_parameters=DeepResearchConcurrencyParameters(
+            max_workers=8,
+            max_in_flight_per_provider={
+                ModelProvider.OPENAI: 4,
+                ModelProvider.GOOGLE: 4,
+            },
+        ),
+        token_budget_parameters=DeepResearchTokenBudgetParameters(
+            context_window_fraction=0.5
+        ),
+        report_mode="hierarchical",
+        # Ancestor learnings lead the SERP query prompts of a branch, so they
+        # can be cached
+        prompt_layout="prefix_cache",
+        query_registry=QueryRegistry(similarity_threshold=0.6),
+        journal=ResearchJournal("./assets/journal.jsonl"),
+        metrics_instance=metrics_instance,
+        tracer=(
+            ResearchTracer("./assets/trace.jsonl")
+            if "--trace" in argv[1:]
+            else None
+        ),
+        scheduler_parameters=(
+            DeepResearchSchedulerParameters(
+                max_cost_dollars=(
+                    float(max_cost_dollars) if max_cost_dollars else None
+                ),
+                deadline_s=float(deadline_s) if deadline_s else None,
+            )
+            if max_cost_dollars or deadline_s
+            else None
+        ),
     )
 
     with open("./assets/query.md", "r", encoding="utf-8") as file_handle:
         user_query = file_handle.read().strip()
 
-    learnings, report = researcher(
-        user_query=user_query,
-        auto_query_refinement=True,
-    )
+    with (
+        context_cache,
+        open("./assets/report.md", "w", encoding="utf-8") as report_file,
+    ):
+
+        def write_report_chunk(chunk: str) -> None:
+            report_file.write(chunk)
+            report_file.flush()
+            print(chunk, end="", flush=True)
+
+        learnings, _ = researcher(
+            user_query=user_query,
+            auto_query_refinement=True,
+            # Continue an interrupted run from its journal
+            resume="--resume" in argv[1:],
+            on_report_chunk=write_report_chunk,
+        )
 
     with open("./assets/learnings.md", "w", encoding="utf-8") as f:
         f.write("\n\n".join(learnings))
 
-    with open("./assets/report.md", "w", encoding="utf-8") as f:
-        f.write(report)
+    metrics_instance.write_json("./assets/metrics.json")
 
 
 if __name__ == "__main__":